@@ -18,6 +18,7 @@ from AlLoRa.Digital_Endpoint import Digital_Endpoint
 connector     = SX127x_connector()
 # Source for metrics uploads
 lora_source   = Source(connector, config_file="LoRa_S.json")
+lora_source.set_pending(0)    # Each file is sent as it comes, none waits after it: the Gateway stops polling once it is sent
 chunk_size    = lora_source.chunk_size
 # Requester for downlink commands
 lora_req      = Requester(connector, config_file="LoRa_S.json")
@@ -62,7 +63,7 @@ def handle_uart_from_rpi():
         block = partial_rpi[s:e].decode("utf-8","ignore")
         json_text = block.replace("<RPI_METRICS>","").replace("</RPI_METRICS>","")
         print("\n📡 RPI METRICS:\n", json_text)
-        f = CTP_File("metrics_Rpi.json", json_text.encode(), chunk_size)
+        f = CTP_File("metrics_Rpi.json", json_text.encode(), chunk_size, compression=True)
         lora_source.set_file(f); lora_source.send_file()
         partial_rpi = partial_rpi[e:]
 
@@ -73,7 +74,7 @@ def handle_uart_from_rpi():
         block = partial_rpi[s:e].decode("utf-8","ignore")
         json_text = block.replace("<CMD_RESPONSE>","").replace("</CMD_RESPONSE>","")
         print("\n📥 RPI CMD RESPONSE:\n", json_text)
-        f = CTP_File("response_Rpi.json", json_text.encode(), chunk_size)
+        f = CTP_File("response_Rpi.json", json_text.encode(), chunk_size, compression=True)
         lora_source.set_file(f); lora_source.send_file()
         partial_rpi = partial_rpi[e:]
 
@@ -90,7 +91,7 @@ def handle_uart_from_lily():
         print(f"\n🤖 LILYGO METRICS:\n{text}")
         # wrap in minimal JSON
         json_text = '{"metrics":"' + text + '"}'
-        f = CTP_File("metrics_LilyGo.json", json_text.encode(), chunk_size)
+        f = CTP_File("metrics_LilyGo.json", json_text.encode(), chunk_size, compression=True)
         lora_source.set_file(f); lora_source.send_file()
     partial_lily = parts[-1]
 
@@ -0,0 +1,185 @@
+import asyncio
+import struct
+
+from AlLoRa.Packet import Packet
+from AlLoRa.Connectors.Serial_connector import Serial_connector
+from AlLoRa.utils.serial_frame_utils import pack_rf_config, SEND_WAIT, SEND, LISTEN, SET_RFC, GET_RFC, STATUS, OK
+from AlLoRa.utils.time_utils import current_time_ms as time
+from AlLoRa.utils.debug_utils import print
+
+
+class Async_Serial_connector(Serial_connector):
+    """
+    Serial_connector for asyncio (CPython only, with Async_Requester or
+    Async_Gateway). The serial port is read without blocking when the event
+    loop reports it readable (loop.add_reader on its file descriptor), so
+    waiting for the interface costs no thread and no polling. The methods
+    that talk to the interface are coroutines, the rest is Serial_connector.
+    With binary framing the answers are handed to the commands in flight by
+    their seq, so other tasks can send queries while a radio command waits.
+    """
+
+    def __init__(self, reset_function=None):
+        super().__init__(reset_function)
+        self.data_event = None
+        self.watching = False       # The event loop watches the port
+
+    def config(self, config_json):
+        super().config(config_json)
+        if self.config_parameters:
+            self.serial.timeout = 0     # read() returns what is there, never blocks
+
+    # The event loop reads the port, no reader thread
+    def start_reader(self):
+        pass
+
+    def stop_reader(self):
+        pass
+
+    def start_reading(self):
+        if self.data_event is None:
+            self.data_event = asyncio.Event()
+            self.radio_lock = asyncio.Lock()
+        if not self.watching:
+            asyncio.get_running_loop().add_reader(self.serial.fileno(), self.on_readable)
+            self.watching = True
+
+    def stop_reading(self):
+        if self.watching:
+            asyncio.get_running_loop().remove_reader(self.serial.fileno())
+            self.watching = False
+
+    def on_readable(self):
+        data = self.serial.read(self.serial.in_waiting or 1)
+        if data:
+            self.bytes_received(data)
+            self.data_event.set()
+
+    async def serial_receive(self, focus_time, data=False, seq=None):
+        self.start_reading()
+        end_time = time() + focus_time * 1000
+        answers = self.pending[seq]
+        while not answers:
+            remaining = (end_time - time()) / 1000
+            if remaining <= 0:
+                if self.debug:
+                    print("Timeout waiting for response.")
+                return None
+            self.data_event.clear()
+            try:
+                await asyncio.wait_for(self.data_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        answer = answers.pop(0)
+        if seq is None:
+            return self.parse_text_message(answer, data)
+        return answer
+
+    async def send_command(self, opcode, payload=b"", text_payload=None):
+        seq, lock = await self.start_command(opcode)
+        try:
+            return await self.command_answer(seq, self.command(opcode, payload, text_payload, seq))
+        finally:
+            self.end_command(seq, lock)
+
+    async def start_command(self, opcode):
+        self.start_reading()
+        if self.negotiate:
+            # Blocking, only after the interface has been reset
+            async with self.radio_lock:
+                self.stop_reading()
+                self.serial.timeout = self.timeout
+                self.negotiate_framing()
+                self.serial.timeout = 0
+                self.ring.clear()
+                self.start_reading()
+        lock = self.command_lock(opcode)
+        if lock is not None:
+            await lock.acquire()
+        return self.open_command(), lock
+
+    async def command_answer(self, seq, command):
+        # Send command and wait for response
+        try:
+            self.serial.write(command)
+            # Wait for ack response
+            response = await self.serial_receive(self.timeout, seq=seq)
+            if response is None:  # Check if no response was received
+                if self.debug:
+                    print("No response received (timeout).")
+                raise Exception("No ACK received")
+            self.attempt_count = 0
+            return response
+        except Exception as e:
+            self.command_failed(e)
+            return None
+
+    async def send_and_wait_response(self, packet: Packet):
+        content = packet.get_content()
+        packet_size_sent = len(content)
+
+        seq, lock = await self.start_command(SEND_WAIT)
+        try:
+            response = await self.command_answer(seq, self.command(SEND_WAIT, content, seq=seq))
+            if not response:
+                return {
+                    "type": "SEND_ERROR",
+                    "message": "No ACK received from serial interface",
+                }, packet_size_sent, 0, 0
+
+            error = self.check_ack(response)
+            if error:
+                return error, packet_size_sent, 0, 0
+
+            # Wait for the actual response
+            t0 = time()
+            received_data = await self.serial_receive(self.adaptive_timeout, data=True, seq=seq)
+            td = (time() - t0) / 1000  # Calculate the time difference in seconds
+            return self.load_response(received_data, packet_size_sent, td, packet.get_destination())
+
+        except Exception as e:
+            return {
+                "type": "EXCEPTION",
+                "message": "Exception in serial send-and-wait: {}".format(e),
+            }, packet_size_sent, 0, 0
+        finally:
+            self.end_command(seq, lock)
+
+    async def send(self, packet: Packet):
+        ack_response = await self.send_command(SEND, packet.get_content())
+        if ack_response and ack_response[0] == OK:
+            return True
+        if self.debug:
+            print("Send command not acknowledged or error occurred.")
+        return False
+
+    async def recv(self, focus_time=12):
+        seq, lock = await self.start_command(LISTEN)
+        try:
+            ack_response = await self.command_answer(seq, self.command(LISTEN, struct.pack(">I", int(focus_time * 1000)),
+                                                                       str(focus_time).encode(), seq))
+            if ack_response and ack_response[0] == OK:
+                # Wait for the actual response, sent by the interface when its focus time ends
+                received_data = self.received_data(await self.serial_receive(focus_time + self.timeout, data=True,
+                                                                             seq=seq))
+                if self.debug:
+                    print("Received data: ", received_data)
+                return received_data
+            if self.debug:
+                print("Listen command not acknowledged or error occurred.")
+            return None
+        finally:
+            self.end_command(seq, lock)
+
+    async def change_rf_config(self, frequency=None, sf=None, bw=None, cr=None, tx_power=None, backup=True):
+        response = await self.send_command(SET_RFC, pack_rf_config(frequency, sf, bw, cr, tx_power),
+                                           self.rf_config_command(frequency, sf, bw, cr, tx_power))
+        return self.rf_config_changed(response, frequency, sf, bw, cr, tx_power)
+
+    async def get_rf_config(self, refresh=False):
+        if self.rf_config_cache and not refresh:
+            return list(self.rf_config_cache)    # Saves a GET_RFC round trip
+        return self.rf_config_received(await self.send_command(GET_RFC))
+
+    async def get_status(self):
+        return self.status_received(await self.send_command(STATUS))
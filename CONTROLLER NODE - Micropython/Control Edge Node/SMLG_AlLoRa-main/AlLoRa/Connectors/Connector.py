@@ -1,18 +1,21 @@
 from AlLoRa.Packet import Packet
 import gc
-from math import ceil
 from AlLoRa.utils.time_utils import get_time, current_time_ms as time, sleep, sleep_ms
 from AlLoRa.utils.debug_utils import print
 from AlLoRa.utils.os_utils import os
-from os import urandom
+from AlLoRa.utils.rtt_utils import RTTEstimator
+from AlLoRa.utils.airtime_utils import AirtimeLedger, toa
 
 class Connector:
     MAX_LENGTH_MESSAGE = 255
 
     def __init__(self):
         self.MAC = "00000000"
-        self.observed_min_timeout = float('inf')
+        self.rtt = RTTEstimator()       # Response timeouts per peer MAC
+        self.airtime = AirtimeLedger()  # Airtime sent per EU868 sub-band in the last hour
+        self.duty_cycle = False
         self.debug = False
+        self.rf_config_cache = None     # Last RF config known to be set on a remote radio (Serial/WiFi connectors)
 
     def config(self, config_json):
         # JSON Example:
@@ -23,7 +26,8 @@ class Connector:
         #     "mesh_mode": false,
         #     "debug": false,
         #     "min_timeout": 0.5,
-        #     "max_timeout": 6
+        #     "max_timeout": 6,
+        #     "duty_cycle": false
         # }
         self.config_parameters = config_json
         if self.config_parameters:
@@ -42,6 +46,8 @@ class Connector:
             self.min_timeout = self.config_parameters.get('min_timeout', 0.5)
             self.max_timeout = self.config_parameters.get('max_timeout', 6)
             self.timeout_delta = self.config_parameters.get('timeout_delta', 1)  # Delta for processing times
+            # Defer the transmissions that don't fit in the duty cycle of their sub-band
+            self.duty_cycle = self.config_parameters.get('duty_cycle', False)
         
             # Calculate initial adaptive timeouts
             self.update_timeouts()
@@ -65,37 +71,28 @@ class Connector:
         # Calculate the min and max timeouts based on the ToA for the current RF settings
         self.max_payload_size = self.get_max_payload_size()
         min_toa = self.calculate_toa(self.sf, self.bw, self.cr, self.max_payload_size)   # Max payload
+        self.response_toa = min_toa
         max_toa = min_toa * 2
         self.min_timeout = min_toa + self.timeout_delta # Convert ms to seconds
         self.max_timeout = max_toa + self.timeout_delta  # Convert ms to seconds and add delta for processing times
         if self.debug:
             print("Updated timeouts: Min: {} s, Max: {} s".format(self.min_timeout, self.max_timeout))
 
+    # ToA (s), from the table of the RF config (see airtime_utils)
     def calculate_toa(self, sf, bw, cr, payload_size):
+        t_air = toa(sf, bw, cr, payload_size)
         if self.debug:
-            print("TOA with SF:", sf, "BW:", bw, "CR:", cr, "Payload:", payload_size)
-        crc = 1  # CRC enabled
-        bw_hz = bw * 1000   # Convert bandwidth to Hz
-        t_symbol = (2 ** sf) / bw_hz    # Symbol duration
-        t_preamble = t_symbol * (8 + 4.25)  # Preamble duration
-        h = 0   # Implicit header disabled
-        de = 1 if (sf >= 11 and bw == 125) else 0   # Low data rate optimization enabled for SF11 and SF12 with 125kHz BW
-        cr_rate = cr / 4.0  # Coding rate
-        # Payload Symbol Calculation
-        payload_bits = 8 * payload_size - 4 * sf + 28 + 16 * (1 if crc else 0) - 20 * h
-        bits_per_symbol = 4 * (sf - 2 * de)
-        n_payload = 8 + max(0, int(ceil(payload_bits / bits_per_symbol) * (cr_rate + 4)))
-        
-        # Payload Duration
-        t_payload = t_symbol * n_payload
-        
-        # Total Time on Air
-        t_air = t_preamble + t_payload
-        if self.debug:
-            print("TOA:", t_air)
-        
+            print("TOA with SF:", sf, "BW:", bw, "CR:", cr, "Payload:", payload_size, "->", t_air)
         return t_air
 
+    # ToA (s) of size bytes with the RF config of the radio (cached for remote radios)
+    def packet_toa(self, size):
+        if self.rf_config_cache:
+            frequency, sf, bw, cr, tx_power = self.rf_config_cache
+        else:
+            sf, bw, cr = self.sf, self.bw, self.cr
+        return toa(sf, bw, cr, size)
+
     def backup_config(self):
         return self.config_parameters
 
@@ -108,24 +105,46 @@ class Connector:
     def send(self, packet: Packet):
         return None
 
+    # Sends a packet and records its airtime. With duty_cycle, waits first until it
+    # fits in the duty cycle of its sub-band instead of going over it.
+    def transmit(self, packet: Packet):
+        airtime = self.packet_toa(len(packet.get_content()))
+        if self.duty_cycle:
+            delay = self.airtime.delay(self.frequency, airtime, time())
+            if delay > 0:
+                if self.debug:
+                    print("Duty cycle: transmission deferred {} s".format(delay))
+                sleep(delay)
+        sent = self.send(packet)
+        if sent:
+            self.airtime.record(self.frequency, airtime, time())
+        return sent
+
     def recv(self, focus_time=12):
         return None
 
-    def increase_adaptive_timeout(self):
-        random_factor = int.from_bytes(urandom(2), "little") / 2**16
-        self.adaptive_timeout = min(self.adaptive_timeout * (1 + random_factor), self.max_timeout)
+    # Time to wait for a response from mac (see rtt_utils): at least the ToA of the
+    # largest response, at most max_timeout, which is also used before the first sample
+    def response_timeout(self, mac):
+        self.adaptive_timeout = self.rtt.timeout(mac, self.response_toa, self.response_toa,
+                                                 self.max_timeout, self.max_timeout)
+        return self.adaptive_timeout
+
+    # A response of size bytes from mac arrived td s after the request was sent
+    # (sent_size: td also holds the ToA of the request, of sent_size bytes)
+    def response_received(self, mac, td, size, sent_size=0):
+        toa = self.packet_toa(size) + (self.packet_toa(sent_size) if sent_size else 0)
+        self.rtt.sample(mac, td - toa)
+
+    def response_lost(self, mac):
+        self.rtt.lost(mac)
 
-    def decrease_adaptive_timeout(self, td):
-        smoothing_factor = 0.2
-        new_timeout = self.adaptive_timeout * (1 - smoothing_factor) + td * smoothing_factor
-        self.observed_min_timeout = min(self.observed_min_timeout, td)
-        self.adaptive_timeout = max(new_timeout, max(self.min_timeout, self.observed_min_timeout))
-    
     def send_and_wait_response(self, packet):
-        focus_time = self.adaptive_timeout
+        mac = packet.get_destination()
+        focus_time = self.response_timeout(mac)
         packet_size_sent = len(packet.get_content())
         try:
-            send_success = self.send(packet)
+            send_success = self.transmit(packet)
             if not send_success:
                 error_info = {
                     "type": "SEND_ERROR",
@@ -145,9 +164,9 @@ class Connector:
             }
             if self.debug:
                 print(error_info["message"])
-            self.increase_adaptive_timeout()
             return error_info, packet_size_sent, 0, 0
 
+        t_sent = time()
         while focus_time > 0:
             t0 = time()
             try:
@@ -176,7 +195,7 @@ class Connector:
                 }
                 if self.debug:
                     print(error_info["message"])
-                self.increase_adaptive_timeout()
+                self.response_lost(mac)
                 return error_info, packet_size_sent, packet_size_received, td
 
             response_packet = Packet(self.mesh_mode, self.short_mac)
@@ -185,8 +204,7 @@ class Connector:
             try:
                 if response_packet.load(received_data):
                     if response_packet.get_source() == packet.get_destination() and response_packet.get_destination() == self.get_mac():
-                        if len(received_data) > response_packet.HEADER_SIZE + 60:  # Hardcoded for only chunks
-                            self.decrease_adaptive_timeout(td)
+                        self.response_received(mac, (time() - t_sent) / 1000, len(received_data))
                         if response_packet.get_debug_hops():
                             response_packet.add_hop(self.name, self.get_rssi(), 0)
                         return response_packet, packet_size_sent, packet_size_received, td
@@ -214,9 +232,11 @@ class Connector:
                     print(error_info["message"])
                 return error_info, packet_size_sent, packet_size_received, td
 
-            focus_time = self.adaptive_timeout - td
-            if focus_time < self.min_timeout:
+            # Another packet (e.g. a copy overheard in mesh mode): wait for the rest of the timeout
+            focus_time = self.adaptive_timeout - (time() - t_sent) / 1000
+            if focus_time <= 0:
                 focus_time = self.min_timeout
+                self.response_lost(mac)
                 error_info = {
                     "type": "MIN_TIMEOUT_REACHED",
                     "message": "Minimum timeout reached, can't wait more",
@@ -247,9 +267,15 @@ class Connector:
             print('SIGNAL STRENGTH', percentage, '%')
         return percentage
 
-    def get_rf_config(self):
+    # refresh: read it from the radio even if it is cached (only for remote radios)
+    def get_rf_config(self, refresh=False):
         return [self.frequency, self.sf, self.bw, self.cr, self.tx_power]
 
+    # Keeps the RF config set with change_rf_config, or forgets it when some values are unknown
+    def cache_rf_config(self, frequency, sf, bw, cr, tx_power):
+        rf_params = [frequency, sf, bw, cr, tx_power]
+        self.rf_config_cache = None if None in rf_params else rf_params
+
     def change_rf_config(self, frequency=None, sf=None, bw=None, cr=None, tx_power=None, backup=True):
         if backup:
             self.backup_rf_config()
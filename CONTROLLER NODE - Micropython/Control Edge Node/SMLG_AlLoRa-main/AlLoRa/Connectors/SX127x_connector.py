@@ -44,7 +44,7 @@ class SX127x_connector(Connector):
             print("SEND_PACKET() || packet: {}".format(packet.get_content()))
         if packet.get_length() <= Connector.MAX_LENGTH_MESSAGE:
             try:
-                timeout = max(0.5, self.calculate_toa(self.sf, self.bw, self.cr, packet.get_length())*1.1)  # Seconds
+                timeout = max(0.5, self.packet_toa(packet.get_length())*1.1)  # Seconds
                 t0 = time.ticks_ms()
                 if self.sf == 12:
                     timeout *= 1.2
@@ -1,19 +1,40 @@
-import serial, struct
+import serial, struct, threading
 from time import sleep, time
 
 from AlLoRa.Packet import Packet
 from AlLoRa.Connectors.Connector import Connector
+from AlLoRa.utils.ring_buffer_utils import RingBuffer
+from AlLoRa.utils.serial_frame_utils import (encode_frame, decode_frame, pack_rf_config, unpack_rf_config,
+                                             unpack_status, FRAMING_VERSION, FRAMING_TIMEOUT, DELIMITER, TEXT_VERBS,
+                                             RADIO_COMMANDS, HELLO, SEND_WAIT, SEND, LISTEN, SET_RFC, GET_RFC, STATUS,
+                                             ACK, PACKET, OK, ERROR, RF_CONFIG, NO_DATA, STATUS_INFO)
 from AlLoRa.utils.debug_utils import print
 
 class Serial_connector(Connector):
     MAX_ATTEMPTS = 30  # Maximum attempts before resetting
     RESET_TIMEOUT = 60  # Timeout in seconds before allowing another reset
+    END_PHRASE = b"<<END>>\n"
 
     def __init__(self, reset_function=None):
         super().__init__()
         self.attempt_count = 0
         self.last_reset_time = 0
         self.reset_function = reset_function
+        self.binary = False     # Binary framing (serial_frame_utils) agreed with the interface
+        self.seq = 0            # Sequence number of the last binary command
+        self.negotiate = False  # Binary framing to be agreed again (the interface was reset)
+        # A background thread reads the port in bulk into a ring buffer, takes the
+        # complete messages out of it and hands them to the commands waiting for them.
+        # With binary framing they go to the command with their seq, so other threads
+        # can send queries (e.g. get_rf_config, get_status) while a radio command waits.
+        self.pending = {}                       # seq (None with text framing) -> answers received for that command
+        self.answers = threading.Condition()    # Guards pending and seq
+        self.radio_lock = threading.Lock()      # One radio command at a time (any command with text framing)
+        self.write_lock = threading.Lock()
+        self.ring = RingBuffer()                # Bytes read from the port, not in a complete message yet
+        self.ring_binary = False                # Framing of the bytes in the ring
+        self.reader = None
+        self.reading = False
 
     def config(self, config_json):  #max_timeout = 10
         # JSON Example:
@@ -25,23 +46,190 @@ class Serial_connector(Connector):
         #     "max_timeout": 6
         #     "serial_port": "/dev/ttyAMA3",
         #     "baud": 9600,
-        #     "timeout": 1
+        #     "timeout": 1,
+        #     "framing": "binary",
+        #     "max_baud": 921600
         # }
         super().config(config_json)
         if self.config_parameters:
             self.serial_port = self.config_parameters.get('serial_port', "/dev/ttyAMA3")
             self.baud = self.config_parameters.get('baud', 9600)
             self.timeout = self.config_parameters.get('timeout', 1)
+            self.framing = self.config_parameters.get('framing', "text")
+            self.max_baud = self.config_parameters.get('max_baud', self.baud)
             self.serial = serial.Serial(self.serial_port, self.baud, timeout=self.timeout)
             if self.debug:
-                print("Serial Connector configure: serial_port: {}, baud: {}, timeout: {}".format(self.serial_port, self.baud, self.timeout))
-    
-    def send_command(self, command):
+                print("Serial Connector configure: serial_port: {}, baud: {}, timeout: {}, framing: {}".format(self.serial_port, self.baud, self.timeout, self.framing))
+            if self.framing == "binary":
+                self.negotiate_framing()
+            else:
+                self.start_reader()
+
+    # Asks the interface for binary framing at up to max_baud with the text command
+    # BIN:<version>|BAUD:<baud>. The interface answers the same way with the baud it
+    # takes, and both switch. Interfaces without binary framing answer with an error,
+    # and the text protocol is kept. The reader thread is stopped meanwhile.
+    def negotiate_framing(self):
+        self.negotiate = False
+        self.stop_reader()
+        try:
+            return self.switch_framing()
+        finally:
+            self.start_reader()
+
+    def switch_framing(self):
+        self.use_text_framing()
+        self.serial.reset_input_buffer()
+        self.serial.write("BIN:{}|BAUD:{}".format(FRAMING_VERSION, self.max_baud).encode() + self.END_PHRASE)
+        response = self.read_message(self.END_PHRASE)
+        try:
+            fields = dict(field.split(b":", 1) for field in bytes(response).split(b"|"))
+            version = int(fields[b"BIN"])
+            baud = int(fields[b"BAUD"])
+        except Exception:
+            if self.debug:
+                print("Binary framing not supported by the interface: ", response)
+            return False
+        if version != FRAMING_VERSION:
+            return False
+
+        self.serial.flush()
+        self.serial.baudrate = baud
+        self.binary = True
+        self.seq = (self.seq + 1) & 0xFF
+        self.serial.write(self.command(HELLO, seq=self.seq))
+        response = self.read_message(DELIMITER)
+        if response is not None and self.parse_frame(response) == (self.seq, (OK, None)):
+            if self.debug:
+                print("Binary framing v{} at {} baud".format(version, baud))
+            return True
+        # The interface goes back to text framing at its baud when it gets no frame
+        self.use_text_framing()
+        sleep(FRAMING_TIMEOUT)
+        self.serial.reset_input_buffer()
+        if self.debug:
+            print("Binary framing failed at {} baud, using text framing".format(baud))
+        return False
+
+    def use_text_framing(self):
+        self.binary = False
+        if self.serial.baudrate != self.baud:
+            self.serial.baudrate = self.baud
+
+    def start_reader(self):
+        self.reading = True
+        self.reader = threading.Thread(target=self.read_answers)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def stop_reader(self):
+        self.reading = False
+        if self.reader is not None and self.reader is not threading.current_thread():
+            self.reader.join()
+        self.reader = None
+
+    # Background reader: blocks until the port has data (or its timeout, to see
+    # stop_reader) and then takes everything the port has in one read
+    def read_answers(self):
+        while self.reading:
+            try:
+                data = self.serial.read(1)
+                if data and self.serial.in_waiting:
+                    data += self.serial.read(self.serial.in_waiting)
+            except Exception as e:
+                if self.debug:
+                    print("Error reading from the serial port: ", e)
+                sleep(self.timeout)
+                continue
+            if data:
+                self.bytes_received(data)
+
+    # Adds the bytes read to the ring and hands out the messages completed
+    def bytes_received(self, data):
+        if self.ring_binary != self.binary:
+            self.ring.clear()   # The framing changed, the rest was in the other one
+            self.ring_binary = self.binary
+        self.ring.write(data)
+        end_phrase = DELIMITER if self.binary else self.END_PHRASE
+        message = self.ring.next_message(end_phrase)
+        while message is not None:
+            self.message_received(message)
+            message = self.ring.next_message(end_phrase)
+
+    # A binary frame goes to the command with its seq, a text message to the open command
+    def message_received(self, message):
+        if not self.binary:
+            self.answer_received(None, message)
+            return
+        frame = self.parse_frame(message)
+        if frame is not None:
+            self.answer_received(*frame)
+
+    def answer_received(self, seq, answer):
+        with self.answers:
+            if seq in self.pending:
+                self.pending[seq].append(answer)
+                self.answers.notify_all()
+            elif self.debug:
+                print("Answer to a finished command dropped: ", seq, answer)
+
+    # Command in the framing in use. The binary payload of LISTEN and SET_RFC differs
+    # from the text one, text_payload gives the text one.
+    def command(self, opcode, payload=b"", text_payload=None, seq=None):
+        if self.binary:
+            return encode_frame(opcode, seq, payload)
+        return TEXT_VERBS[opcode] + (payload if text_payload is None else text_payload) + self.END_PHRASE
+
+    # Sends a command (see command) and returns the answer as (opcode, value), None if there is none
+    def send_command(self, opcode, payload=b"", text_payload=None):
+        seq, lock = self.start_command(opcode)
+        try:
+            return self.command_answer(seq, self.command(opcode, payload, text_payload, seq))
+        finally:
+            self.end_command(seq, lock)
+
+    # Takes the radio for a radio command (for any command with text framing, where
+    # only one answer can be waited for) and a seq for its answers with binary
+    # framing. Returns (seq, lock) for command_answer, serial_receive and end_command.
+    def start_command(self, opcode):
+        if self.negotiate:
+            with self.radio_lock:
+                if self.negotiate:
+                    self.negotiate_framing()
+        lock = self.command_lock(opcode)
+        if lock is not None:
+            lock.acquire()
+        return self.open_command(), lock
+
+    def command_lock(self, opcode):
+        if opcode in RADIO_COMMANDS or not self.binary:
+            return self.radio_lock
+        return None
+
+    def open_command(self):
+        with self.answers:
+            if self.binary:
+                self.seq = (self.seq + 1) & 0xFF
+                seq = self.seq
+            else:
+                seq = None
+            self.pending[seq] = []
+            return seq
+
+    def end_command(self, seq, lock):
+        with self.answers:
+            self.pending.pop(seq, None)
+        if lock is not None:
+            lock.release()
+
+    # Writes the command and returns its first answer, None if there is none
+    def command_answer(self, seq, command):
         # Send command and wait for response
         try:
-            self.serial.write(command)
+            with self.write_lock:
+                self.serial.write(command)
             # Wait for ack response
-            response = self.serial_receive(self.timeout)
+            response = self.serial_receive(self.timeout, seq=seq)
             if response is None:  # Check if no response was received
                 if self.debug:
                     print("No response received (timeout).")
@@ -50,38 +238,104 @@ class Serial_connector(Connector):
                 self.attempt_count = 0
             return response
         except Exception as e:
+            self.command_failed(e)
+            return None
+
+    def command_failed(self, e):
+        if self.debug:
+            print("Error sending command or no response: ", e)
+        self.attempt_count += 1
+        if self.debug:
+            print("Attempt count: ", self.attempt_count, "/", self.MAX_ATTEMPTS) 
+
+        self.rf_config_cache = None     # The interface may have been reset
+        if self.attempt_count >= self.MAX_ATTEMPTS:
+            self.attempt_reset()
+        else: # If the maximum attempts have not been reached
             if self.debug:
-                print("Error sending command or no response: ", e)
-            self.attempt_count += 1
-            if self.debug:
-                print("Attempt count: ", self.attempt_count, "/", self.MAX_ATTEMPTS) 
+                print("Max attempts not reached: ", self.attempt_count)
 
-            if self.attempt_count >= self.MAX_ATTEMPTS:
-                self.attempt_reset()
-            else: # If the maximum attempts have not been reached
-                if self.debug:
-                    print("Max attempts not reached: ", self.attempt_count)
+    # Next answer to the command with seq as (opcode, value) (see binary_answer),
+    # None if none arrives within focus_time. The reader thread wakes the wait as
+    # soon as the answer is there. With text framing (seq None) it is the next
+    # message, and data tells that a packet is expected (it can't be told from an
+    # answer by its content).
+    def serial_receive(self, focus_time, data=False, seq=None):
+        end_time = time() + focus_time
+        with self.answers:
+            answers = self.pending[seq]
+            while not answers:
+                remaining = end_time - time()
+                if remaining <= 0:
+                    if self.debug:
+                        print("Timeout waiting for response.")
+                    return None
+                self.answers.wait(remaining)
+            answer = answers.pop(0)
+        if seq is None:
+            return self.parse_text_message(answer, data)
+        return answer
+
+    # Next message read from the port by the caller (no reader thread running), without
+    # end_phrase, None if it doesn't arrive within the port timeout
+    def read_message(self, end_phrase):
+        message = self.serial.read_until(end_phrase)
+        if message.endswith(end_phrase):
+            return message[:-len(end_phrase)]
+        return None
 
+    # (seq, (opcode, value)) of a binary frame, None if it is corrupted
+    def parse_frame(self, message):
+        frame = decode_frame(message)
+        if frame is None:
+            if self.debug:
+                print("Corrupted frame dropped: ", message)
             return None
+        opcode, seq, payload = frame
+        return seq, self.binary_answer(opcode, payload)
 
-    def serial_receive(self, focus_time, end_phrase=b"<<END>>\n"):
-        start_time = time()
-        full_message = bytearray()  # Use a bytearray to accumulate the message
-        while True:
-            if time() - start_time > focus_time:
-                if self.debug:
-                    print("Timeout waiting for response.")
-                return None  # Return None to indicate a timeout occurred
-
-            line = self.serial.readline()  # Read a line; returns bytes
-            if line:
-                full_message += line  # Append this line to the full message
-                # Check if the end of this line signifies the end of the message
-                if full_message.endswith(end_phrase):
-                    # Remove the end phrase to return only the message content
-                    return full_message[:-len(end_phrase)]
-            else:
-                sleep(0.01)  # Small delay to avoid hogging the CPU
+    # (opcode, value) of an answer: ACK -> adaptive timeout (s), PACKET -> content,
+    # ERROR -> error dict, RF_CONFIG -> [frequency, sf, bw, cr, tx_power],
+    # STATUS_INFO -> status dict, OK and NO_DATA -> None.
+    def binary_answer(self, opcode, payload):
+        if opcode == ACK:
+            return ACK, struct.unpack(">I", payload)[0] / 1000
+        if opcode == ERROR:
+            return ERROR, self.parse_error_message(payload)
+        if opcode == RF_CONFIG:
+            return RF_CONFIG, unpack_rf_config(payload)
+        if opcode == PACKET:
+            return PACKET, payload
+        if opcode == STATUS_INFO:
+            return STATUS_INFO, unpack_status(payload)
+        return opcode, None
+
+    def parse_text_message(self, message, data):
+        if message.startswith(b"ERROR_TYPE:"):
+            return ERROR, self.parse_error_message(message)
+        if data:
+            if message in (b"No data", b"No response"):
+                return NO_DATA, None
+            return PACKET, message
+        if message.startswith(b"ACK:"):
+            # Extract adaptive timeout from the ACK
+            try:
+                return ACK, float(message.split(b"ACK:")[1])
+            except Exception as e:
+                return ERROR, {
+                    "type": "PARSE_ERROR",
+                    "message": "Failed to parse ACK: {}".format(e),
+                }
+        if message.startswith(b"OK"):
+            return OK, None
+        if message.startswith(b"FREQ:"):
+            return RF_CONFIG, self.parse_rf_config(message)
+        if message.startswith(b"BUSY:"):
+            return STATUS_INFO, self.parse_status(message)
+        return ERROR, {
+            "type": "INVALID_RESPONSE",
+            "message": "Unexpected response format: {}".format(message),
+        }
 
     def attempt_reset(self):
         if time() - self.last_reset_time > self.RESET_TIMEOUT:
@@ -90,6 +344,9 @@ class Serial_connector(Connector):
                     print("Resetting...")
                 self.reset_function()  # Call the passed-in reset function
                 self.attempt_count = 0
+                # The interface starts again with text framing at its baud
+                self.use_text_framing()
+                self.negotiate = self.framing == "binary"
                 self.last_reset_time = time()
             else:
                 if self.debug:
@@ -100,100 +357,130 @@ class Serial_connector(Connector):
 
     def send_and_wait_response(self, packet: Packet):
         content = packet.get_content()
-        command = b"S&W:" + content + b"<<END>>\n"  # Append the custom end phrase to the command
         packet_size_sent = len(content)
 
+        seq, lock = self.start_command(SEND_WAIT)
         try:
-            response = self.send_command(command)
+            response = self.command_answer(seq, self.command(SEND_WAIT, content, seq=seq))
             if not response:
                 return {
                     "type": "SEND_ERROR",
                     "message": "No ACK received from serial interface",
                 }, packet_size_sent, 0, 0
 
-            if self.debug:
-                print("ACK Response: ", response)
-
-            if response.startswith(b"ACK:"):
-                # Extract adaptive timeout from the ACK
-                try:
-                    ack_value = float(response.split(b"ACK:")[1])
-                    self.adaptive_timeout = ack_value + 0.5
-                except Exception as e:
-                    return {
-                        "type": "PARSE_ERROR",
-                        "message": "Failed to parse ACK: {}".format(e),
-                    }, packet_size_sent, 0, 0
-
-                # Wait for the actual response
-                focus_time = self.adaptive_timeout
-                t0 = time()
-                received_data = self.serial_receive(focus_time)
-                td = (time() - t0) / 1000  # Calculate the time difference in seconds
-                packet_size_received = len(received_data) if received_data else 0
+            error = self.check_ack(response)
+            if error:
+                return error, packet_size_sent, 0, 0
 
-                if received_data:
-                    if received_data.startswith(b"ERROR_TYPE:"):
-                        parsed_error = self.parse_error_message(received_data)
-                        return parsed_error, packet_size_sent, packet_size_received, td
-
-                    response_packet = Packet(self.mesh_mode, self.short_mac)
-                    if response_packet.load(received_data):
-                        return response_packet, packet_size_sent, packet_size_received, td
-                    else:
-                        return {
-                            "type": "CORRUPTED_PACKET",
-                            "message": "Failed to load packet: {}".format(received_data),
-                        }, packet_size_sent, packet_size_received, td
-
-                else:
-                    return {
-                        "type": "TIMEOUT",
-                        "message": "No data received within timeout",
-                    }, packet_size_sent, 0, td
-
-            else:
-                return {
-                    "type": "INVALID_ACK",
-                    "message": "Unexpected response format: {}".format(response),
-                }, packet_size_sent, 0, 0
+            # Wait for the actual response
+            focus_time = self.adaptive_timeout
+            t0 = time()
+            received_data = self.serial_receive(focus_time, data=True, seq=seq)
+            td = time() - t0  # Time waited for the response, in seconds
+            return self.load_response(received_data, packet_size_sent, td, packet.get_destination())
 
         except Exception as e:
             return {
                 "type": "EXCEPTION",
                 "message": "Exception in serial send-and-wait: {}".format(e),
             }, packet_size_sent, 0, 0
+        finally:
+            self.end_command(seq, lock)
+
+    # Takes the adaptive timeout from the ACK of a S&W command, returns an error dict if it is not an ACK
+    def check_ack(self, response):
+        if self.debug:
+            print("ACK Response: ", response)
+
+        opcode, value = response
+        if opcode == ACK:
+            self.adaptive_timeout = value + 0.5
+            return None
+        if opcode == ERROR:
+            return value
+        return {
+            "type": "INVALID_ACK",
+            "message": "Unexpected response format: {}".format(response),
+        }
+
+    # Result of send_and_wait_response for the message (or None) received after the ACK.
+    # The interface times the responses from mac for its own timeout (the one in the
+    # ACK); they are timed here too, from the ACK, for the estimates in the Node status.
+    def load_response(self, message, packet_size_sent, td, mac):
+        opcode, received_data = message if message else (NO_DATA, None)
+        if opcode == ERROR:
+            if received_data.get("ERROR_TYPE") == "TIMEOUT":
+                self.response_lost(mac)
+            return received_data, packet_size_sent, 0, td
+        packet_size_received = len(received_data) if received_data else 0
+
+        if received_data:
+            response_packet = Packet(self.mesh_mode, self.short_mac)
+            if response_packet.load(received_data):
+                self.response_received(mac, td, packet_size_received, packet_size_sent)
+                return response_packet, packet_size_sent, packet_size_received, td
+            else:
+                return {
+                    "type": "CORRUPTED_PACKET",
+                    "message": "Failed to load packet: {}".format(received_data),
+                }, packet_size_sent, packet_size_received, td
+
+        else:
+            self.response_lost(mac)
+            return {
+                "type": "TIMEOUT",
+                "message": "No data received within timeout",
+            }, packet_size_sent, 0, td
 
     def send(self, packet: Packet):
-        command = b"Send:" + packet.get_content() + b"<<END>>\n"  # Append the custom end phrase to the command
-        ack_response = self.send_command(command)  # Use send_command to transmit
-        if ack_response and b"OK" in ack_response:  # Check if the response contains "OK"
+        ack_response = self.send_command(SEND, packet.get_content())  # Use send_command to transmit
+        if ack_response and ack_response[0] == OK:
             return True
         else:
             if self.debug:
                 print("Send command not acknowledged or error occurred.")
             return False
 
+    # The radio is on the interface, which accounts its airtime
+    def transmit(self, packet: Packet):
+        return self.send(packet)
+
     def recv(self, focus_time=12):
-        command = b"Listen:" + str(focus_time).encode() + b"<<END>>\n"
-        ack_response = self.send_command(command)
-        if ack_response and b"OK" in ack_response:
-            # Wait for the actual response
-            received_data = self.serial_receive(focus_time)
-            if received_data:
-                if self.debug:
-                    print("Received data: ", received_data)
-                return received_data
+        seq, lock = self.start_command(LISTEN)
+        try:
+            ack_response = self.command_answer(seq, self.command(LISTEN, struct.pack(">I", int(focus_time * 1000)),
+                                                                 str(focus_time).encode(), seq))
+            if ack_response and ack_response[0] == OK:
+                # Wait for the actual response, sent by the interface when its focus time ends
+                received_data = self.received_data(self.serial_receive(focus_time + self.timeout, data=True, seq=seq))
+                if received_data:
+                    if self.debug:
+                        print("Received data: ", received_data)
+                    return received_data
+                else:
+                    if self.debug:
+                        print("No data received")
             else:
                 if self.debug:
-                    print("No data received")
-        else:
-            if self.debug:
-                print("Listen command not acknowledged or error occurred.")
+                    print("Listen command not acknowledged or error occurred.")
+            return None
+        finally:
+            self.end_command(seq, lock)
+
+    # Content of the packet received by recv, None if there is none
+    def received_data(self, message):
+        if message and message[0] == PACKET:
+            return message[1]
         return None
 
     def change_rf_config(self, frequency=None, sf=None, bw=None, cr=None, tx_power=None, backup=True):
-        command = b"C_RFC:"
+        response = self.send_command(SET_RFC, pack_rf_config(frequency, sf, bw, cr, tx_power),
+                                     self.rf_config_command(frequency, sf, bw, cr, tx_power))
+        return self.rf_config_changed(response, frequency, sf, bw, cr, tx_power)
+
+    # Text payload of SET_RFC
+    def rf_config_command(self, frequency, sf, bw, cr, tx_power):
+        command = b""
         if frequency:
             command += b"FREQ:" + str(frequency).encode() + b"|"
         if sf:
@@ -204,40 +491,69 @@ class Serial_connector(Connector):
             command += b"CR:" + str(cr).encode() + b"|"
         if tx_power:
             command += b"TX_POWER:" + str(tx_power).encode() + b"|"
-        command += b"<<END>>\n"
-        response = self.send_command(command)
-        if response and response.startswith(b"OK"):
+        return command
+
+    def rf_config_changed(self, response, frequency, sf, bw, cr, tx_power):
+        if response and response[0] == OK:
+            self.cache_rf_config(frequency, sf, bw, cr, tx_power)
             return True
         else:
+            self.rf_config_cache = None
             if self.debug:
                 print("Error changing RF config: {}".format(response))
 
-    def get_rf_config(self):
-        command = b"GET_RFC:<<END>>\n"
-        response = self.send_command(command)
-        # Example of expected response format: "FREQ:868000000|SF:12|BW:125|CR:4|TX_POWER:14|<<END>>\n"
-        if response and response.startswith(b"FREQ:"):
-            params = response.split(b"|")
-            # [frequency, sf, bw, cr, tx_power]
-            rf_params = []
-            for param in params:
-                key, value = param.split(b":")
-                decoded_key = key.decode("utf-8")
-                decoded_value = int(value.decode("utf-8"))
-                rf_params.append(decoded_value)
-            if len(rf_params) == 5:
-                if self.debug:
-                    print("RF Config: ", rf_params)
-                return rf_params
-            else:
-                if self.debug:
-                    print("Error getting RF config: ", response)
-                return []
-        else:
+    def get_rf_config(self, refresh=False):
+        if self.rf_config_cache and not refresh:
+            return list(self.rf_config_cache)    # Saves a GET_RFC round trip
+        return self.rf_config_received(self.send_command(GET_RFC))
+
+    def rf_config_received(self, response):
+        if response and response[0] == RF_CONFIG and len(response[1]) == 5:
             if self.debug:
-                print(f"Error getting RF config: {response.decode('utf-8', errors='ignore')}")
+                print("RF Config: ", response[1])
+            self.rf_config_cache = list(response[1])
+            return response[1]
+        if self.debug:
+            print("Error getting RF config: {}".format(response))
         return []
-            
+
+    def parse_rf_config(self, response):
+        # Example of expected response format: "FREQ:868000000|SF:12|BW:125|CR:4|TX_POWER:14|<<END>>\n"
+        # [frequency, sf, bw, cr, tx_power]
+        rf_params = []
+        try:
+            for param in response.split(b"|"):
+                if param:
+                    key, value = param.split(b":")
+                    rf_params.append(int(value.decode("utf-8")))
+        except Exception as e:
+            if self.debug:
+                print("Error parsing RF config: ", response, e)
+            return []
+        return rf_params
+
+    # Status of the interface: {"busy", "rssi", "snr", "adaptive_timeout"}, {} if it didn't answer.
+    # With binary framing it is answered while a radio command is in progress.
+    def get_status(self):
+        return self.status_received(self.send_command(STATUS))
+
+    def status_received(self, response):
+        if response and response[0] == STATUS_INFO:
+            return response[1]
+        if self.debug:
+            print("Error getting status: {}".format(response))
+        return {}
+
+    def parse_status(self, response):
+        # Example: "BUSY:0|RSSI:-87.0|SNR:9.5|TIMEOUT:1.68"
+        try:
+            fields = dict(field.split(b":", 1) for field in response.split(b"|"))
+            return {"busy": fields[b"BUSY"] == b"1", "rssi": float(fields[b"RSSI"]),
+                    "snr": float(fields[b"SNR"]), "adaptive_timeout": float(fields[b"TIMEOUT"])}
+        except Exception as e:
+            if self.debug:
+                print("Error parsing status: ", response, e)
+            return {}
 
     def parse_error_message(self, error_data):
         """
@@ -0,0 +1,152 @@
+import random
+from collections import deque
+
+from AlLoRa.Packet import Packet
+from AlLoRa.Connectors.Connector import Connector
+from AlLoRa.utils.time_utils import current_time_ms as time, sleep, get_clock
+from AlLoRa.utils.debug_utils import print
+
+
+class Air:
+    """
+    Shared in-process radio channel for Simulated_connector instances (CPython only).
+
+    - A transmission occupies the channel (frequency, SF, BW) for its time on air,
+      computed with Connector.packet_toa.
+    - Radios only hear transmissions on their own frequency, SF and BW.
+    - Overlapping transmissions on the same channel collide at the radios that
+      hear both of them (a link with loss < 1): far apart nodes can send at once.
+    - A radio misses everything sent while it is transmitting (half-duplex).
+    - Each link (sender MAC, receiver MAC) has its loss and corruption
+      probabilities and the RSSI/SNR reported by the receiver.
+
+    With a VirtualClock, set it (time_utils.set_clock) before creating the Air.
+    """
+
+    def __init__(self, seed=None, loss=0, corruption=0, rssi=-80, snr=8):
+        self.condition = get_clock().new_condition()
+        self.random = random.Random(seed)
+        self.radios = []
+        self.transmissions = []     # On the air right now
+        self.default_link = {"loss": loss, "corruption": corruption, "rssi": rssi, "snr": snr}
+        self.links = {}             # (sender MAC, receiver MAC) -> link parameters
+        self.stats = {"sent": 0, "delivered": 0, "lost": 0, "corrupted": 0,
+                      "collisions": 0, "half_duplex": 0, "airtime": 0}
+
+    def attach(self, radio):
+        self.radios.append(radio)
+
+    def set_link(self, sender, receiver, symmetric=True, **params):
+        link = dict(self.get_link(sender, receiver))
+        link.update(params)
+        self.links[(sender, receiver)] = link
+        if symmetric:
+            self.set_link(receiver, sender, False, **params)
+
+    def get_link(self, sender, receiver):
+        return self.links.get((sender, receiver), self.default_link)
+
+    def transmit(self, sender, data):
+        toa = sender.packet_toa(len(data))
+        channel = sender.get_channel()
+        with self.condition:
+            start = time()
+            transmission = {"sender": sender, "data": data, "channel": channel,
+                            "start": start, "end": start + toa * 1000, "overlaps": []}
+            for other in self.transmissions:
+                if other["channel"] == channel:
+                    other["overlaps"].append(sender)
+                    transmission["overlaps"].append(other["sender"])
+            self.transmissions.append(transmission)
+            sender.tx_start, sender.tx_end = transmission["start"], transmission["end"]
+            self.stats["sent"] += 1
+            self.stats["airtime"] += toa
+        sleep(toa)
+        with self.condition:
+            self.transmissions.remove(transmission)
+            for radio in self.radios:
+                if radio is not sender and radio.get_channel() == channel:
+                    self.deliver(transmission, radio)
+            self.condition.notify_all()
+        return toa
+
+    def deliver(self, transmission, radio):
+        sender = transmission["sender"]
+        for other in transmission["overlaps"]:
+            if other is not radio and self.get_link(other.get_mac(), radio.get_mac())["loss"] < 1:
+                self.stats["collisions"] += 1
+                return
+        if radio.tx_end > transmission["start"] and radio.tx_start < transmission["end"]:
+            self.stats["half_duplex"] += 1
+            return
+        link = self.get_link(sender.get_mac(), radio.get_mac())
+        if self.random.random() < link["loss"]:
+            self.stats["lost"] += 1
+            return
+        data = transmission["data"]
+        if self.random.random() < link["corruption"]:
+            data = bytearray(data)
+            data[self.random.randrange(len(data))] ^= 1 << self.random.randrange(8)
+            data = bytes(data)
+            self.stats["corrupted"] += 1
+        rssi = link["rssi"] + sender.tx_power - 14
+        radio.inbox.append((data, rssi, link["snr"]))
+        self.stats["delivered"] += 1
+
+
+class Simulated_connector(Connector):
+
+    def __init__(self, air: Air, mac, rx_buffer=1):
+        super().__init__()
+        self.air = air
+        self.MAC = mac[-8:]
+        self.inbox = deque((), rx_buffer)   # The radio FIFO keeps the latest packets only
+        self.frequency, self.sf, self.bw, self.cr, self.tx_power = 868, 7, 125, 1, 14    # Until config()
+        self.tx_start = self.tx_end = 0
+        self.rssi = 0
+        self.snr = 0
+        air.attach(self)
+
+    def get_channel(self):
+        return (self.frequency, self.sf, self.bw)
+
+    def send(self, packet: Packet):
+        data = bytes(packet.get_content())
+        if len(data) > Connector.MAX_LENGTH_MESSAGE:
+            if self.debug:
+                print("Error: Packet too big")
+            return False
+        toa = self.air.transmit(self, data)
+        if self.debug:
+            print("SEND_PACKET() || {} bytes, ToA {} s".format(len(data), toa))
+        return True
+
+    def recv(self, focus_time=12):
+        with self.air.condition:
+            if not self.inbox:
+                get_clock().wait_for(self.air.condition, lambda: self.inbox, focus_time)
+            if not self.inbox:
+                return None
+            data, self.rssi, self.snr = self.inbox.popleft()
+            return data
+
+    def get_rssi(self):
+        return self.rssi
+
+    def get_snr(self):
+        return self.snr
+
+    def set_frequency(self, frequency):
+        self.frequency = frequency
+
+    def set_sf(self, sf):
+        self.sf = sf
+
+    def set_bw(self, bw):
+        self.bw = bw
+
+    def set_cr(self, cr):
+        self.cr = cr
+
+    def set_transmission_power(self, tx_power):
+        self.tx_power = tx_power
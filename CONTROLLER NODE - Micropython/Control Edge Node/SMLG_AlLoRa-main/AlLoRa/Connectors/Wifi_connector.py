@@ -1,15 +1,34 @@
 import socket
-import select
+import struct
 
 from AlLoRa.Packet import Packet
 from AlLoRa.Connectors.Connector import Connector
 from AlLoRa.utils.debug_utils import print
 from AlLoRa.utils.json_utils import json
+from AlLoRa.utils.serial_frame_utils import (encode_frame, decode_frame, pack_rf_config, unpack_rf_config,
+                                             FRAMING_VERSION, DELIMITER, SEND_WAIT, SEND, LISTEN, SET_RFC, GET_RFC,
+                                             ACK, PACKET, OK, ERROR, RF_CONFIG)
 from AlLoRa.utils.time_utils import get_time, current_time_ms as time, sleep, sleep_ms
 
+UPGRADE = "allora-frames/{}".format(FRAMING_VERSION)   # Upgrade: token of the binary protocol
+
 class WiFi_connector(Connector):
+    """
+    Counterpart of the WiFi_Interface. The connection to the interface is kept
+    open (HTTP/1.1 keep-alive, every response framed by its Content-Length) and
+    its address is resolved once. With "protocol": "binary" the connection is
+    upgraded to the frames of serial_frame_utils, which carry the packet bytes
+    as they are instead of JSON; an interface that doesn't know them keeps HTTP.
+    """
+
     def __init__(self):
         super().__init__()
+        self.socket = None
+        self.address = None     # Address of the interface, resolved once
+        self.buffer = b""       # Bytes received and not read yet
+        self.answered = False   # Something was received for the current command
+        self.binary = False     # The connection carries frames
+        self.seq = 0
 
     def config(self, config_json):
         super().config(config_json)
@@ -19,106 +38,303 @@ class WiFi_connector(Connector):
             self.SOCKET_TIMEOUT = self.config_parameters.get('socket_timeout', 20)  # Increased timeout
             self.SOCKET_RECV_SIZE = self.config_parameters.get('socket_recv_size', 10000)
             self.PACKET_RETRY_SLEEP = self.config_parameters.get('packet_retry_sleep', 0.5)
+            self.protocol = self.config_parameters.get('protocol', "http")     # "http" or "binary"
             if self.debug:
-                print("Serial Connector configure: requester_api_host: {}, requester_api_port: {}, socket_timeout: {}, socket_recv_size: {}, packet_retry_sleep: {}".format(self.REQUESTER_API_HOST, 
-                self.REQUESTER_API_PORT, self.SOCKET_TIMEOUT, self.SOCKET_RECV_SIZE, self.PACKET_RETRY_SLEEP))
+                print("WiFi Connector configure: requester_api_host: {}, requester_api_port: {}, socket_timeout: {}, socket_recv_size: {}, packet_retry_sleep: {}, protocol: {}".format(self.REQUESTER_API_HOST, 
+                self.REQUESTER_API_PORT, self.SOCKET_TIMEOUT, self.SOCKET_RECV_SIZE, self.PACKET_RETRY_SLEEP, self.protocol))
+
+    def connect(self):
+        if self.address is None:
+            self.address = socket.getaddrinfo(self.REQUESTER_API_HOST, self.REQUESTER_API_PORT)[0][-1]
+        self.socket = socket.socket()
+        self.socket.settimeout(self.SOCKET_TIMEOUT)
+        self.socket.connect(self.address)
+        self.buffer = b""
+        self.binary = False
+        if self.protocol == "binary":
+            try:
+                self.binary = self.upgrade()
+            except Exception as e:
+                if self.debug:
+                    print("Upgrade failed: ", e)
+            if not self.binary:
+                if self.debug:
+                    print("The interface doesn't take frames, using HTTP")
+                self.protocol = "http"
+                self.disconnect()
+                self.connect()
+
+    def disconnect(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except Exception:
+                pass
+        self.socket = None
+
+    def upgrade(self):
+        self.socket.sendall(("GET /frames HTTP/1.1\r\nHost: {}\r\nConnection: Upgrade\r\nUpgrade: {}\r\n"
+                             "Content-Length: 0\r\n\r\n").format(self.REQUESTER_API_HOST, UPGRADE).encode())
+        status, headers, body = self.read_response()
+        return status == 101 and headers.get("upgrade") == UPGRADE
+
+    # Runs exchange() on the connection, opening it if needed. The interface may have
+    # closed a connection kept open: it is opened again and the exchange repeated if
+    # nothing had been received. None if it fails.
+    def run(self, exchange):
+        for attempt in range(2):
+            reused = self.socket is not None
+            self.answered = False
+            try:
+                if not reused:
+                    self.connect()
+                return exchange()
+            except Exception as e:
+                self.disconnect()   # The stream can't be followed after an error
+                if self.debug:
+                    print("Error talking to the interface:", e)
+                if not reused or self.answered:
+                    return None
+        return None
+
+    def receive(self):
+        chunk = self.socket.recv(self.SOCKET_RECV_SIZE)
+        if not chunk:
+            raise OSError("Connection closed by the interface")
+        self.answered = True
+        self.buffer += chunk
+
+    def read_until(self, delimiter):
+        index = self.buffer.find(delimiter)
+        while index < 0:
+            self.receive()
+            index = self.buffer.find(delimiter)
+        index += len(delimiter)
+        data, self.buffer = self.buffer[:index], self.buffer[index:]
+        return data
+
+    def read_exactly(self, size):
+        while len(self.buffer) < size:
+            self.receive()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
 
-    def send_command(self, command):
+    def read_to_end(self):
         try:
-            s = socket.socket()
-            s.settimeout(self.SOCKET_TIMEOUT)
-            addr = socket.getaddrinfo(self.REQUESTER_API_HOST, self.REQUESTER_API_PORT)[0][-1]
-            s.connect(addr)
-            content = json.dumps(command)
-            httpreq = ("POST /command HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n"
-                    "Content-Type: application/json\r\nContent-Length: {}\r\n\r\n{}").format(
-                        self.REQUESTER_API_HOST, len(content), content
-                    )
-            s.send(httpreq.encode())
-
-            # Accumulate response in case it arrives in chunks
-            response = b""
             while True:
-                chunk = s.recv(self.SOCKET_RECV_SIZE)
-                if not chunk:
-                    break
-                response += chunk
+                self.receive()
+        except OSError:
+            pass
+        data, self.buffer = self.buffer, b""
+        self.disconnect()
+        return data
 
-            if response:
-                # Debug: Print the full raw response
-                if self.debug:
-                    print("Raw response received:", response.decode())
-
-                # Split the response into multiple HTTP parts
-                responses = response.decode().split("\r\n\r\n")
-                parsed_responses = []
-                for resp in responses[1:]:  # Skip the HTTP headers
-                    try:
-                        parsed_responses.append(json.loads(resp))
-                    except json.JSONDecodeError:
-                        continue
-
-                # Debug: Print parsed responses
-                if self.debug:
-                    print("Parsed responses:", parsed_responses)
+    # (status, headers with lowercase names, body) of the next HTTP response. Without
+    # Content-Length the body runs until the interface closes the connection.
+    def read_response(self):
+        lines = self.read_until(b"\r\n\r\n").decode().split("\r\n")
+        status = int(lines[0].split(" ")[1])
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        if "content-length" in headers:
+            body = self.read_exactly(int(headers["content-length"]))
+        elif status == 101:
+            body = b""
+        else:
+            body = self.read_to_end()
+        if headers.get("connection", "").lower() == "close":
+            self.disconnect()
+        return status, headers, body
 
-                # Return all parsed responses for further processing
-                return parsed_responses[0]
-            return None
-        except Exception as e:
-            if self.debug:
-                print("Error in send_command:", e)
-            return None
-        finally:
-            s.close()
+    # Sends a command and returns its first count JSON responses
+    def send_command(self, command, count=1):
+        return self.run(lambda: self.http_command(command, count))
+
+    def http_command(self, command, count):
+        content = json.dumps(command).encode()
+        self.socket.sendall(("POST /command HTTP/1.1\r\nHost: {}\r\nConnection: keep-alive\r\n"
+                             "Content-Type: application/json\r\nContent-Length: {}\r\n\r\n").format(
+                                 self.REQUESTER_API_HOST, len(content)).encode() + content)
+        responses = []
+        while len(responses) < count:
+            status, headers, body = self.read_response()
+            if "content-length" in headers:
+                responses.append(json.loads(body.decode()))
+                continue
+            # An interface without keep-alive writes all its responses and closes
+            parts = body.split(b"HTTP/1.1 ")
+            responses.append(json.loads(parts[0].decode()))
+            for part in parts[1:]:
+                responses.append(json.loads(part.split(b"\r\n\r\n", 1)[1].decode()))
+            break
+        if self.debug:
+            print("Responses:", responses)
+        return responses
+
+    # Sends a frame and returns the answers to it as (opcode, payload): count of them, or up to an ERROR
+    def frame_command(self, opcode, payload=b"", count=1):
+        return self.run(lambda: self.binary_command(opcode, payload, count))
+
+    def binary_command(self, opcode, payload, count):
+        self.seq = (self.seq + 1) & 0xFF
+        self.socket.sendall(encode_frame(opcode, self.seq, payload))
+        answers = []
+        while len(answers) < count:
+            frame = decode_frame(self.read_until(DELIMITER)[:-1])
+            if frame is None:
+                raise ValueError("Corrupted frame")
+            answer, seq, answer_payload = frame
+            if seq != self.seq:
+                continue    # Late answer to a command that failed
+            answers.append((answer, answer_payload))
+            if answer == ERROR:
+                break
+        return answers
+
+    # The protocol of the connection, connecting first so a failed upgrade is known
+    def use_frames(self):
+        if self.socket is None and self.protocol == "binary":
+            try:
+                self.connect()
+            except Exception as e:
+                if self.debug:
+                    print("Error connecting to the interface:", e)
+                self.disconnect()
+        return self.protocol == "binary"
 
     def send(self, packet: Packet):
+        if self.use_frames():
+            answers = self.frame_command(SEND, packet.get_content())
+            return bool(answers) and answers[0][0] == OK
         command = {"command": "Send", "data": packet.get_content().decode()}
-        response = self.send_command(command)
-        return response and response.get("ACK") == "OK"
+        responses = self.send_command(command)
+        return bool(responses) and responses[0].get("ACK") == "OK"
+
+    # The radio is on the interface, which accounts its airtime
+    def transmit(self, packet: Packet):
+        return self.send(packet)
 
     def send_and_wait_response(self, packet: Packet):
-        command = {"command": "S&W", "data": packet.get_content().decode()}
         packet_size_sent = len(packet.get_content())
-        responses = self.send_command(command)
-      
+        t0 = time()
+        frames = self.use_frames()
+        if frames:
+            answers = self.frame_command(SEND_WAIT, packet.get_content(), 2)
+            data = None
+            if answers and answers[0][0] == ACK:
+                self.adaptive_timeout = struct.unpack(">I", answers[0][1])[0] / 1000
+            if answers and answers[-1][0] == PACKET:
+                data = answers[-1][1]
+            elif answers and answers[-1][0] == ERROR:
+                return self.parse_error(answers[-1][1]), packet_size_sent, 0, (time() - t0) / 1000
+        else:
+            responses = self.send_command({"command": "S&W", "data": packet.get_content().decode()}, 2)
+            data = None
+            if responses:
+                self.adaptive_timeout = responses[0].get("ACK", self.adaptive_timeout)
+            if responses and len(responses) > 1 and "error" not in responses[-1]:
+                data = responses[-1]
+            elif responses and len(responses) > 1:
+                error = responses[-1]["error"]
+                if not isinstance(error, dict):
+                    error = {"type": "INTERFACE_ERROR", "message": str(error)}
+                return error, packet_size_sent, 0, (time() - t0) / 1000
+        td = (time() - t0) / 1000
+        if data is None:
+            return {"type": "TIMEOUT", "message": "No response received"}, packet_size_sent, 0, td
+
+        response_packet = Packet(self.mesh_mode, self.short_mac)
         try:
-            response_packet = Packet(self.mesh_mode, self.short_mac)
-            try:
-                response_packet.load_dict(responses)
-                return response_packet, packet_size_sent, len(response_packet.get_content()), self.adaptive_timeout
-            except Exception as e:
-                return {"type": "LOAD_ERROR", "message": str(e)}, packet_size_sent, 0, self.adaptive_timeout
-            
-            return {"type": "TIMEOUT", "message": "No response received"}, packet_size_sent, 0, self.adaptive_timeout
+            loaded = response_packet.load(data) if frames else response_packet.load_dict(data)
         except Exception as e:
-            print("Error in send_and_wait_response:", e)
+            return {"type": "LOAD_ERROR", "message": str(e)}, packet_size_sent, 0, td
+        if not loaded:
+            return {"type": "CORRUPTED_PACKET", "message": "{}".format(data)}, packet_size_sent, 0, td
+        return response_packet, packet_size_sent, len(response_packet.get_content()), td
+
+    def recv(self, focus_time=12):
+        if self.use_frames():
+            answers = self.run_with_timeout(focus_time, lambda: self.binary_command(
+                LISTEN, struct.pack(">I", int(focus_time * 1000)), 2))
+            if answers and answers[-1][0] == PACKET:
+                return answers[-1][1]
+            return None
+        responses = self.run_with_timeout(focus_time, lambda: self.http_command(
+            {"command": "Listen", "data": {"focus_time": focus_time}}, 2))
+        if responses and "response" in responses[-1]:
+            packet = Packet(self.mesh_mode, self.short_mac)
+            if packet.load_dict(responses[-1]["response"]):
+                return packet.get_content()
+        return None
+
+    # run() with the socket timeout extended by focus_time s, for commands that listen
+    def run_with_timeout(self, focus_time, exchange):
+        def extended():
+            self.socket.settimeout(self.SOCKET_TIMEOUT + focus_time)
+            try:
+                return exchange()
+            finally:
+                if self.socket is not None:
+                    self.socket.settimeout(self.SOCKET_TIMEOUT)
+        return self.run(extended)
 
     def change_rf_config(self, frequency=None, sf=None, bw=None, cr=None, tx_power=None):
-        command = {
-            "command": "CHANGE_RF_CONFIG",
-            "params": {"frequency": frequency, "sf": sf, "bw": bw, "cr": cr, "tx_power": tx_power}
-        }
-        response = self.send_command(command)
-        if response and response.get("ACK") == "OK":
-            self.update_rf_params(response.get("params", {}))
+        if self.use_frames():
+            answers = self.frame_command(SET_RFC, pack_rf_config(frequency, sf, bw, cr, tx_power))
+            success = bool(answers) and answers[0][0] == OK
+            if success:
+                requested = {"frequency": frequency, "sf": sf, "bw": bw, "cr": cr, "tx_power": tx_power}
+                self.update_rf_params(dict((key, value) for key, value in requested.items() if value is not None))
+        else:
+            command = {
+                "command": "CHANGE_RF_CONFIG",
+                "params": {"frequency": frequency, "sf": sf, "bw": bw, "cr": cr, "tx_power": tx_power}
+            }
+            responses = self.send_command(command)
+            response = responses[0] if responses else None
+            success = bool(response) and response.get("ACK") == "OK"
+            if success:
+                self.update_rf_params(response.get("params", {}))
+        if success:
+            self.cache_rf_config(frequency, sf, bw, cr, tx_power)
             return True
+        self.rf_config_cache = None
         return False
 
-    def get_rf_config(self):
-        command = {"command": "GET_RFC"}
-        response = self.send_command(command)
-
-        if response and all(key in response for key in ["FREQ", "SF", "BW", "CR", "TX_POWER"]):
-            return [
-                response["FREQ"],
-                response["SF"],
-                response["BW"],
-                response["CR"],
-                response["TX_POWER"]
-            ]
+    def get_rf_config(self, refresh=False):
+        if self.rf_config_cache and not refresh:
+            return list(self.rf_config_cache)    # Saves a GET_RFC round trip
+        if self.use_frames():
+            answers = self.frame_command(GET_RFC)
+            if answers and answers[0][0] == RF_CONFIG:
+                self.rf_config_cache = unpack_rf_config(answers[0][1])
+                return list(self.rf_config_cache)
+            response = answers
+        else:
+            responses = self.send_command({"command": "GET_RFC"})
+            response = responses[0] if responses else None
+            if response and all(key in response for key in ["FREQ", "SF", "BW", "CR", "TX_POWER"]):
+                self.rf_config_cache = [
+                    response["FREQ"],
+                    response["SF"],
+                    response["BW"],
+                    response["CR"],
+                    response["TX_POWER"]
+                ]
+                return list(self.rf_config_cache)
 
         # Log error for unexpected response
         if self.debug:
             print("Invalid RF config response: {}".format(response))
-        return []
\ No newline at end of file
+        return []
+
+    # {"type", "message"} of an ERROR frame (ERROR_TYPE:<type>|MESSAGE:<message>)
+    def parse_error(self, payload):
+        fields = {}
+        for field in payload.decode().split("|"):
+            key, _, value = field.partition(":")
+            fields[key] = value
+        return {"type": fields.get("ERROR_TYPE", "INTERFACE_ERROR"), "message": fields.get("MESSAGE", "")}
@@ -1,19 +1,21 @@
 from AlLoRa.File import CTP_File
-import time
-from AlLoRa.utils.time_utils import get_time
+from AlLoRa.utils.time_utils import get_time, current_time_ms
 from AlLoRa.utils.debug_utils import print
+from AlLoRa.utils.os_utils import os
+from AlLoRa.utils.json_utils import json
 
 class Digital_Endpoint:
 
     REQUEST_DATA_STATE = "REQUEST_DATA_STATE"
     PROCESS_CHUNK_STATE = "PROCESS_CHUNK_STATE"
     OK = "OK"
+    LINK_FILE = "link.json"     # Link state, in the folder of the endpoint's files
 
     def __init__(self, config=None, name="N", mac_address="da5a08dc", active=True, 
                  sleep_mesh=True, asking_frequency=60, listening_time=30, 
                  MAX_RETRANSMISSIONS_BEFORE_MESH=10, lock_on_file_receive=False,
-                 max_listen_time_when_locked=300,
-                 debug=False):
+                 max_listen_time_when_locked=300, window_size=None,
+                 fec_repair_chunks=0, asking_jitter=0, deadline=None, backlog_frequency=None, debug=False):
         """
         Initializes a new Digital Endpoint with detailed control over its operational parameters.
 
@@ -27,6 +29,11 @@ class Digital_Endpoint:
         - listening_time: Time in seconds the gateway should focus on this endpoint when checking.
         - MAX_RETRANSMISSIONS_BEFORE_MESH: Maximum retransmissions before enabling mesh mode.
         - lock_on_file_receive: If True, the gateway locks on this node until a complete file is received or a timeout occurs.
+        - window_size: Maximum chunks asked per request in windowed transfers (None -> use the Requester's window_size).
+        - fec_repair_chunks: Reed-Solomon repair chunks asked to the Source for each file (0 -> no FEC).
+        - asking_jitter: Up to this many seconds are randomly added to each check time, so endpoints with the same asking_frequency drift apart.
+        - deadline: Seconds after its due time by which a check should start (None -> asking_frequency). Due endpoints are checked earliest deadline first.
+        - backlog_frequency: Seconds to the next check when the Source announced more files waiting (None -> asking_frequency).
         """
         if config:
             self.name = config.get('name', name)
@@ -43,6 +50,11 @@ class Digital_Endpoint:
             self.bw = config.get('bw', 125)
             self.cr = config.get('cr', 1)
             self.tx_power = config.get('tx_power', 14)
+            self.window_size = config.get('window_size', window_size)
+            self.fec_repair_chunks = config.get('fec_repair_chunks', fec_repair_chunks)
+            self.asking_jitter = config.get('asking_jitter', asking_jitter)
+            self.deadline = config.get('deadline', deadline)
+            self.backlog_frequency = config.get('backlog_frequency', backlog_frequency)
         else:
             self.name = name
             self.mac_address = mac_address[-8:]
@@ -58,9 +70,15 @@ class Digital_Endpoint:
             self.bw = 125
             self.cr = 1
             self.tx_power = 14
+            self.window_size = window_size
+            self.fec_repair_chunks = fec_repair_chunks
+            self.asking_jitter = asking_jitter
+            self.deadline = deadline
+            self.backlog_frequency = backlog_frequency
 
         self.state = Digital_Endpoint.OK
         self.current_file = None
+        self.resume_file = None  # Partially received file from a previous run, resumed if the Source announces it again
         self.file_reception_info = {
             "last_file_name": None,
             "last_file_size": None,
@@ -68,12 +86,26 @@ class Digital_Endpoint:
             "current_receiving_file_name": None,
             "latest_chunk_index": None,
             "total_chunks": None,
-            "latest_chunk_reception_time": None
+            "latest_chunk_reception_time": None,
+            "pending_files": None,      # Files the Source announced waiting, None if it doesn't tell
+            "next_file_size": None
+        }
+        self.last_checked_time = current_time_ms() / 1000  # Track the last time this endpoint was checked.
+        self.schedule_info = {
+            "checks": 0,
+            "last_lateness": None,  # Seconds between the due time and the start of the last check
+            "mean_lateness": None,
+            "max_lateness": None,
+            "missed_deadlines": 0
         }
-        self.last_checked_time = time.time()  # Track the last time this endpoint was checked.
         self.current_chunk = None
+        self.pending = None     # (files, bytes of the next one) the Source announced waiting, None if unknown
+        # What the Requester learned of the link to this endpoint (see Requester.load_link), None before the first check
+        self.link = None
         self.mesh = False  # Mesh mode starts disabled
         self.retransmission_counter = 0  # Counter for retransmissions
+        self.window = 1  # Current window of the windowed transfers, adapted to the observed loss
+        self.window_loss = 0  # Smoothed fraction of chunks lost per window
         self.debug = debug
 
     def __repr__(self):
@@ -108,6 +140,42 @@ class Digital_Endpoint:
         if self.debug:
             print("Node {}: DISABLING MESH".format(self.name))
 
+    def get_rf_profile(self):
+        return (self.freq, self.sf, self.bw, self.cr, self.tx_power)
+
+    # Seconds to the next check: sooner if the Source has a backlog
+    def next_check(self):
+        if self.backlog_frequency is not None and self.pending is not None and self.pending[0] > 0:
+            return min(self.backlog_frequency, self.asking_frequency)
+        return self.asking_frequency
+
+    # The Source has nothing to send, the check can end
+    def is_idle(self):
+        return self.state == Digital_Endpoint.OK and self.pending is not None and self.pending[0] == 0
+
+    def set_pending(self, pending):
+        self.pending = pending
+        self.file_reception_info["pending_files"] = pending[0] if pending else None
+        self.file_reception_info["next_file_size"] = pending[1] if pending else None
+
+    def get_deadline(self):
+        return self.deadline if self.deadline is not None else self.asking_frequency
+
+    # Lateness of a check, in seconds, and whether it started after its deadline
+    def record_check(self, lateness, missed_deadline):
+        info = self.schedule_info
+        info["checks"] += 1
+        info["last_lateness"] = lateness
+        if info["mean_lateness"] is None:
+            info["mean_lateness"] = lateness
+            info["max_lateness"] = lateness
+        else:
+            info["mean_lateness"] += (lateness - info["mean_lateness"]) / info["checks"]
+            info["max_lateness"] = max(info["max_lateness"], lateness)
+        if missed_deadline:
+            info["missed_deadlines"] += 1
+        self.last_checked_time = current_time_ms() / 1000
+
     def get_sleep(self):
         return self.sleep_mesh
 
@@ -130,10 +198,68 @@ class Digital_Endpoint:
     def get_current_file(self):
         return self.current_file
 
-    def connected(self, ok, hop, mesh_mode):
+    def restore_file(self, path):
+        try:
+            names = os.listdir(path + "/Temp")
+        except Exception:
+            return None
+        for name in names:
+            if name.endswith(".state"):
+                file = CTP_File.restore(path + "/Temp/" + name, path)
+                if file:
+                    self.resume_file = file
+                    self.state = Digital_Endpoint.REQUEST_DATA_STATE    # An OK would tell the Source the file was received
+                    self.file_reception_info["current_receiving_file_name"] = file.name
+                    self.file_reception_info["total_chunks"] = file.length
+                    if self.debug:
+                        print("Node {}: FILE {} RESTORED, {} CHUNKS MISSING".format(self.name, file.name, file.missing_count()))
+                    return file
+        return None
+
+    def new_link(self):
+        self.link = {
+            "rf_profile": list(self.get_rf_profile()),  # The pacing is only valid for this profile
+            "rtt": None,        # {"srtt", "rttvar", "samples"} of the response times (see rtt_utils)
+            "pacing": None,     # Sleep between requests and the state of its adaptation
+            "loss": None,       # Smoothed fraction of failed requests
+            "rssi": None,       # Of the last response
+            "snr": None
+        }
+        return self.link
+
+    # Link state saved by save_link in path, so a restarted Requester starts with it
+    def restore_link(self, path):
+        try:
+            with open(path + "/" + self.LINK_FILE, "r") as f:
+                self.link = json.loads(f.read())
+        except Exception as e:
+            if self.debug:
+                print("Node {}: NO LINK STATE ({})".format(self.name, e))
+        return self.link
+
+    def save_link(self, path):
+        if self.link is None:
+            return
+        for folder in (path[:path.rfind("/")], path):
+            try:
+                os.mkdir(folder)
+            except Exception:
+                pass    # Already there
+        try:
+            with open(path + "/" + self.LINK_FILE, "w") as f:
+                f.write(json.dumps(self.link))
+        except Exception as e:
+            print("Error saving link state: ", e)
+
+    def connected(self, ok, hop, mesh_mode, pending=None):
         if ok:
             if mesh_mode:
                 self.reset_retransmission_counter(hop)
+            self.set_pending(pending)
+            if self.is_idle():
+                if self.debug:
+                    print("Node {}: NOTHING TO SEND".format(self.name))
+                return
             self.state = Digital_Endpoint.REQUEST_DATA_STATE
         else:
             if mesh_mode:
@@ -141,7 +267,18 @@ class Digital_Endpoint:
         
     def set_metadata(self, metadata, hop, mesh_mode, path=None):
         if metadata:
-            new_file = CTP_File(name=metadata[1], length=metadata[0], path=path)
+            options = metadata[2]
+            if self.resume_file and self.resume_file.matches(metadata[1], metadata[0], options):
+                new_file = self.resume_file
+                if self.debug:
+                    print("Node {}: RESUMING FILE {}".format(self.name, new_file.name))
+            else:
+                if self.resume_file:
+                    self.resume_file.discard()
+                new_file = CTP_File(name=metadata[1], length=metadata[0], path=path,
+                                    fec_repair_chunks=options.get("FEC", 0), last_chunk_size=options.get("LAST"),
+                                    compression=bool(options.get("COMPRESSION")))
+            self.resume_file = None
             self.set_current_file(new_file)
             self.file_reception_info["current_receiving_file_name"] = new_file.name
             self.file_reception_info["total_chunks"] = new_file.length
@@ -157,9 +294,9 @@ class Digital_Endpoint:
 
     def get_next_chunk(self):
         try:
-            missing_chunks = self.current_file.get_missing_chunks()
-            if missing_chunks:
-                self.current_chunk = missing_chunks[0]
+            next_chunks = self.current_file.get_next_chunks(1)
+            if next_chunks:
+                self.current_chunk = next_chunks[0]
                 return self.current_chunk
             return None
         except Exception as e:
@@ -167,12 +304,33 @@ class Digital_Endpoint:
                 print("Node {}: ERROR IN GET_NEXT_CHUNK: {}".format(self.name, e))
             return None
 
-    def set_data(self, data, hop, mesh_mode):
+    def get_next_chunks(self, count):
+        try:
+            return self.current_file.get_next_chunks(count)
+        except Exception as e:
+            if self.debug:
+                print("Node {}: ERROR IN GET_NEXT_CHUNKS: {}".format(self.name, e))
+            return []
+
+    def update_window(self, requested, received, max_window):
+        loss = 1 - received / requested
+        self.window_loss = self.window_loss * 0.75 + loss * 0.25
+        if loss == 0:
+            self.window = min(self.window + 1, max_window)
+        elif self.window_loss > 0.25:
+            self.window = max(1, self.window // 2)
+        if self.debug:
+            print("Node {}: WINDOW {} (loss {})".format(self.name, self.window, self.window_loss))
+
+    def set_data(self, data, hop, mesh_mode, order=None):
+        if order is None:
+            order = self.current_chunk
         if data:
-            self.current_file.add_chunk(self.current_chunk, data)
-            self.file_reception_info["latest_chunk_index"] = self.current_chunk
+            self.current_file.add_chunk(order, data)
+            self.file_reception_info["latest_chunk_index"] = order
             self.file_reception_info["latest_chunk_reception_time"] = get_time()
-            if len(self.current_file.get_missing_chunks()) == 0:  # All chunks received
+            if self.current_file.is_complete():  # All chunks received (or rebuilt with FEC)
+                self.current_file.remove_state()
                 self.file_reception_info["last_file_name"] = self.current_file.get_name()
                 self.file_reception_info["last_file_size"] = self.current_file.get_length()
                 self.file_reception_info["last_reception_hour"] = self.file_reception_info["latest_chunk_reception_time"]
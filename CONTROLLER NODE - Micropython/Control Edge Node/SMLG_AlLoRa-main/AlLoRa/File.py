@@ -1,8 +1,12 @@
 import gc
+import binascii
 from math import ceil
 from AlLoRa.utils.debug_utils import print
 from AlLoRa.utils.os_utils import os
 from AlLoRa.utils.time_utils import current_time_ms as time
+from AlLoRa.utils import fec_utils, compression_utils
+from AlLoRa.utils.bitmap_utils import Bitmap
+from AlLoRa.utils.json_utils import json
 
 # try:
 #     from utime import ticks_ms as time
@@ -13,30 +17,86 @@ from AlLoRa.utils.time_utils import current_time_ms as time
 gc.enable()
 
 class OnDemandFileWriter:
-    def __init__(self, filename):
-        try: 
-            self.file = open(filename, 'wb')
-        except Exception as e:
-            print("Error opening file: ", filename, ": ", e)
+    # Raises if the file can't be opened (with resume, if it doesn't exist)
+    def __init__(self, filename, resume=False):
+        self.file = open(filename, 'r+b' if resume else 'w+b')
 
 
-    def write(self, data):
+    def write(self, data, offset=None):
+        if offset is not None:
+            self.file.seek(offset)
         self.file.write(data)
 
+    def read(self, offset, size):
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class OnDemandFileReader:
+    def __init__(self, filename, chunk_size, cache_size=2):
+        self.file = open(filename, 'rb')
+        self.file.seek(0, 2)
+        self.length = self.file.tell()
+        self.cache_size = cache_size    # Chunks kept to answer retransmissions without reading again
+        self.set_chunk_size(chunk_size)
+
+    def set_chunk_size(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.buffer = bytearray(chunk_size)
+        self.cache = {}
+        self.cache_order = []   # Least recently served first
+
+    def get_chunk(self, position, cache=True):
+        chunk = self.cache.get(position)
+        if chunk is not None:
+            self.cache_order.remove(position)
+            self.cache_order.append(position)
+            return chunk
+        self.file.seek(position * self.chunk_size)
+        size = self.file.readinto(self.buffer)
+        chunk = bytes(memoryview(self.buffer)[:size])
+        if cache and self.cache_size:
+            if len(self.cache_order) >= self.cache_size:
+                del self.cache[self.cache_order.pop(0)]
+            self.cache[position] = chunk
+            self.cache_order.append(position)
+        return chunk
+
     def close(self):
         self.file.close()
 
 class CTP_File:
 
-    def __init__(self, name: str = None, content: bytearray = None, chunk_size: int = None, length: int = None, report=False, path="Results"):
+    STATE_SAVE_INTERVAL = 10    # Requester: chunks received between reception state backups
+
+    def __init__(self, name: str = None, content: bytearray = None, chunk_size: int = None, length: int = None, report=False, path="Results",
+                 fec_repair_chunks=0, last_chunk_size=None, compression=False, resume=False,
+                 file_path=None, chunk_cache=2):
         self.name = name
         self.report = report
-        if content:
+        self.fec_repair_chunks = fec_repair_chunks     # Repair chunks appended after the data chunks
+        self.compressed = False                         # The content is a zlib stream
+        if content or file_path:
             self.assembly_needed = False
-            self.content = content
-            self.length = len(content)
+            self.file_path = file_path
+            if file_path:
+                # Chunks are read from the file when requested, the content never is in RAM
+                self.reader = OnDemandFileReader(file_path, chunk_size, chunk_cache)
+                self.content = None
+                self.length = self.reader.length
+            else:
+                self.reader = None
+                self.content = content
+                self.length = len(content)
             self.chunk_size = chunk_size
             self.chunk_counter = ceil(self.length / self.chunk_size)
+            self.data_chunks = self.chunk_counter
+            self.repair_cache = {}
 
             self.retransmission = 0
             self.last_chunk_sent = None
@@ -45,6 +105,8 @@ class CTP_File:
             self.metadata_sent = False
             self.first_sent = None
             self.last_sent = None
+            if compression:
+                self.enable_compression()
         else:
             self.assembly_needed = True
             self.length = length
@@ -60,39 +122,206 @@ class CTP_File:
             except Exception as e:
                 print("Error creating Temp folder: ", e)
             self.temp_file_path = "{}/Temp/{}.tmp".format(self.path, name)
-            self.file_writer = OnDemandFileWriter(self.temp_file_path)
+            self.state_file_path = "{}/Temp/{}.state".format(self.path, name)
+            self.file_writer = OnDemandFileWriter(self.temp_file_path, resume)
+            self.unsaved_chunks = 0
             self.received_chunks = 0
-            self.missing_chunks = list(range(length))
+            self.received_map = Bitmap(length)     # Bit per chunk, set once received
+            self.received_data = 0                  # Data chunks received (or rebuilt)
+            self.chunk_size = None      # Learnt from the first chunk that is not the last one
+            self.pending_chunks = {}    # Chunks received before knowing where to write them
+            self.data_chunks = length - fec_repair_chunks
+            self.last_chunk_size = last_chunk_size
+            self.repair_chunks = {}     # Repair index -> repair chunk
+            self.next_unrequested = 0   # With FEC, every chunk is asked once before asking again for the missing ones
+            self.compressed = compression
 
     def get_name(self):
         return self.name
 
     def get_content(self):
+        if not self.assembly_needed and self.reader:
+            with open(self.file_path, "rb") as f:
+                return f.read()
         if self.assembly_needed:
             with open(self.temp_file_path, "rb") as f:
                 self.content = f.read()
+            if self.compressed:
+                self.content = compression_utils.decompress(self.content)
             return self.content
         return self.content
 
     # Requester methods
     def get_missing_chunks(self) -> list:
-        return self.missing_chunks
+        if self.is_complete():
+            return []
+        return list(self.received_map.clear_bits())
+
+    def missing_count(self):
+        if self.is_complete():
+            return 0
+        return self.received_map.missing()
+
+    def get_next_chunks(self, count: int) -> list:
+        if self.fec_repair_chunks and self.next_unrequested < self.length:
+            first = self.next_unrequested
+            self.next_unrequested = min(self.length, first + count)
+            if self.next_unrequested >= self.data_chunks:
+                self.next_unrequested = self.length     # The repair chunks are asked with the last data ones
+            return [order for order in range(first, self.next_unrequested) if not self.received_map.test(order)]
+        chunks = []
+        for order in self.received_map.clear_bits():
+            if len(chunks) == count:
+                break
+            chunks.append(order)
+        return chunks
 
     def add_chunk(self, order: int, chunk: bytes):
         try:
-            self.file_writer.write(chunk)
+            if order >= self.length or self.received_map.test(order):
+                return
+            if order >= self.data_chunks:
+                self.repair_chunks[order - self.data_chunks] = bytes(chunk)
+                if self.chunk_size is None:
+                    self.chunk_size = len(chunk)    # Repair chunks are always full sized
+            else:
+                if self.chunk_size is None and order < self.data_chunks - 1:
+                    self.chunk_size = len(chunk)
+                self.pending_chunks[order] = chunk
+                self.received_data += 1
+            if self.chunk_size is not None or self.data_chunks == 1:
+                for pending_order in self.pending_chunks:
+                    self.file_writer.write(self.pending_chunks[pending_order], pending_order * (self.chunk_size or 0))
+                self.pending_chunks = {}
             self.received_chunks += 1
-            if order in self.missing_chunks:
-                self.missing_chunks.remove(order)
+            self.received_map.set(order)
+            self.unsaved_chunks += 1
+            if self.unsaved_chunks >= self.STATE_SAVE_INTERVAL:
+                self.save_state()
         except Exception as e:
             print("Error adding chunk: ", e)
 
+    # Reception state, enough to resume the transfer after a restart
+    def get_state(self):
+        received = Bitmap(self.length, self.received_map.bits)
+        for order in self.pending_chunks:   # Not written to the temp file yet
+            received.bits[order >> 3] &= ~(1 << (order & 7))
+        repairs = {}
+        for repair in self.repair_chunks:
+            repairs[str(repair)] = binascii.hexlify(self.repair_chunks[repair]).decode()
+        return {"name": self.name,
+                "length": self.length,
+                "chunk_size": self.chunk_size,
+                "last_chunk_size": self.last_chunk_size,
+                "fec_repair_chunks": self.fec_repair_chunks,
+                "compression": self.compressed,
+                "received": binascii.hexlify(received.bits).decode(),
+                "next_unrequested": self.next_unrequested,
+                "repairs": repairs}
+
+    def save_state(self):
+        try:
+            self.file_writer.flush()
+            with open(self.state_file_path, "w") as f:
+                f.write(json.dumps(self.get_state()))
+            self.unsaved_chunks = 0
+        except Exception as e:
+            print("Error saving reception state: ", e)
+
+    def remove_state(self):
+        try:
+            os.remove(self.state_file_path)
+        except Exception:
+            pass
+
+    # Requester file rebuilt from a reception state saved by save_state.
+    # Without its temp file the state is useless, so it is removed.
+    @staticmethod
+    def restore(state_file_path, path):
+        try:
+            with open(state_file_path, "r") as f:
+                state = json.loads(f.read())
+            try:
+                os.stat("{}/Temp/{}.tmp".format(path, state["name"]))
+            except OSError:
+                print("Temp file missing, reception state discarded: ", state_file_path)
+                os.remove(state_file_path)
+                return None
+            file = CTP_File(name=state["name"], length=state["length"], path=path,
+                            fec_repair_chunks=state["fec_repair_chunks"], last_chunk_size=state["last_chunk_size"],
+                            compression=state["compression"], resume=True)
+            file.chunk_size = state["chunk_size"]
+            file.received_map = Bitmap(file.length, binascii.unhexlify(state["received"]))
+            for order in file.received_map.set_bits():
+                file.received_chunks += 1
+                if order < file.data_chunks:
+                    file.received_data += 1
+            file.next_unrequested = state["next_unrequested"]
+            for repair in state["repairs"]:
+                file.repair_chunks[int(repair)] = binascii.unhexlify(state["repairs"][repair])
+            return file
+        except Exception as e:
+            print("Error restoring reception state: ", state_file_path, ": ", e)
+            return None
+
+    def discard(self):
+        self.file_writer.close()
+        self.remove_state()
+        try:
+            os.remove(self.temp_file_path)
+        except Exception:
+            pass
+
+    # Same file announced by the Source metadata
+    def matches(self, name, length, options):
+        return (self.name == name and self.length == length
+                and self.fec_repair_chunks == options.get("FEC", 0)
+                and self.last_chunk_size == options.get("LAST")
+                and self.compressed == bool(options.get("COMPRESSION")))
+
+    def is_complete(self):
+        missing_data = self.data_chunks - self.received_data
+        if missing_data == 0:
+            return True
+        if len(self.repair_chunks) < missing_data:
+            return False
+        return self.recover()
+
+    # Rebuilds the missing data chunks from the repair chunks (FEC)
+    def recover(self):
+        try:
+            received = {}
+            for order in self.received_map.set_bits():
+                if order < self.data_chunks:
+                    received[order] = True
+            read = lambda order: self.file_writer.read(order * self.chunk_size, self.chunk_size)
+            rebuilt = fec_utils.recover(self.data_chunks, self.chunk_size, received, self.repair_chunks, read)
+            for order in rebuilt:
+                chunk = rebuilt[order]
+                if order == self.data_chunks - 1 and self.last_chunk_size:
+                    chunk = chunk[:self.last_chunk_size]
+                self.file_writer.write(chunk, order * self.chunk_size)
+                self.received_map.set(order)
+                self.received_data += 1
+                self.received_chunks += 1
+            print("FEC recovered {} chunks of {}".format(len(rebuilt), self.name))
+            return True
+        except Exception as e:
+            print("Error recovering chunks: ", e)
+            return False
+
     def finalize(self, path=None):
         self.file_writer.close()
+        self.remove_state()
         if not path:
             path = self.path
         print("Trying to save file: ", self.temp_file_path + " -> " + path + "/" + self.name)
-        os.rename(self.temp_file_path, path + "/" + self.name)
+        if self.compressed:
+            with open(path + "/" + self.name, "wb") as f:
+                f.write(self.get_content())
+            os.remove(self.temp_file_path)
+        else:
+            os.rename(self.temp_file_path, path + "/" + self.name)
 
     def save(self, path=None):
         if path:
@@ -108,17 +337,72 @@ class CTP_File:
 
     def change_chunk_size(self, new_size):
         self.chunk_size = new_size
+        if self.reader:
+            self.reader.set_chunk_size(new_size)
         self.chunk_counter = ceil(self.length / self.chunk_size)
+        self.data_chunks = self.chunk_counter
+        self.repair_cache = {}
+        if self.fec_repair_chunks and not self.enable_fec(self.fec_repair_chunks):
+            self.fec_repair_chunks = 0
+
+    # Replaces the content with its zlib stream, unless that is not smaller
+    def enable_compression(self):
+        if self.first_sent or self.compressed or self.reader:
+            return self.compressed
+        compressed = compression_utils.compress(self.content)
+        if compressed is None or len(compressed) >= self.length:
+            return False
+        self.content = compressed
+        self.compressed = True
+        self.length = len(compressed)
+        self.change_chunk_size(self.chunk_size)
+        return True
+
+    # Appends repair_chunks Reed-Solomon repair chunks to the data chunks
+    def enable_fec(self, repair_chunks):
+        if not fec_utils.fits(self.data_chunks, repair_chunks):
+            print("Too many chunks for FEC: ", self.data_chunks, "+", repair_chunks)
+            return False
+        self.fec_repair_chunks = repair_chunks
+        self.chunk_counter = self.data_chunks + repair_chunks
+        self.repair_cache = {}
+        return True
+
+    def get_metadata_options(self):
+        options = {}
+        if self.fec_repair_chunks:
+            options["FEC"] = self.fec_repair_chunks
+            options["LAST"] = self.length - (self.data_chunks - 1) * self.chunk_size
+        if self.compressed:
+            options["COMPRESSION"] = 1
+        return options or None
 
     def sent_ok(self):
         self.report_SST(False)
         self.sent = True
 
+    def get_data_chunk(self, position: int, cache=False):
+        if self.reader:
+            return self.reader.get_chunk(position, cache)
+        chunk = self.content[position * self.chunk_size: position * self.chunk_size + self.chunk_size]
+        return chunk if isinstance(chunk, bytes) else bytes(chunk)
+
+    def get_repair_chunk(self, repair: int):
+        if repair not in self.repair_cache:
+            self.repair_cache[repair] = fec_utils.encode_repair(repair, self.data_chunks, self.chunk_size, self.get_data_chunk)
+        return self.repair_cache[repair]
+
     def get_chunk(self, position: int):
         if self.last_chunk_sent:
             self.check_retransmission(position)
         self.last_chunk_sent = position
-        return bytes(self.content[position * self.chunk_size: position * self.chunk_size + self.chunk_size])
+        if position >= self.data_chunks:
+            return self.get_repair_chunk(position - self.data_chunks)
+        return self.get_data_chunk(position, True)
+
+    def close(self):
+        if self.reader:
+            self.reader.close()
 
     def check_retransmission(self, requested_chunk):
         if requested_chunk == self.last_chunk_sent:
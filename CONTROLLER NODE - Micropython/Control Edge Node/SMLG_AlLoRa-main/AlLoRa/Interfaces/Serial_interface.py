@@ -1,15 +1,32 @@
 import utime
+import _thread
 from machine import UART
 import struct
 from AlLoRa.Packet import Packet
 from AlLoRa.Interfaces.Interface import Interface
 from AlLoRa.Connectors.Connector import Connector
+from AlLoRa.utils.serial_frame_utils import (encode_frame, decode_frame, pack_rf_config, unpack_rf_config,
+                                             pack_status, FRAMING_VERSION, FRAMING_TIMEOUT, DELIMITER,
+                                             RADIO_COMMANDS, HELLO, SEND_WAIT, SEND, LISTEN, SET_RFC, GET_RFC,
+                                             STATUS, ACK, PACKET, OK, ERROR, RF_CONFIG, NO_DATA, STATUS_INFO)
+from AlLoRa.utils.time_utils import start_thread
 from AlLoRa.utils.debug_utils import print
 
 class Serial_Interface(Interface):
 
     def __init__(self):
         super().__init__()
+        self.binary = False         # Binary framing (serial_frame_utils) agreed with the connector
+        self.seq = 0                # Sequence number of the command being answered
+        self.frame_buffer = b""     # Bytes received after the last binary frame
+        self.hello_deadline = None  # ticks_ms to get a frame by after switching to binary framing
+        # With binary framing the radio commands run in a worker thread, and the
+        # other commands are answered meanwhile (each answer carries its seq)
+        self.radio_job = None       # (opcode, seq, payload) of the radio command in progress
+        self.job_ready = _thread.allocate_lock()
+        self.job_ready.acquire()    # Released when there is a radio_job for the worker
+        self.worker_started = False
+        self.write_lock = _thread.allocate_lock()
 
 
     def setup(self, connector: Connector, debug, config):
@@ -19,6 +36,7 @@ class Serial_Interface(Interface):
             self.mode = self.config_parameters.get('mode', "requester")
             self.uartid = self.config_parameters.get('uartid', 1)
             self.baud = self.config_parameters.get('baud', 9600)
+            self.max_baud = self.config_parameters.get('max_baud', 921600)
             self.tx = self.config_parameters.get('tx', None)
             self.rx = self.config_parameters.get('rx', None)
             self.bits = self.config_parameters.get('bits', 8)
@@ -26,14 +44,18 @@ class Serial_Interface(Interface):
             self.stop = self.config_parameters.get('stop', 1)
 
             self.uart = UART(self.uartid, self.baud)
-            self.uart.init(baudrate=self.baud, tx=self.tx, rx=self.rx, 
-                            bits=self.bits, parity=self.parity, stop=self.stop, 
-                            timeout=800)
+            self.set_baud(self.baud)
             if self.debug:
                 print("Serial Interface configure: uartid: {}, baud: {}, tx: {}, rx: {}, bits: {}, parity: {}, stop: {}".format(self.uartid, 
                                                                                                                                 self.baud, self.tx, self.rx, self.bits, self.parity, self.stop))
         utime.sleep(1)
 
+    def set_baud(self, baud):
+        self.uart.init(baudrate=baud, tx=self.tx, rx=self.rx, 
+                        bits=self.bits, parity=self.parity, stop=self.stop, 
+                        timeout=800)
+        self.current_baud = baud
+
     def listen_command(self, end_phrase=b"<<END>>\n"):
         buffer = bytearray()
         while True:
@@ -45,85 +67,206 @@ class Serial_Interface(Interface):
                 utime.sleep(0.01)
         return None
 
+    # Next valid frame as (opcode, seq, payload). None if no frame came in time after
+    # switching to binary framing, then the text framing is used again.
+    def listen_frame(self):
+        while True:
+            index = self.frame_buffer.find(DELIMITER)
+            if index >= 0:
+                data = self.frame_buffer[:index]
+                self.frame_buffer = self.frame_buffer[index + 1:]
+                frame = decode_frame(data)
+                if frame is not None:
+                    self.hello_deadline = None
+                    return frame
+                if self.debug:
+                    print("Corrupted frame dropped: ", data)
+            elif self.uart.any():
+                self.frame_buffer += self.uart.read(self.uart.any())
+            elif self.hello_deadline is not None and utime.ticks_diff(self.hello_deadline, utime.ticks_ms()) < 0:
+                if self.debug:
+                    print("No frame received, back to text framing")
+                self.use_text_framing()
+                return None
+            else:
+                utime.sleep_ms(1)   # Short, at high baud rates the UART buffer fills fast
+
+    def use_text_framing(self):
+        self.binary = False
+        self.hello_deadline = None
+        if self.current_baud != self.baud:
+            self.set_baud(self.baud)
+
+    # Answer to the command with seq (the last one received if None) in the framing
+    # in use. text is the answer with text framing, if it is not the payload itself.
+    def reply(self, opcode, payload=b"", text=None, seq=None):
+        if self.binary:
+            message = encode_frame(opcode, self.seq if seq is None else seq, payload)
+        else:
+            message = (payload if text is None else text) + b"<<END>>\n"
+        with self.write_lock:
+            self.uart.write(message)
+
+    def reply_error(self, error_type, message, focus_time="N/A", seq=None):
+        self.reply(ERROR, "ERROR_TYPE:{}|MESSAGE:{}|FOCUS_TIME:{}".format(error_type, message, focus_time).encode(),
+                   seq=seq)
+
 
     def client_API(self):
         """
         Main method to listen for and process commands sent to the serial interface.
         Delegates commands to their respective handler methods.
         """
+        if self.binary:
+            return self.binary_API()
+
         command = self.listen_command()
         
         if command.startswith(b"S&W:"):
-            return self.handle_send_and_wait(command)
+            return self.handle_send_and_wait(command[4:])
         elif command.startswith(b"Send:"):
-            return self.handle_source_mode(command)
+            return self.handle_source_mode(command[5:])
         elif command.startswith(b"Listen:"):
-            return self.handle_requester_mode(command)
+            return self.handle_requester_mode(float(command[7:]))
         elif command.startswith(b"C_RFC:"):
             return self.handle_change_rf_config(command)
         elif command.startswith(b"GET_RFC:"):
-            return self.handle_get_rf_config(command)
+            return self.handle_get_rf_config()
+        elif command.startswith(b"STATUS:"):
+            return self.handle_status()
+        elif command.startswith(b"BIN:"):
+            return self.handle_framing(command)
         else:
             return self.handle_invalid_command(command)
 
-    def handle_send_and_wait(self, command):
+    def binary_API(self):
+        frame = self.listen_frame()
+        if frame is None:
+            return False
+        opcode, self.seq, payload = frame
+
+        if opcode in RADIO_COMMANDS:
+            return self.start_radio_command(opcode, self.seq, payload)
+        elif opcode == GET_RFC:
+            return self.handle_get_rf_config()
+        elif opcode == STATUS:
+            return self.handle_status()
+        elif opcode == HELLO:
+            self.reply(OK)
+            return True
+        else:
+            return self.handle_invalid_command(frame)
+
+    # Hands a radio command to the worker, or answers BUSY if the radio is in use
+    def start_radio_command(self, opcode, seq, payload):
+        if self.radio_job is not None:
+            self.reply_error("BUSY", "Radio busy")
+            return False
+        self.radio_job = (opcode, seq, payload)
+        if not self.worker_started:
+            self.worker_started = True
+            start_thread(self.radio_worker)
+        self.job_ready.release()
+        return True
+
+    def radio_worker(self):
+        while True:
+            self.job_ready.acquire()
+            opcode, seq, payload = self.radio_job
+            try:
+                self.radio_command(opcode, seq, payload)
+            except Exception as e:
+                if self.debug:
+                    print("Error in radio command: ", e)
+            self.radio_job = None
+
+    def radio_command(self, opcode, seq, payload):
+        if opcode == SEND_WAIT:
+            return self.handle_send_and_wait(payload, seq)
+        elif opcode == SEND:
+            return self.handle_source_mode(payload, seq)
+        elif opcode == LISTEN:
+            return self.handle_requester_mode(struct.unpack(">I", payload)[0] / 1000, seq)
+        elif opcode == SET_RFC:
+            return self.change_rf_config(*unpack_rf_config(payload), seq=seq)
+
+    def handle_framing(self, command):
+        """
+        Switch to binary framing, asked by the connector with
+        "BIN:<version>|BAUD:<baud><<END>>\n". The answer has the same format, with
+        the baud taken (at most max_baud); both sides switch to it after the answer.
+        Without a valid frame within FRAMING_TIMEOUT the text framing is used again.
+        """
+        try:
+            fields = dict(field.split(b":", 1) for field in bytes(command).split(b"|"))
+            version = int(fields[b"BIN"])
+            baud = min(int(fields[b"BAUD"]), self.max_baud)
+        except Exception as e:
+            self.reply_error("EXCEPTION", e)
+            return False
+        if version != FRAMING_VERSION:
+            self.reply_error("FRAMING", "Framing version {} not supported".format(version))
+            return False
+
+        answer = "BIN:{}|BAUD:{}<<END>>\n".format(FRAMING_VERSION, baud).encode()
+        self.uart.write(answer)
+        utime.sleep_ms(len(answer) * 10000 // self.current_baud + 10)  # Until it is sent
+        if baud != self.current_baud:
+            self.set_baud(baud)
+        self.binary = True
+        self.frame_buffer = b""
+        self.hello_deadline = utime.ticks_add(utime.ticks_ms(), FRAMING_TIMEOUT * 1000)
+        if self.debug:
+            print("Binary framing v{} at {} baud".format(FRAMING_VERSION, baud))
+        return True
+
+    def handle_send_and_wait(self, data, seq=None):
         packet_from_rpi = Packet(self.connector.mesh_mode, self.connector.short_mac)
-        data = command.split(b"S&W:")[-1]
         check = packet_from_rpi.load(data)
 
-        if check:
-            ack = b"ACK:" + str(self.connector.adaptive_timeout).encode() + b"<<END>>\n"
-        else:
-            ack = b"ACK:0<<END>>\n"  # Error (0) in loading packet
+        # Adaptive timeout, 0 is an error in loading the packet
+        ack_timeout = self.connector.response_timeout(packet_from_rpi.get_destination()) if check else 0
         if self.debug:
-            print("Sending ACK: ", ack)
-        self.uart.write(ack)
+            print("Sending ACK: ", ack_timeout)
+        self.reply(ACK, struct.pack(">I", int(ack_timeout * 1000)), b"ACK:" + str(ack_timeout).encode(), seq)
 
         try:
             packet_from_rpi.replace_source(self.connector.get_mac())
             response_packet, packet_size_sent, packet_size_received, time_pr = self.connector.send_and_wait_response(packet_from_rpi)
 
             if isinstance(response_packet, dict):  # Handle errors
-                error_message = (
-                    "ERROR_TYPE:{}|MESSAGE:{}|FOCUS_TIME:{}<<END>>\n".format(
-                        response_packet["type"],
-                        response_packet["message"],
-                        response_packet.get("focus_time", "N/A"),
-                    )
-                ).encode()
-                self.uart.write(error_message)
+                self.reply_error(response_packet["type"], response_packet["message"],
+                                 response_packet.get("focus_time", "N/A"), seq)
                 if self.debug:
-                    print("Error transmitted to Raspberry Pi: ", error_message)
+                    print("Error transmitted to Raspberry Pi: ", response_packet)
                 return False
 
             if response_packet:  # Handle successful response
-                response = response_packet.get_content() + b"<<END>>\n"
+                response = response_packet.get_content()
                 if self.debug:
                     print("Sending serial: ", len(response), " -> {}".format(response))
-                self.uart.write(response)
+                self.reply(PACKET, response, seq=seq)
                 return True
             else:
                 if self.debug:
                     print("No response...")
-                self.uart.write(b'No response' + b"<<END>>\n")
+                self.reply(NO_DATA, b"", b"No response", seq)
                 return False
 
         except Exception as e:
-            error_message = "EXCEPTION:{}<<END>>\n".format(e).encode()
             if self.debug:
                 print("Error sending and waiting: ", e)
-            self.uart.write(error_message)
+            self.reply_error("EXCEPTION", e, seq=seq)
             return False
     
-    def handle_source_mode(self, command):
+    def handle_source_mode(self, data, seq=None):
         packet_from_source = Packet(self.connector.mesh_mode, self.connector.short_mac)
         # Send ACK to say that I will send it
-        ack = b"OK"
-        self.uart.write(ack)
+        self.reply(OK, b"", b"OK", seq)
         try:
-            packet_from_source.load(command[5:])
+            packet_from_source.load(data)
             packet_from_source.replace_source(self.connector.get_mac())
-            success = self.connector.send(packet_from_source)
+            success = self.connector.transmit(packet_from_source)
             if success:
                 return True
         except Exception as e:
@@ -131,10 +274,8 @@ class Serial_Interface(Interface):
                 print("Error loading packet: ", e)
             return False
 
-    def handle_requester_mode(self, command):
-        focus_time = int(command[7:])
-        ack = b"OK"
-        self.uart.write(ack)
+    def handle_requester_mode(self, focus_time, seq=None):
+        self.reply(OK, b"", b"OK", seq)
         if self.debug:
             print("Listening for: ", focus_time)
         packet = Packet(mesh_mode=self.connector.mesh_mode, short_mac=self.connector.short_mac)
@@ -145,18 +286,17 @@ class Serial_Interface(Interface):
             try:
                 packet.load(data)
                 response = packet.get_content()
-                response += b"<<END>>\n"
                 if self.debug:
                     print("Sending serial: ", len(response), " -> {}".format(response))
-                self.uart.write(response)
+                self.reply(PACKET, response, seq=seq)
             except Exception as e:
                 if self.debug:
                     print("Error loading: ", data, " -> ", e)
-                self.uart.write(b'Error')
+                self.reply_error("CORRUPTED_PACKET", e, seq=seq)
         else:
             if self.debug:
                 print("No data received")
-            self.uart.write(b'No data' + b"<<END>>\n")
+            self.reply(NO_DATA, b"", b"No data", seq)
 
     def handle_change_rf_config(self, command):
         """
@@ -192,30 +332,41 @@ class Serial_Interface(Interface):
                 elif key == "TX_POWER":
                     tx_power = int(value)
 
+        except Exception as e:
+            # Send an error response with exception details
+            if self.debug:
+                print("Error changing RF config: ", e)
+            self.reply_error("EXCEPTION", e)
+            return False
+        return self.change_rf_config(frequency, sf, bw, cr, tx_power)
+
+    # Parameters that are None or 0 are left as they are
+    def change_rf_config(self, frequency, sf, bw, cr, tx_power, seq=None):
+        try:
             # Change the RF configuration
             success = self.connector.change_rf_config(
-                frequency=frequency,
-                sf=sf,
-                bw=bw,
-                cr=cr,
-                tx_power=tx_power,
+                frequency=frequency or None,
+                sf=sf or None,
+                bw=bw or None,
+                cr=cr or None,
+                tx_power=tx_power or None,
             )
 
             # Send response
             if success:
-                response = b"OK<<END>>\n"
+                self.reply(OK, b"", b"OK", seq)
             else:
-                response = b"ERROR<<END>>\n"
-            self.uart.write(response)
+                self.reply_error("RF_CONFIG", "RF config not changed", seq=seq)
+            return success
     
         except Exception as e:
             # Send an error response with exception details
-            error_message = f"EXCEPTION:{e}<<END>>\n".encode()
             if self.debug:
                 print("Error changing RF config: ", e)
-            self.uart.write(error_message)
+            self.reply_error("EXCEPTION", e, seq=seq)
+            return False
 
-    def handle_get_rf_config(self, command):
+    def handle_get_rf_config(self):
         """
         Handle the get RF configuration command from the client_API.
         Expected format: "GET_RFC<<END>>\n"
@@ -224,27 +375,41 @@ class Serial_Interface(Interface):
             # Get the RF configuration
             rf_config = self.connector.get_rf_config()
             #  [self.frequency, self.sf, self.bw, self.cr, self.tx_power]
-            response = "FREQ:{}|SF:{}|BW:{}|CR:{}|TX_POWER:{}<<END>>\n".format(
+            response = "FREQ:{}|SF:{}|BW:{}|CR:{}|TX_POWER:{}".format(
                 rf_config[0],
                 rf_config[1],
                 rf_config[2],
                 rf_config[3],
                 rf_config[4],
             ).encode()
-            self.uart.write(response)
+            self.reply(RF_CONFIG, pack_rf_config(*rf_config[:5]), response)
         
         except Exception as e:
-            error_message = "EXCEPTION:{}<<END>>\n".format(e).encode()
             if self.debug:
                 print("Error getting RF config: ", e)
-            self.uart.write(error_message)
+            self.reply_error("EXCEPTION", e)
                 
+    def handle_status(self):
+        """
+        Status of the interface, answered meanwhile a radio command is in progress.
+        Text format: "BUSY:1|RSSI:-87.0|SNR:9.5|TIMEOUT:1.68<<END>>\n"
+        """
+        busy = self.radio_job is not None
+        rssi = self.connector.get_rssi() or 0
+        snr = self.connector.get_snr() or 0
+        timeout = self.connector.adaptive_timeout
+        text = "BUSY:{}|RSSI:{}|SNR:{}|TIMEOUT:{}".format(1 if busy else 0, rssi, snr, timeout).encode()
+        self.reply(STATUS_INFO, pack_status(busy, rssi, snr, timeout), text)
+        return True
+
     def handle_invalid_command(self, command):
         """
         Handle invalid commands by sending an error response to the UART.
         """
-        error_message = b"ERROR:Invalid Command<<END>>\n"
-        self.uart.write(error_message)
+        if self.binary:
+            self.reply_error("INVALID_COMMAND", "Invalid Command")
+        else:
+            self.uart.write(b"ERROR:Invalid Command<<END>>\n")
         if self.debug:
             print("Invalid command received:", command)
         return False
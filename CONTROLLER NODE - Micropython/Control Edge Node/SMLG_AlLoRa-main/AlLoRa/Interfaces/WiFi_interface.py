@@ -1,11 +1,18 @@
 import usocket
 from utime import sleep
 from ujson import loads, dumps
+import struct
 import sys
 
 from AlLoRa.Interfaces.Interface import Interface
 from AlLoRa.Packet import Packet
 from AlLoRa.utils.debug_utils import print
+from AlLoRa.utils.serial_frame_utils import (encode_frame, decode_frame, pack_rf_config, unpack_rf_config,
+                                             pack_status, FRAMING_VERSION, DELIMITER, HELLO, SEND_WAIT, SEND,
+                                             LISTEN, SET_RFC, GET_RFC, STATUS, ACK, PACKET, OK, ERROR, RF_CONFIG,
+                                             NO_DATA, STATUS_INFO)
+
+UPGRADE = "allora-frames/{}".format(FRAMING_VERSION)   # Upgrade: token of the binary protocol
 
 # Attempt to import Pycom-specific modules and set a flag
 PYCOM = False
@@ -23,6 +30,11 @@ class WiFi_Interface(Interface):
     def __init__(self):
         super().__init__()
         self.wlan = None
+        self.client = None      # Connection of the connector, kept open between commands
+        self.buffer = b""       # Bytes received from the client and not read yet
+        self.frames = False     # The connection was upgraded to frames (serial_frame_utils)
+        self.keep = True        # Keep the connection open after the current request
+        self.seq = 0            # Sequence number of the frame being answered
 
     def setup(self, connector, debug, config):
         super().setup(connector, debug, config)
@@ -37,6 +49,7 @@ class WiFi_Interface(Interface):
         self.subnet_mask = config.get('subnet_mask', '255.255.255.0')  # Pycom client
         self.gateway = config.get('gateway', '192.168.1.10')  # Pycom client
         self.DNS_server = config.get('DNS_server', '8.8.8.8')  # Pycom client
+        self.keep_alive = config.get('keep_alive', 60)  # s an idle connection is kept open
 
         # Initialize WiFi based on mode
         self.init_wifi()
@@ -88,181 +101,255 @@ class WiFi_Interface(Interface):
                 if self.debug:
                     print("Exception connecting to WiFi:", e)
 
-    def client_API(self):
-        (clientsocket, _) = self.serversocket.accept()
-        clientsocket.settimeout(5)
-        try:
-            # Initialize an empty buffer to accumulate the request
-            data = b""
-
-            # Loop to read incoming data until headers and Content-Length are processed
-            while True:
-                chunk = clientsocket.recv(512)  # Read data in chunks
-                if not chunk:
-                    break
-                data += chunk
-                # Check if headers and body separator ("\r\n\r\n") are in the buffer
-                if b"\r\n\r\n" in data:
-                    break
-
-            # Decode the headers and split the buffer into headers and body
-            decoded_data = data.decode()
-            if "\r\n\r\n" in decoded_data:
-                headers, body = decoded_data.split("\r\n\r\n", 1)
-            else:
-                raise ValueError("Malformed HTTP request: Missing headers or body separator.")
-
-            # Extract Content-Length from headers
-            content_length = 0
-            for line in headers.split("\r\n"):
-                if line.startswith("Content-Length:"):
-                    content_length = int(line.split(":")[1].strip())
-                    break
-
-            # Continue receiving the body if it's incomplete
-            while len(body) < content_length:
-                body += clientsocket.recv(512).decode()
+    def accept(self):
+        (self.client, _) = self.serversocket.accept()
+        self.client.settimeout(self.keep_alive)
+        self.buffer = b""
+        self.frames = False
 
-            # Debug: Show the received HTTP request
-            if self.debug:
-                print(f"Received by WiFi: {decoded_data}")
-
-            # Parse the JSON body
-            request = loads(body)
-            # Extract command and parameters
-            command = request.get("command")
-            params = request.get("data", {})
+    def close_client(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+        self.client = None
+
+    def receive(self):
+        chunk = self.client.recv(512)
+        if not chunk:
+            raise OSError("Connection closed by the client")
+        self.buffer += chunk
+
+    def read_until(self, delimiter):
+        index = self.buffer.find(delimiter)
+        while index < 0:
+            self.receive()
+            index = self.buffer.find(delimiter)
+        index += len(delimiter)
+        data, self.buffer = self.buffer[:index], self.buffer[index:]
+        return data
+
+    def read_exactly(self, size):
+        while len(self.buffer) < size:
+            self.receive()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
 
-            # Debug: Show extracted command and params
+    def client_API(self):
+        """
+        Serves one command of the connector: an HTTP request, or a frame once the
+        connection is upgraded. The connection stays open for the next commands
+        until the client closes it, asks for "Connection: close" or is idle for
+        keep_alive s.
+        """
+        if self.client is None:
+            self.accept()
+        try:
+            if self.frames:
+                return self.frame_API()
+            return self.http_API()
+        except Exception as e:
             if self.debug:
-                print(f"Command: {command}, Params: {params}")
-
-            # HTTP response header
-            http_response = "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n\r\n"
+                print("WiFi API connection closed: {}".format(e))
+            self.close_client()
+            return False
+
+    # (headers with lowercase names, body) of the next HTTP request
+    def read_request(self):
+        lines = self.read_until(b"\r\n\r\n").decode().split("\r\n")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        body = self.read_exactly(int(headers.get("content-length", 0)))
+        if self.debug:
+            print("Received by WiFi: {} {}".format(lines[0], body))
+        return headers, body
+
+    def http_API(self):
+        headers, body = self.read_request()
+        self.keep = headers.get("connection", "").lower() != "close"
+        if headers.get("upgrade") == UPGRADE:
+            self.client.sendall(("HTTP/1.1 101 Switching Protocols\r\nConnection: Upgrade\r\n"
+                                 "Upgrade: {}\r\n\r\n").format(UPGRADE).encode())
+            self.frames = True
+            return False
+        if "upgrade" in headers:
+            self.reply_error("INVALID_COMMAND", "Unsupported upgrade")
+            return False
+
+        request = loads(body)
+        command = request.get("command")
+        params = request.get("data", request.get("params", {}))
+        if self.debug:
+            print("Command: {}, Params: {}".format(command, params))
 
-            # Handle commands
+        try:
             if command == "S&W":
-                print("Handling S&W")  # Debug to confirm entry into this block
-                self.handle_send_and_wait(params, clientsocket, http_response)
+                return self.handle_send_and_wait(params.encode())
             elif command == "Send":
-                print("Handling Send")
-                self.handle_source_mode(params, clientsocket, http_response)
+                return self.handle_source_mode(params.encode())
             elif command == "Listen":
-                print("Handling Listen")
-                self.handle_requester_mode(params, clientsocket, http_response)
+                return self.handle_requester_mode(float(params.get("focus_time", 12)))
             elif command == "CHANGE_RF_CONFIG":
-                print("Handling CHANGE_RF_CONFIG")
-                response = self.handle_change_rf_config(params)
-                clientsocket.send(http_response + dumps(response))
+                return self.handle_change_rf_config(params.get("frequency"), params.get("sf"), params.get("bw"),
+                                                    params.get("cr"), params.get("tx_power"))
             elif command == "GET_RFC":
-                print("Handling GET_RFC")
-                self.handle_get_rf_config(clientsocket, http_response)
+                return self.handle_get_rf_config()
             else:
-                print("Invalid command received")
-                self.handle_invalid_command(clientsocket, http_response)
-
-        except Exception as e:
-            if self.debug:
-                print(f"Error in WiFi API: {e}")
+                return self.handle_invalid_command(command)
         finally:
-            clientsocket.close()
+            if not self.keep:
+                self.close_client()
 
-    
-    def handle_send_and_wait(self, params, clientsocket, http_response):
+    def frame_API(self):
+        frame = decode_frame(self.read_until(DELIMITER)[:-1])
+        if frame is None:
+            if self.debug:
+                print("Corrupted frame")
+            return False
+        opcode, self.seq, payload = frame
+
+        if opcode == SEND_WAIT:
+            return self.handle_send_and_wait(payload)
+        elif opcode == SEND:
+            return self.handle_source_mode(payload)
+        elif opcode == LISTEN:
+            return self.handle_requester_mode(struct.unpack(">I", payload)[0] / 1000)
+        elif opcode == SET_RFC:
+            return self.handle_change_rf_config(*unpack_rf_config(payload))
+        elif opcode == GET_RFC:
+            return self.handle_get_rf_config()
+        elif opcode == STATUS:
+            return self.handle_status()
+        elif opcode == HELLO:
+            self.reply(OK, b"", {"ACK": "OK"})
+            return True
+        else:
+            return self.handle_invalid_command(opcode)
+
+    # Answer to the current command: a frame, or an HTTP response with the JSON of response
+    def reply(self, opcode, payload, response):
+        if self.frames:
+            self.client.sendall(encode_frame(opcode, self.seq, payload))
+            return
+        body = dumps(response).encode()
+        self.client.sendall(("HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: {}\r\n"
+                             "Content-Length: {}\r\n\r\n").format("keep-alive" if self.keep else "close",
+                                                                    len(body)).encode() + body)
+
+    def reply_error(self, error_type, message):
+        self.reply(ERROR, "ERROR_TYPE:{}|MESSAGE:{}".format(error_type, message).encode(),
+                   {"error": {"type": error_type, "message": str(message)}})
+
+    def handle_send_and_wait(self, data):
+        packet = Packet(self.connector.mesh_mode, self.connector.short_mac)
         try:
-            print("Entered handle_send_and_wait")
-            print(f"Params received: {params}")
-
-            packet = Packet(self.connector.mesh_mode, self.connector.short_mac)
-            data = params.encode()
-            print(f"Data to load into packet: {data}")
-
             check = packet.load(data)
-            print(f"Packet loaded successfully: {check}")
-            print(f"Packet payload: {packet.get_content()}")
+        except Exception:
+            check = False
 
-            # Send initial ACK response
-            ack = {"ACK": self.connector.adaptive_timeout if check else 0}
-            clientsocket.send(http_response + dumps(ack))  # Initial ACK response
-            if not check:
-                print("Packet load failed. Exiting handle_send_and_wait.")
-                return
+        # Adaptive timeout, 0 is an error in loading the packet
+        ack_timeout = self.connector.response_timeout(packet.get_destination()) if check else 0
+        self.reply(ACK, struct.pack(">I", int(ack_timeout * 1000)), {"ACK": ack_timeout})
+        if not check:
+            self.reply_error("LOAD_ERROR", "Packet not loaded")
+            return False
 
-            # Send the packet
+        try:
             packet.replace_source(self.connector.get_mac())
             if self.debug:
                 print("Sending packet:", packet.get_content())
-
-            # Wait for a response
             response_packet, *_ = self.connector.send_and_wait_response(packet)
-            print(f"Response packet received: {response_packet}")
-
-            if isinstance(response_packet, dict):  # Error response
-                print(f"Error in response packet: {response_packet}")
-                clientsocket.send(http_response + dumps({"error": response_packet}))
-            else:  # Valid packet response
-                # Convert the packet to a dictionary for safe transport
-                response_payload = response_packet.get_dict()
-                print(f"Valid response packet: {response_payload}")
-                clientsocket.send(http_response + dumps(response_payload))
         except Exception as e:
-            print(f"Exception in handle_send_and_wait: {e}")
-            clientsocket.send(http_response + dumps({"error": str(e)}))
+            if self.debug:
+                print("Error sending and waiting: ", e)
+            self.reply_error("EXCEPTION", e)
+            return False
 
-    def handle_source_mode(self, params, clientsocket, http):
+        if isinstance(response_packet, dict):  # Error response
+            if self.debug:
+                print("Error in response packet: {}".format(response_packet))
+            self.reply_error(response_packet["type"], response_packet["message"])
+            return False
+        if self.frames:
+            self.reply(PACKET, response_packet.get_content(), None)
+        else:
+            # The packet as a dictionary, for safe transport in JSON
+            self.reply(PACKET, b"", response_packet.get_dict())
+        return True
+
+    def handle_source_mode(self, data):
         packet = Packet(self.connector.mesh_mode, self.connector.short_mac)
-        ack = {"ACK": "OK"}
-        clientsocket.send(http + dumps(ack))
         try:
-            packet.load(params.get("data", "").encode())
+            packet.load(data)
+        except Exception as e:
+            self.reply_error("LOAD_ERROR", e)
+            return False
+        # Answer before sending, as the radio may have to wait for the duty cycle
+        self.reply(OK, b"", {"ACK": "OK"})
+        try:
             packet.replace_source(self.connector.get_mac())
-            self.connector.send(packet)
+            return self.connector.transmit(packet)
         except Exception as e:
-            clientsocket.send(http + dumps({"error": str(e)}))
+            if self.debug:
+                print("Error sending packet: ", e)
+            return False
 
-    def handle_requester_mode(self, params, clientsocket, http):
-        focus_time = int(params.get("focus_time", 12))
-        ack = {"ACK": "OK"}
-        clientsocket.send(http + dumps(ack))
+    def handle_requester_mode(self, focus_time):
+        self.reply(OK, b"", {"ACK": "OK"})
         data = self.connector.recv(focus_time)
-        if data:
-            try:
-                packet = Packet(self.connector.mesh_mode, self.connector.short_mac)
-                packet.load(data)
-                clientsocket.send(http + dumps({"response": packet.get_dict()}))
-            except Exception as e:
-                clientsocket.send(http + dumps({"error": str(e)}))
-        else:
-            clientsocket.send(http + dumps({"error": "No Data Received"}))
-
-    def handle_change_rf_config(self, params):
+        if not data:
+            self.reply(NO_DATA, b"", {"error": "No Data Received"})
+            return False
         try:
-            success = self.connector.change_rf_config(
-                frequency=params.get("frequency"),
-                sf=params.get("sf"),
-                bw=params.get("bw"),
-                cr=params.get("cr"),
-                tx_power=params.get("tx_power"),
-            )
-            if success:
-                return {"ACK": "OK", "params": self.connector.get_rf_config()}
+            packet = Packet(self.connector.mesh_mode, self.connector.short_mac)
+            packet.load(data)
+            if self.frames:
+                self.reply(PACKET, packet.get_content(), None)
             else:
-                return {"error": "Failed to change RF configuration"}
+                self.reply(PACKET, b"", {"response": packet.get_dict()})
+            return True
         except Exception as e:
-            return {"error": str(e)}
+            self.reply_error("CORRUPTED_PACKET", e)
+            return False
 
-    def handle_get_rf_config(self, clientsocket, http):
+    def handle_change_rf_config(self, frequency=None, sf=None, bw=None, cr=None, tx_power=None):
+        try:
+            success = self.connector.change_rf_config(frequency=frequency or None, sf=sf or None, bw=bw or None,
+                                                      cr=cr or None, tx_power=tx_power or None)
+        except Exception as e:
+            self.reply_error("EXCEPTION", e)
+            return False
+        if success:
+            rf_config = self.connector.get_rf_config()
+            self.reply(OK, b"", {"ACK": "OK", "params": {"frequency": rf_config[0], "sf": rf_config[1],
+                                                        "bw": rf_config[2], "cr": rf_config[3],
+                                                        "tx_power": rf_config[4]}})
+            return True
+        self.reply_error("RF_CONFIG", "Failed to change RF configuration")
+        return False
+
+    def handle_get_rf_config(self):
         try:
             rf_config = self.connector.get_rf_config()
-            response = {
+            self.reply(RF_CONFIG, pack_rf_config(*rf_config), {
                 "FREQ": rf_config[0], "SF": rf_config[1], "BW": rf_config[2],
                 "CR": rf_config[3], "TX_POWER": rf_config[4]
-            }
-            clientsocket.send(http + dumps(response))
+            })
+            return True
         except Exception as e:
-            clientsocket.send(http + dumps({"error": str(e)}))
-
-    def handle_invalid_command(self, clientsocket, http):
-        clientsocket.send(http + dumps({"error": "Invalid Command"}))
-
-        
\ No newline at end of file
+            self.reply_error("EXCEPTION", e)
+            return False
+
+    def handle_status(self):
+        self.reply(STATUS_INFO, pack_status(False, self.connector.get_rssi(), self.connector.get_snr(),
+                                            self.connector.adaptive_timeout), None)
+        return True
+
+    def handle_invalid_command(self, command):
+        if self.debug:
+            print("Invalid command received: {}".format(command))
+        self.reply_error("INVALID_COMMAND", "Invalid Command")
+        return False
@@ -0,0 +1,54 @@
+import asyncio
+
+from AlLoRa.Nodes.Gateway import Gateway
+from AlLoRa.Nodes.Async_Requester import Async_Requester
+from AlLoRa.utils.time_utils import current_time_ms as time
+from AlLoRa.utils.debug_utils import print
+
+
+class Async_Gateway(Gateway, Async_Requester):
+    """
+    Gateway for asyncio (CPython only), see Async_Requester. The endpoints are
+    scheduled as in Gateway; check_digital_endpoints is a coroutine that can
+    run as a task next to the MQTT, HTTP or file watching tasks of the
+    application, on one event loop:
+
+        gateway = Async_Gateway(Async_Serial_connector(), "LoRa.json")
+        asyncio.run(gateway.check_digital_endpoints(save_files=True))
+    """
+
+    async def check_digital_endpoints(self, print_file_content=False, save_files=False):
+        print("Listening to {} endpoints!".format(len(self.digital_endpoints)))
+        scheduler = self.start_schedule()
+        rf_profile = None   # RF profile of the last endpoint checked, endpoints sharing it go first
+
+        while True:
+            ep, wait = self.next_endpoint(scheduler, rf_profile)
+            if ep is None:
+                await asyncio.sleep(wait)
+                continue
+            rf_profile = ep.get_rf_profile()
+            await self.check_endpoint(ep, print_file_content, save_files)
+            # Reschedule next check regardless of success or error
+            self.schedule_endpoint(scheduler, ep, time() + ep.next_check() * 1000)
+
+    async def check_endpoint(self, ep, print_file_content=False, save_files=False):
+        mac = ep.get_mac_address()
+        try:
+            if self.debug:
+                print("Listening to endpoint {} ({}) for {}s, {}s late".format(ep.get_name(), mac, ep.listening_time, ep.schedule_info["last_lateness"]))
+
+            await self.listen_to_endpoint(ep, ep.listening_time,
+                                          print_file=print_file_content, save_file=save_files)
+
+            self.update_subscribers(ep)
+            # Extend the listening for one additional period if there are missing chunks
+            if ep.get_current_file() is not None:
+                if ep.lock_on_file_receive and not ep.get_current_file().is_complete():
+                    await self.listen_to_endpoint(ep, ep.max_listen_time_when_locked,
+                                                  print_file=print_file_content, save_file=save_files)
+                    self.update_subscribers(ep)
+
+        except Exception as e:
+            if self.debug:
+                print("Error listening to endpoint {} ({}): {}".format(ep.get_name(), mac, e))
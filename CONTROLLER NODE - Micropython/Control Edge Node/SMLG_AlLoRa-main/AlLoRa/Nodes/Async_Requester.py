@@ -0,0 +1,157 @@
+import asyncio
+
+from AlLoRa.Nodes.Requester import Requester, Packet
+from AlLoRa.Digital_Endpoint import Digital_Endpoint
+from AlLoRa.utils.time_utils import current_time_ms as time
+from AlLoRa.utils.debug_utils import print
+
+
+class Async_Requester(Requester):
+    """
+    Requester for asyncio (CPython only), over a connector whose radio methods
+    are coroutines (Async_Serial_connector). The protocol is the one of
+    Requester, only the steps that wait for the radio or sleep are awaited, so
+    the same event loop can serve MQTT, HTTP or other endpoints meanwhile.
+    RF changes negotiated with the Source (ask_change_rf) are not supported.
+    """
+
+    async def send_request(self, packet: Packet) -> Packet:
+        self.start_request(packet)
+        return self.request_result(*await self.connector.send_and_wait_response(packet))
+
+    async def send_lora(self, packet):
+        return await self.connector.send(packet)
+
+    async def ask_ok(self, packet: Packet):
+        packet.set_ok()
+        response_packet = await self.send_request(packet)
+        self.pending = self.pending_result(response_packet)
+        return self.ok_result(response_packet)
+
+    async def probe_route(self, packet: Packet):
+        packet.set_ok()
+        packet.enable_debug_hops()
+        return await self.send_request(packet) is not None
+
+    async def ask_metadata(self, packet: Packet, fec_repair_chunks=0):
+        packet.ask_metadata(fec_repair_chunks)
+        return self.metadata_result(await self.send_request(packet))
+
+    async def ask_data(self, packet: Packet, next_chunk):
+        packet.ask_data(next_chunk)
+        return self.data_result(await self.send_request(packet))
+
+    async def ask_window(self, packet: Packet, chunks):
+        packet.ask_window(chunks)
+        response_packet = await self.send_request(packet)
+        window = [-1, 0, time() + len(chunks) * self.stream_slot() * 1000]
+        received = []
+        hop = None
+        while True:
+            hop = self.window_heard(window, packet, chunks, response_packet, received, hop)
+            if self.window_done(window, chunks):
+                break
+            response_packet = await self.receive_window_packet()
+        return received, hop
+
+    async def receive_window_packet(self):
+        return self.window_packet(await self.connector.recv(self.stream_slot()))
+
+    async def finish_file(self, digital_endpoint: Digital_Endpoint, file, save_to, print_file, save_file):
+        final_ok = self.final_ok(digital_endpoint)
+        await asyncio.sleep(1)
+        # The Source answers with the data it has left
+        digital_endpoint.set_pending(self.pending_result(await self.send_request(final_ok)))
+        self.file_finished(file, save_to, print_file, save_file)
+
+    async def prepare_connector(self, digital_endpoint):
+        if self.debug:
+            print("Preparing connector for endpoint: ", digital_endpoint)
+        if self.rf_config_matches(digital_endpoint, await self.connector.get_rf_config()):
+            return True
+        de_freq, de_sf, de_bw, de_cr, de_tx_power = digital_endpoint.get_rf_profile()
+        if self.debug:
+            print("Changing RF config to: ", de_freq, de_sf, de_bw, de_cr, de_tx_power)
+        # try 3 times to change the RF config to fit the endpoint configuration
+        for i in range(3):
+            if await self.connector.change_rf_config(frequency=de_freq, sf=de_sf, bw=de_bw, cr=de_cr, tx_power=de_tx_power):
+                await asyncio.sleep(1)
+                for i in range(3):
+                    rf_params = await self.connector.get_rf_config(refresh=True)
+                    if rf_params:
+                        if self.rf_config_matches(digital_endpoint, rf_params):
+                            return True
+                        break
+                    await asyncio.sleep(1)
+            await asyncio.sleep(1)
+        if self.debug:
+            print("Failed to change RF configuration")
+        return False
+
+    async def listen_to_endpoint(self, digital_endpoint: Digital_Endpoint, listening_time=None,
+                                 print_file=False, save_file=False, one_file=False):
+        stop = False
+        mac, save_to, window_size = self.start_listening(digital_endpoint)
+
+        if not await self.prepare_connector(digital_endpoint):
+            if self.debug:
+                print("Connector not ready for endpoint: ", mac)
+            return False
+        self.load_link(digital_endpoint)
+
+        end_time = self.listening_end(listening_time)
+
+        while time() < end_time:
+            t0 = time()
+
+            try:
+                packet_request = self.create_request(mac, digital_endpoint.get_mesh(), digital_endpoint.get_sleep())
+
+                if self.probe_due(digital_endpoint):
+                    await self.probe_route(packet_request)
+                    t0 = time()
+
+                elif digital_endpoint.state == "REQUEST_DATA_STATE":
+                    metadata, hop = await self.ask_metadata(packet_request, digital_endpoint.fec_repair_chunks)
+                    t0 = time()
+                    self.metadata_received(digital_endpoint, metadata, hop, save_to)
+
+                elif digital_endpoint.state == "PROCESS_CHUNK_STATE" and (window_size > 1 or digital_endpoint.fec_repair_chunks):
+                    chunks = self.window_chunks(digital_endpoint)
+                    if chunks:
+                        received, hop = await self.ask_window(packet_request, chunks)
+                        t0 = time()
+                        file = self.window_received(digital_endpoint, chunks, received, hop, window_size)
+                        if file:
+                            await self.finish_file(digital_endpoint, file, save_to, print_file, save_file)
+                            stop = one_file
+
+                elif digital_endpoint.state == "PROCESS_CHUNK_STATE":
+                    next_chunk = digital_endpoint.get_next_chunk()
+                    if next_chunk is not None:
+                        data, hop = await self.ask_data(packet_request, next_chunk)
+                        t0 = time()
+                        file = self.chunk_received(digital_endpoint, next_chunk, data, hop)
+                        if file:
+                            await self.finish_file(digital_endpoint, file, save_to, print_file, save_file)
+                            stop = one_file
+
+                elif digital_endpoint.state == "OK":
+                    ok, hop = await self.ask_ok(packet_request)
+                    t0 = time()
+                    digital_endpoint.connected(ok, hop, self.mesh_mode, self.pending)
+
+                self.interaction_succeeded()
+
+            except Exception as e:
+                self.interaction_failed(e, mac)
+
+            finally:
+                sleep_time = self.interaction_ended(digital_endpoint, t0)
+                if sleep_time > 0:
+                    await asyncio.sleep(sleep_time)
+
+            if stop or digital_endpoint.is_idle():
+                break
+
+        self.stop_listening(digital_endpoint)
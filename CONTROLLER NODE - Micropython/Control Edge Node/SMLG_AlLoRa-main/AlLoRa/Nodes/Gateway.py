@@ -1,6 +1,7 @@
 from AlLoRa.Nodes.Requester import Requester
 from AlLoRa.Digital_Endpoint import Digital_Endpoint
 from AlLoRa.utils.time_utils import current_time_ms as time, sleep
+from AlLoRa.utils.scheduler_utils import Scheduler
 from AlLoRa.utils.debug_utils import print
 from AlLoRa.utils.os_utils import os
 from os import urandom
@@ -22,14 +23,18 @@ class Gateway(Requester):
         #     "max_timeout": 6,
         #     "result_path": "Results/",
         #     "nodes_file": "Nodes.json",
-        #     "time_per_endpoint": 10
+        #     "time_per_endpoint": 10,
+        #     "schedule_window": 5
         # }
 
         super().__init__(connector,  config_file, debug_hops=debug_hops,
                             NEXT_ACTION_TIME_SLEEP=NEXT_ACTION_TIME_SLEEP)
         self.nodes_file = nodes_file
+        # Endpoints due within this many seconds can be checked ahead of time to avoid changing the RF config
+        self.schedule_window = self.config.get('schedule_window', 0) if self.config else 0
         self.digital_endpoints = []
-        self.add_digital_endpoints(self.nodes_file)
+        if self.nodes_file:     # None: the endpoints are given by a Multi_Gateway
+            self.add_digital_endpoints(self.nodes_file)
 
         self.status["Status"] = "WAIT"  # Status of the requester
         self.status["RSSI"] = "-" # Signal strength
@@ -39,6 +44,8 @@ class Gateway(Requester):
         self.status["SMAC"] = "-"   # Source MAC
         # Digital Endpoint file_reception_info
         self.status["Digital_Endpoints"] = {ep.get_mac_address(): ep.file_reception_info for ep in self.digital_endpoints}
+        # Lateness of the checks of each Digital Endpoint
+        self.status["Schedule"] = {ep.get_mac_address(): ep.schedule_info for ep in self.digital_endpoints}
     
     def set_digital_endpoints(self, digital_endpoints):
         self.digital_endpoints = digital_endpoints
@@ -50,6 +57,7 @@ class Gateway(Requester):
             for node in nodes_config:
                 if node['active']:
                     active_node = Digital_Endpoint(node)
+                    active_node.restore_file(self.result_path + "/" + active_node.get_mac_address())
                     self.digital_endpoints.append(active_node)                                            
                     if self.debug:
                         print("Node {} ({}) added with frequency {}s and listening time {}s.".format(active_node.get_name(), active_node.get_mac_address(), active_node.asking_frequency, active_node.listening_time))
@@ -59,41 +67,71 @@ class Gateway(Requester):
                 print("Could not load nodes from file: {}, error: {}".format(path, e))
             return False
 
+    def schedule_endpoint(self, scheduler, ep, after):
+        jitter = ep.asking_jitter * 1000 * int.from_bytes(urandom(2), "little") / 2**16
+        due = after + jitter
+        scheduler.schedule(ep.get_mac_address(), due, due + ep.get_deadline() * 1000, ep.get_rf_profile())
+
     def check_digital_endpoints(self, print_file_content=False, save_files=False):
         print("Listening to {} endpoints!".format(len(self.digital_endpoints)))
-        next_check_times = {ep.get_mac_address(): 0 for ep in self.digital_endpoints}
+        scheduler = self.start_schedule()
+        rf_profile = None   # RF profile of the last endpoint checked, endpoints sharing it go first
 
         while True:
-            current_time = time()   # Current time in miliseconds
-            for ep in sorted(self.digital_endpoints, key=lambda x: next_check_times[x.get_mac_address()]):
-                if current_time >= next_check_times[ep.get_mac_address()]:
-                    try:
-                        # Initial listening session for the endpoint
-                        if self.debug:
-                            print("Listening to endpoint {} ({}) for {}s".format(ep.get_name(), ep.get_mac_address(), ep.listening_time))
-
-                        self.listen_to_endpoint(ep, ep.listening_time,
-                                                print_file=print_file_content, save_file=save_files)
-                        
-                        self.update_subscribers(ep)
-                        # Check if additional time is needed due to incomplete file transfer
-                        if ep.get_current_file() is not None:
-                            if ep.lock_on_file_receive and ep.get_current_file().get_missing_chunks():
-                                # Extend the listening for one additional period if there are missing chunks
-                                if self.debug:
-                                    print("Listening to endpoint {} ({}) for {}s due to missing chunks".format(ep.get_name(), ep.get_mac_address(), ep.max_listen_time_when_locked))
-                                self.listen_to_endpoint(ep, ep.max_listen_time_when_locked,
-                                                        print_file=print_file_content, save_file=save_files)
-                                self.update_subscribers(ep)
-
-                    except Exception as e:
-                        if self.debug:
-                            print("Error listening to endpoint {} ({}): {}".format(ep.get_name(), ep.get_mac_address(), e))
-                    finally:
-                        # Reschedule next check regardless of success or error
-                        next_check_times[ep.get_mac_address()] = time() + ep.asking_frequency
-
-                sleep(self.NEXT_ACTION_TIME_SLEEP)
+            ep, wait = self.next_endpoint(scheduler, rf_profile)
+            if ep is None:
+                sleep(wait)
+                continue
+            rf_profile = ep.get_rf_profile()
+            self.check_endpoint(ep, print_file_content, save_files)
+            # Reschedule next check regardless of success or error
+            self.schedule_endpoint(scheduler, ep, time() + ep.next_check() * 1000)
+
+    def start_schedule(self):
+        scheduler = Scheduler()
+        self.scheduled_endpoints = {ep.get_mac_address(): ep for ep in self.digital_endpoints}
+        now = time()
+        for ep in self.digital_endpoints:
+            self.schedule_endpoint(scheduler, ep, now)
+        return scheduler
+
+    # Returns (endpoint to check, None) or (None, seconds to sleep until the next one is due)
+    def next_endpoint(self, scheduler, rf_profile):
+        current_time = time()   # Current time in miliseconds
+        entry = scheduler.pop_due(current_time + self.schedule_window * 1000, rf_profile)
+        if entry is None:
+            next_due = scheduler.next_due()
+            return None, (next_due - current_time) / 1000 if next_due is not None else self.NEXT_ACTION_TIME_SLEEP
+
+        mac, due, deadline = entry
+        ep = self.scheduled_endpoints[mac]
+        ep.record_check(max(current_time - due, 0) / 1000, current_time > deadline)
+        return ep, None
+
+    def check_endpoint(self, ep, print_file_content=False, save_files=False):
+        mac = ep.get_mac_address()
+        try:
+            # Initial listening session for the endpoint
+            if self.debug:
+                print("Listening to endpoint {} ({}) for {}s, {}s late".format(ep.get_name(), mac, ep.listening_time, ep.schedule_info["last_lateness"]))
+
+            self.listen_to_endpoint(ep, ep.listening_time,
+                                    print_file=print_file_content, save_file=save_files)
+
+            self.update_subscribers(ep)
+            # Check if additional time is needed due to incomplete file transfer
+            if ep.get_current_file() is not None:
+                if ep.lock_on_file_receive and not ep.get_current_file().is_complete():
+                    # Extend the listening for one additional period if there are missing chunks
+                    if self.debug:
+                        print("Listening to endpoint {} ({}) for {}s due to missing chunks".format(ep.get_name(), mac, ep.max_listen_time_when_locked))
+                    self.listen_to_endpoint(ep, ep.max_listen_time_when_locked,
+                                            print_file=print_file_content, save_file=save_files)
+                    self.update_subscribers(ep)
+
+        except Exception as e:
+            if self.debug:
+                print("Error listening to endpoint {} ({}): {}".format(ep.get_name(), mac, e))
 
     def update_subscribers(self, digital_endpoint):
         self.status["Digital_Endpoints"][digital_endpoint.get_mac_address()] = digital_endpoint.file_reception_info
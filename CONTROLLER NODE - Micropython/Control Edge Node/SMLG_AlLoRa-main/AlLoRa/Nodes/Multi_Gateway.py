@@ -0,0 +1,126 @@
+import _thread
+
+from AlLoRa.Nodes.Gateway import Gateway
+from AlLoRa.utils.time_utils import current_time_ms as time, sleep, start_thread
+from AlLoRa.utils.scheduler_utils import Scheduler
+from AlLoRa.utils.debug_utils import print
+
+
+class Multi_Gateway:
+    """
+    Gateway over several radios (e.g. one Serial_connector per adapter), each
+    one driven by its own Gateway in its own thread.
+
+    All the radios take the due endpoints from a single scheduler. A radio
+    prefers the endpoints with its current RF profile, so each radio keeps
+    the endpoints of its frequency/SF, and when it has none due it takes the
+    most urgent one left and retunes. A channel (frequency, SF, bandwidth) is
+    only used by one radio at a time, otherwise both would collide, so the
+    polling throughput grows with the radios as long as the endpoints are
+    spread over several channels.
+
+    The status of the radios is merged in status (the endpoints, their
+    schedule, and the status of each radio under "Radios", by MAC), and every
+    update of any of them is passed on to the subscribers.
+    """
+
+    def __init__(self, radios, nodes_file="Nodes.json", debug_hops=False, NEXT_ACTION_TIME_SLEEP=0.1):
+        # radios: list of (connector, config_file) pairs, one per radio.
+        # The first config_file gives the result_path and schedule_window of all of them.
+        self.gateways = [Gateway(connector, config_file, debug_hops=debug_hops,
+                                 NEXT_ACTION_TIME_SLEEP=NEXT_ACTION_TIME_SLEEP, nodes_file=None)
+                         for connector, config_file in radios]
+        primary = self.gateways[0]
+        self.debug = primary.debug
+        self.result_path = primary.result_path
+        self.schedule_window = primary.schedule_window
+        self.NEXT_ACTION_TIME_SLEEP = NEXT_ACTION_TIME_SLEEP
+        for gateway in self.gateways:
+            gateway.result_path = self.result_path
+            gateway.register_subscriber(self)
+
+        primary.add_digital_endpoints(nodes_file)
+        self.digital_endpoints = primary.digital_endpoints
+        self.scheduler = Scheduler()
+        self.lock = _thread.allocate_lock()         # Scheduler and channels in use
+        self.status_lock = _thread.allocate_lock()  # Subscriber updates from several radios
+        self.busy_channels = {}     # Gateway index -> channel (freq, sf, bw) it is polling
+
+        self.subscribers = []
+        self.status = {}
+        self.status["Status"] = "WAIT"
+        self.status["RSSI"] = "-"
+        self.status["SNR"] = "-"
+        self.status["Chunk"] = "-"
+        self.status["File"] = "-"
+        self.status["SMAC"] = "-"
+        self.status["Radios"] = {gateway.MAC: gateway.status for gateway in self.gateways}
+        self.status["Digital_Endpoints"] = {ep.get_mac_address(): ep.file_reception_info for ep in self.digital_endpoints}
+        self.status["Schedule"] = {ep.get_mac_address(): ep.schedule_info for ep in self.digital_endpoints}
+
+    def register_subscriber(self, subscriber):
+        if subscriber not in self.subscribers:
+            self.subscribers.append(subscriber)
+
+    def unregister_subscriber(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+
+    def notify_subscribers(self):
+        for subscriber in self.subscribers:
+            subscriber.update(self.status)
+
+    # Subscriber of every radio: the last update of any of them is the current one
+    def update(self, radio_status):
+        with self.status_lock:
+            for key in ("Status", "RSSI", "SNR", "Chunk", "File", "SMAC"):
+                if key in radio_status:
+                    self.status[key] = radio_status[key]
+            self.notify_subscribers()
+
+    def check_digital_endpoints(self, print_file_content=False, save_files=False):
+        print("Listening to {} endpoints with {} radios!".format(len(self.digital_endpoints), len(self.gateways)))
+        now = time()
+        with self.lock:
+            for ep in self.digital_endpoints:
+                self.gateways[0].schedule_endpoint(self.scheduler, ep, now)
+        for index in range(1, len(self.gateways)):
+            start_thread(lambda index=index: self.run_radio(index, print_file_content, save_files))
+        self.run_radio(0, print_file_content, save_files)
+
+    def run_radio(self, index, print_file_content=False, save_files=False):
+        gateway = self.gateways[index]
+        connector = gateway.connector
+        endpoints = {ep.get_mac_address(): ep for ep in self.digital_endpoints}
+        # Starts with the endpoints of the RF profile the radio is configured with
+        rf_profile = (connector.frequency, connector.sf, connector.bw, connector.cr, connector.tx_power)
+
+        def allow(profile):
+            return profile[:3] not in self.busy_channels.values()
+
+        while True:
+            with self.lock:
+                current_time = time()
+                entry = self.scheduler.pop_due(current_time + self.schedule_window * 1000, rf_profile, allow)
+                if entry is None:
+                    next_due = self.scheduler.next_due()
+                else:
+                    ep = endpoints[entry[0]]
+                    rf_profile = ep.get_rf_profile()
+                    self.busy_channels[index] = rf_profile[:3]
+            if entry is None:
+                # Sleep until the next endpoint is due, or a bit if its channel is in use
+                wait = (next_due - current_time) / 1000 if next_due is not None else 0
+                sleep(max(wait, self.NEXT_ACTION_TIME_SLEEP))
+                continue
+
+            mac, due, deadline = entry
+            ep.record_check(max(current_time - due, 0) / 1000, current_time > deadline)
+            if self.debug:
+                print("Radio {} ({}): endpoint {} ({})".format(index, gateway.MAC, ep.get_name(), mac))
+            try:
+                gateway.check_endpoint(ep, print_file_content, save_files)
+            finally:
+                with self.lock:
+                    del self.busy_channels[index]
+                    gateway.schedule_endpoint(self.scheduler, ep, time() + ep.next_check() * 1000)
@@ -3,6 +3,10 @@ from AlLoRa.Connectors.Connector import Connector
 from AlLoRa.utils.debug_utils import print
 from AlLoRa.utils.os_utils import os 
 from AlLoRa.utils.json_utils import json
+from AlLoRa.utils.id_cache_utils import IDCache
+from AlLoRa.utils.route_utils import RouteTable
+from AlLoRa.utils.forward_utils import ForwardPolicy
+from AlLoRa.utils.time_utils import current_time_ms as time
 
 from os import urandom
 from json import loads, dumps
@@ -14,9 +18,12 @@ class Node:
         self.open_backup()
         self.connector = connector
 
-        self.LAST_IDS = list()              # IDs from my mesagges
-        self.LAST_SEEN_IDS = list()         # IDs from others
-        self.MAX_IDS_CACHED = 30            # Max number of IDs saved
+        # Mesh IDs of my messages and of the ones seen from others, by source
+        self.ids = IDCache(self.id_cache_size)
+        # Paths learned from the route probes heard, to forward only on the way to their destination
+        self.routes = RouteTable(self.route_timeout * 1000)
+        # Backoff before forwarding, cancelled if other nodes forward the packet meanwhile
+        self.forwarding = ForwardPolicy(self.forward_copies, self.forward_backoff)
 
         self.sf_trial = None
 
@@ -44,6 +51,12 @@ class Node:
         self.status["TimePR"] = "-"    # Waiting time for response
         self.status["TimeBtw"] = "-"  # Time between reply
         self.status["CorruptedPackets"] = 0  # Number of corrupted packets
+        self.status["RTT"] = self.connector.rtt.peers  # Response time estimates per peer MAC (see rtt_utils)
+        self.status["Airtime"] = self.connector.airtime.status     # Airtime per sub-band in the last hour (see airtime_utils)
+        self.status["IDCache"] = self.ids.status   # Size, hits, misses, evictions and expirations of the mesh IDs
+        self.status["Routes"] = self.routes.status  # Paths known and packets routed, flooded and dropped (see route_utils)
+        self.status["Forwarding"] = self.forwarding.status  # Packets forwarded and suppressed, copies heard (see forward_utils)
+        self.update_id_age()
 
 
     def open_backup(self):
@@ -55,6 +68,20 @@ class Node:
         self.mesh_mode = self.config.get('mesh_mode', False)
         self.short_mac = self.config.get('short_mac', False)
         self.chunk_size = self.config.get('chunk_size', 235)
+        self.window_size = self.config.get('window_size', 1)     # Chunks per request, 1 -> stop-and-wait
+        self.window_gap = self.config.get('window_gap', 0.01)    # Seconds between chunks streamed in a window
+        self.compression = self.config.get('compression', False)   # Source: send files as zlib streams when smaller
+        self.file_backup = self.config.get('file_backup', None)    # Source: path prefix to keep the current file across reboots
+        self.checksum = self.config.get('checksum', Packet.SHA256)   # sha256 (legacy), crc24 or crc24_rom
+        self.id_cache_size = self.config.get('id_cache_size', IDCache.CAPACITY)    # Mesh IDs remembered
+        self.id_cache_toas = self.config.get('id_cache_toas', 60)  # Mesh IDs expire after this many max-length ToAs
+        self.routing = self.config.get('routing', False)    # Forward along learned routes, False floods every packet
+        self.route_timeout = self.config.get('route_timeout', 120)  # s a path is kept, probed again after half of it
+        self.forward_copies = self.config.get('forward_copies', 2)  # Copies heard that cancel a forward, 0 never cancels
+        self.forward_backoff = self.config.get('forward_backoff', 4)    # Forward backoff of up to twice this many ToAs
+        if not Packet.set_checksum(self.checksum):
+            print("Unknown checksum {}, using {}".format(self.checksum, Packet.CHECKSUM))
+            self.checksum = Packet.CHECKSUM
 
         self.config_connector_dic = self.config.get('connector', None)    #{"freq" : lora_config['freq'], "sf": lora_config['sf']}
         self.config_connector_dic['mesh_mode'] = self.mesh_mode
@@ -68,6 +95,17 @@ class Node:
                 "chunk_size": self.chunk_size,
                 "mesh_mode": self.mesh_mode,
                 "short_mac": self.short_mac,
+                "checksum": self.checksum,
+                "window_size": self.window_size,
+                "window_gap": self.window_gap,
+                "compression": self.compression,
+                "file_backup": self.file_backup,
+                "id_cache_size": self.id_cache_size,
+                "id_cache_toas": self.id_cache_toas,
+                "routing": self.routing,
+                "route_timeout": self.route_timeout,
+                "forward_copies": self.forward_copies,
+                "forward_backoff": self.forward_backoff,
                 "debug": self.debug,
                 "connector" : self.connector.backup_config()}
         with open(self.config_file, "w") as f:
@@ -86,23 +124,28 @@ class Node:
     def is_for_me(self, packet: Packet):
         return packet.get_destination() == self.MAC
 
+    # The IDs are remembered for as long as copies of a packet can keep arriving,
+    # which grows with the airtime of a packet (SF, bandwidth)
+    def update_id_age(self):
+        self.ids.max_age = self.id_cache_toas * self.connector.packet_toa(Connector.MAX_LENGTH_MESSAGE) * 1000
+
+    # New ID for a message of mine, not used by me in the last ones
     def generate_id(self):
-        id = -1
-        while (id in self.LAST_IDS) or (id == -1):
+        now = time()
+        id = int.from_bytes(urandom(2), 'little')
+        while not self.ids.add(self.MAC, id, now):
             id = int.from_bytes(urandom(2), 'little')
-        self.LAST_IDS.append(id)
-        self.LAST_IDS = self.LAST_IDS[-self.MAX_IDS_CACHED:]
         return id
 
-    def check_id_list(self, id):
-        if id in self.LAST_SEEN_IDS:
-            return False
-        self.LAST_SEEN_IDS.append(id)
-        self.LAST_SEEN_IDS = self.LAST_SEEN_IDS[-self.MAX_IDS_CACHED:]
-        return True
+    # Remembers the ID of a packet from source, returns False if it was already seen
+    def check_id_list(self, id, source=None):
+        return self.ids.add(source, id, time())
+
+    def id_seen(self, id, source=None):
+        return self.ids.contains(source, id, time())
 
     def send_lora(self, packet):
-        return self.connector.send(packet)
+        return self.connector.transmit(packet)
 
     def change_rf_config(self, new_config):
         print("Changing RF Config to: ", new_config)
@@ -127,6 +170,7 @@ class Node:
             
         if changed:
             self.sf_trial = 15
+            self.update_id_age()
             self.status["Freq"] = self.connector.frequency
             self.status["SF"] = self.connector.sf
             self.status["BW"] = self.connector.bw
@@ -135,7 +179,7 @@ class Node:
             return True
         return False
 
-    def calculate_max_chunk_size(self):
+    def calculate_max_chunk_size(self, indexed=False):
         if self.mesh_mode:
             if self.short_mac:
                 header_size = Packet.HEADER_SIZE_MESH_SM
@@ -148,6 +192,9 @@ class Node:
             else:
                 header_size = Packet.HEADER_SIZE_P2P_LM
             #header_size = Packet.HEADER_SIZE_P2P
+        # Chunks streamed in a window carry their index
+        if indexed or self.window_size > 1:
+            header_size += Packet.CHUNK_INDEX_SIZE
         return self.connector.get_max_payload_size() - header_size
 
     def restore_rf_config(self):
@@ -6,6 +6,12 @@ from AlLoRa.utils.debug_utils import print
 from AlLoRa.utils.os_utils import os
 
 class Requester(Node):
+    LOSS_ALPHA = 0.1    # Weight of the last request in the loss rate of a link
+    STREAM_MARGIN = 0.2     # s added to the time of each chunk streamed in a window
+    STREAM_SILENCE = 2      # Chunk slots without hearing the Source that end a window
+    # Attributes of the pacing between requests, kept by endpoint
+    PACING = ("NEXT_ACTION_TIME_SLEEP", "observed_min_sleep", "minimum_sleep_found", "sleep_just_decreased",
+              "last_sleep_time", "successful_interactions_count", "failure_count")
 
     def __init__(self, connector = None, config_file = "LoRa.json", 
                     debug_hops = False, 
@@ -16,6 +22,10 @@ class Requester(Node):
         gc.enable()
         
         self.debug_hops = debug_hops
+        self.pending = None     # (files, bytes) the Source announced in its last OK reply, None if it didn't
+        self.link = None        # Link state of the endpoint being listened to (Digital_Endpoint.link)
+        self.probed = {}        # MAC -> last route probe sent to it (ms), see probe_route
+        self.unanswered = 0     # Requests in a row without a response
 
         self.min_sleep_time, self.max_sleep_time = self.calculate_sleep_time_bounds()
         self.NEXT_ACTION_TIME_SLEEP = self.min_sleep_time
@@ -83,6 +93,11 @@ class Requester(Node):
 
     #     return response_packet
     def send_request(self, packet: Packet) -> Packet:
+        self.start_request(packet)
+        # Get the response from the connector
+        return self.request_result(*self.connector.send_and_wait_response(packet))
+
+    def start_request(self, packet: Packet):
         if self.mesh_mode:
             packet.set_id(self.generate_id())
             if self.debug_hops:
@@ -91,9 +106,8 @@ class Requester(Node):
         self.time_since_last_request = time() - self.time_request
         self.time_request = time()
 
-        # Get the response from the connector
-        response_packet, packet_size_sent, packet_size_received, time_pr = self.connector.send_and_wait_response(packet)
-
+    def request_result(self, response_packet, packet_size_sent, packet_size_received, time_pr):
+        self.unanswered = self.unanswered + 1 if isinstance(response_packet, dict) else 0
         if self.subscribers:
             self.status['PSizeS'] = packet_size_sent
             self.status['PSizeR'] = packet_size_received
@@ -120,18 +134,57 @@ class Requester(Node):
     def ask_ok(self, packet: Packet):
         packet.set_ok()
         response_packet = self.send_request(packet)
+        self.pending = self.pending_result(response_packet)
+        return self.ok_result(response_packet)
+
+    # A debug_hops OK flooded to a mesh Source: the nodes that hear its answer learn
+    # whether they are on the path to it (see route_utils)
+    def probe_route(self, packet: Packet):
+        packet.set_ok()
+        packet.enable_debug_hops()
+        return self.send_request(packet) is not None
+
+    # A path answered late to a route probe, not a response to the request sent
+    def probe_answer(self, response_packet):
+        return response_packet is not None and response_packet.get_debug_hops() and not self.debug_hops
+
+    # Whether to probe the route to a mesh Source now: every route_timeout / 2 s when
+    # routing, and after max_failures requests in a row without an answer (a broken path)
+    def probe_due(self, digital_endpoint: Digital_Endpoint):
+        if not (self.routing and self.mesh_mode and digital_endpoint.get_mesh()):
+            return False
+        mac = digital_endpoint.get_mac_address()
+        if mac in self.probed and time() - self.probed[mac] < self.route_timeout * 500 and \
+                self.unanswered < self.max_failures:
+            return False
+        self.probed[mac] = time()
+        self.unanswered = 0
+        return True
+
+    def pending_result(self, response_packet):
+        if response_packet is None or response_packet.get_command() != Packet.OK:
+            return None
+        return response_packet.get_pending()
+
+    def ok_result(self, response_packet):
+        if self.probe_answer(response_packet):
+            return None, None
         if self.save_hops(response_packet):
-            return  (1, "hop_catch.json"), response_packet.get_hop()
+            return  (1, "hop_catch.json", {}), response_packet.get_hop()
         if response_packet.get_command() == Packet.OK:
             hop = response_packet.get_hop()
             return True, hop
         return None, None
 
-    def ask_metadata(self, packet: Packet):
-        packet.ask_metadata()
-        response_packet = self.send_request(packet)
+    def ask_metadata(self, packet: Packet, fec_repair_chunks=0):
+        packet.ask_metadata(fec_repair_chunks)
+        return self.metadata_result(self.send_request(packet))
+
+    def metadata_result(self, response_packet):
+        if self.probe_answer(response_packet):
+            return None, None
         if self.save_hops(response_packet):
-            return  (1, "hop_catch.json"), response_packet.get_hop()
+            return  (1, "hop_catch.json", {}), response_packet.get_hop()
         if response_packet.get_command() == Packet.METADATA:
             try:
                 metadata = response_packet.get_metadata()
@@ -140,14 +193,18 @@ class Requester(Node):
                 filename = metadata["FILENAME"]
                 if self.subscribers:
                     self.status['File'] = filename
-                return (length, filename), hop
+                return (length, filename, metadata), hop
             except:
                 return None, None
         return None, None
 
     def ask_data(self, packet: Packet, next_chunk):
         packet.ask_data(next_chunk)
-        response_packet = self.send_request(packet)
+        return self.data_result(self.send_request(packet))
+
+    def data_result(self, response_packet):
+        if self.probe_answer(response_packet):
+            return None, None
         if self.save_hops(response_packet):
             return b"0", response_packet.get_hop()
         if response_packet.get_command() == Packet.DATA:
@@ -155,7 +212,7 @@ class Requester(Node):
                 chunk = response_packet.get_payload()
                 if self.mesh_mode:
                     id = response_packet.get_id()
-                    if not self.check_id_list(id):
+                    if not self.check_id_list(id, response_packet.get_source()):
                         return None, None
                     hop = response_packet.get_hop()
                     if self.debug and hop:
@@ -172,17 +229,103 @@ class Requester(Node):
                 return None, None
         return None, None
 
+    # Windowed request: asks for several chunks at once and collects the
+    # indexed DATA packets that the Source streams back.
+    # A lost chunk (the first one included) doesn't end the window: the
+    # Requester keeps listening while the Source may still be streaming, so
+    # its next request doesn't collide with the rest of the stream.
+    def ask_window(self, packet: Packet, chunks):
+        packet.ask_window(chunks)
+        response_packet = self.send_request(packet)
+        window = [-1, 0, time() + len(chunks) * self.stream_slot() * 1000]
+        received = []
+        hop = None
+        while True:
+            hop = self.window_heard(window, packet, chunks, response_packet, received, hop)
+            if self.window_done(window, chunks):
+                break
+            response_packet = self.receive_window_packet()
+        return received, hop
+
+    # Seconds between the chunks streamed in a window: the ToA of a full packet, the gap and a margin
+    def stream_slot(self):
+        return self.connector.response_toa + self.window_gap + self.STREAM_MARGIN
+
+    # window: [last chunk heard, chunk slots without hearing anything, deadline (ms)]
+    def window_heard(self, window, packet: Packet, chunks, response_packet, received, hop):
+        if response_packet is None:
+            window[1] += 1
+            return hop
+        window[1] = 0
+        order, hop = self.window_result(packet, chunks, response_packet, received, hop)
+        if order is not None:
+            window[0] = max(window[0], order)
+        return hop
+
+    # Whether nothing else of the window can come: its last chunk was heard, the
+    # Source was silent for the chunks left (up to STREAM_SILENCE), or it is late
+    def window_done(self, window, chunks):
+        left = len([chunk for chunk in chunks if chunk > window[0]])
+        return window[1] >= min(self.STREAM_SILENCE, left) or time() > window[2]
+
+    # Adds the chunk of a streamed packet to received, returns (its index, None if it is not one, hop)
+    def window_result(self, packet: Packet, chunks, response_packet, received, hop):
+        if response_packet.check and response_packet.get_command() == Packet.DATA and \
+                response_packet.get_source() == packet.get_destination() and not response_packet.get_debug_hops():
+            if not self.mesh_mode or self.check_id_list(response_packet.get_id(), response_packet.get_source()):
+                order, chunk = response_packet.get_indexed_data()
+                if order in chunks:
+                    received.append((order, chunk))
+                    hop = hop or response_packet.get_hop()
+                    if self.debug:
+                        print("CHUNK (window): {} - Node: {}".format(order, self.source_mac))
+                return order, hop
+        return None, hop
+
+    # Returns the next packet heard while a window is being streamed, or None
+    # when the Source stopped sending. Callers skip packets that did not load.
+    def receive_window_packet(self):
+        return self.window_packet(self.connector.recv(self.stream_slot()))
+
+    def window_packet(self, data):
+        if not data:
+            return None
+        packet = Packet(self.mesh_mode, self.short_mac)
+        try:
+            if not packet.load(data):
+                self.status['CorruptedPackets'] += 1
+        except Exception as e:
+            if self.debug:
+                print("WINDOW LOAD ERROR: {} Node {}".format(e, self.source_mac))
+            self.status['CorruptedPackets'] += 1
+        return packet
+
+    def finish_file(self, digital_endpoint: Digital_Endpoint, file, save_to, print_file, save_file):
+        final_ok = self.final_ok(digital_endpoint)
+        sleep(1)
+        # The Source answers with the data it has left
+        digital_endpoint.set_pending(self.pending_result(self.send_request(final_ok)))
+        self.file_finished(file, save_to, print_file, save_file)
+
+    def final_ok(self, digital_endpoint: Digital_Endpoint):
+        final_ok = self.create_request(digital_endpoint.get_mac_address(), digital_endpoint.get_mesh(), digital_endpoint.get_sleep())
+        final_ok.set_ok()
+        final_ok.set_source(self.connector.get_mac())
+        if self.mesh_mode:
+            final_ok.set_id(self.generate_id())
+        return final_ok
+
+    def file_finished(self, file, save_to, print_file, save_file):
+        self.status['Chunk'] = "DONE"
+        if print_file:
+            print(file.get_content())
+        if save_file:
+            file.save(save_to)
+
     def listen_to_endpoint(self, digital_endpoint: Digital_Endpoint, listening_time=None,
                        print_file=False, save_file=False, one_file=False):
         stop = False
-
-        mac = digital_endpoint.get_mac_address()
-        self.source_mac = mac
-
-        if self.subscribers:
-            self.status['SMAC'] = mac
-        save_to = self.result_path + "/" + mac
-        sleep_mesh = digital_endpoint.get_sleep()
+        mac, save_to, window_size = self.start_listening(digital_endpoint)
 
         connector_ok = self.prepare_connector(digital_endpoint)
 
@@ -190,26 +333,40 @@ class Requester(Node):
             if self.debug:
                 print("Connector not ready for endpoint: ", mac)
             return False
+        self.load_link(digital_endpoint)
 
-        t0 = time()
-        if listening_time is None:
-            listening_time = float('inf')
-        end_time = t0 + (listening_time * 1000)
+        end_time = self.listening_end(listening_time)
         
         while time() < end_time:
             t0 = time()
             
             try:
-                packet_request = self.create_request(mac, digital_endpoint.get_mesh(), sleep_mesh)
+                packet_request = self.create_request(mac, digital_endpoint.get_mesh(), digital_endpoint.get_sleep())
 
-                if digital_endpoint.state == "REQUEST_DATA_STATE":
+                if self.probe_due(digital_endpoint):
                     if self.debug:
-                        print("ASKING METADATA to {}".format(mac))
-                    metadata, hop = self.ask_metadata(packet_request)
+                        print("PROBING ROUTE to {}".format(mac))
+                    self.probe_route(packet_request)
                     t0 = time()
-                    digital_endpoint.set_metadata(metadata, hop, self.mesh_mode, save_to)
+
+                elif digital_endpoint.state == "REQUEST_DATA_STATE":
                     if self.debug:
-                        print("METADATA from {}: {}".format(mac, metadata))
+                        print("ASKING METADATA to {}".format(mac))
+                    metadata, hop = self.ask_metadata(packet_request, digital_endpoint.fec_repair_chunks)
+                    t0 = time()
+                    self.metadata_received(digital_endpoint, metadata, hop, save_to)
+
+                elif digital_endpoint.state == "PROCESS_CHUNK_STATE" and (window_size > 1 or digital_endpoint.fec_repair_chunks):
+                    chunks = self.window_chunks(digital_endpoint)
+                    if chunks:
+                        if self.debug:
+                            print("ASKING CHUNKS: {} to {}".format(chunks, mac))
+                        received, hop = self.ask_window(packet_request, chunks)
+                        t0 = time()
+                        file = self.window_received(digital_endpoint, chunks, received, hop, window_size)
+                        if file:
+                            self.finish_file(digital_endpoint, file, save_to, print_file, save_file)
+                            stop = one_file
 
                 elif digital_endpoint.state == "PROCESS_CHUNK_STATE":
                     next_chunk = digital_endpoint.get_next_chunk()
@@ -218,91 +375,199 @@ class Requester(Node):
                             print("ASKING CHUNK: {} to {}".format(next_chunk, mac))
                         data, hop = self.ask_data(packet_request, next_chunk)
                         t0 = time()
-                        self.status['Chunk'] = digital_endpoint.file_reception_info["total_chunks"] - next_chunk
-                        file = digital_endpoint.set_data(data, hop, self.mesh_mode)
+                        file = self.chunk_received(digital_endpoint, next_chunk, data, hop)
                         if file:
-                            final_ok = self.create_request(mac, digital_endpoint.get_mesh(), sleep_mesh)
-                            final_ok.set_ok()
-                            final_ok.set_source(self.connector.get_mac())
-                            sleep(1)
-                            self.send_lora(final_ok)
-                            self.status['Chunk'] = "DONE"
-                            if print_file:
-                                print(file.get_content())
-                            if save_file:
-                                file.save(save_to)
-                            if one_file:
-                                stop = True
+                            self.finish_file(digital_endpoint, file, save_to, print_file, save_file)
+                            stop = one_file
 
                 elif digital_endpoint.state == "OK":
                     if self.debug:
                         print("ASKING OK to {}".format(mac))
                     ok, hop = self.ask_ok(packet_request)
                     t0 = time()
-                    digital_endpoint.connected(ok, hop, self.mesh_mode)
-
-                if self.sf_trial:
-                    if self.debug:
-                        print("SF Trial ended successfully")
-                    self.sf_trial = False
-                    self.backup_config()
+                    digital_endpoint.connected(ok, hop, self.mesh_mode, self.pending)
 
-                self.successful_interactions_count += 1
-                if self.successful_interactions_count >= self.successful_interactions_required:
-                    self.last_sleep_time = self.NEXT_ACTION_TIME_SLEEP
-                    self.decrease_sleep_time()
-                    self.sleep_just_decreased = True
-                    self.failure_count = 0
+                self.interaction_succeeded()
 
             except Exception as e:
-                if self.debug:
-                    print("LISTEN_TO_ENDPOINT ERROR: {} Node {}".format(e, mac))
-                if self.sf_trial:
-                    self.sf_trial -= 1
-                    if self.sf_trial <= 0:
-                        if self.debug:
-                            print("Restoring RF config")
-                        self.restore_rf_config()
-                        self.sf_trial = False
-
-                dt = (time() - t0) / 1000
-                
-                self.increase_sleep_time()
-                self.successful_interactions_count = 0
-                self.failure_count += 1
-                if self.sleep_just_decreased:
-                    self.sleep_just_decreased = False
-                    self.minimum_sleep_found = True
-                    self.NEXT_ACTION_TIME_SLEEP = self.last_sleep_time
-                    self.observed_min_sleep = self.last_sleep_time
-                    if self.debug:
-                        print("Minimum sleep time found: ", self.NEXT_ACTION_TIME_SLEEP)
-                
-                if self.failure_count >= self.max_failures:
-                    self.observed_min_sleep = self.NEXT_ACTION_TIME_SLEEP
-                    if self.debug:
-                        print("Updated minimum sleep time to higher value: ", self.observed_min_sleep)
-                    self.NEXT_ACTION_TIME_SLEEP = self.observed_min_sleep
-                    self.failure_count = 0
+                self.interaction_failed(e, mac)
 
             finally:
-                if self.subscribers:
-                    self.status['Status'] = digital_endpoint.state
-                    self.notify_subscribers()
-
-                gc.collect()
-                dt = (time() - t0) / 1000
-                if self.debug:
-                    print("DT: ", dt, "Sleep time: ", self.NEXT_ACTION_TIME_SLEEP)
-                sleep_time = max(0, self.NEXT_ACTION_TIME_SLEEP)
-                if self.debug:
-                    print("Sleep time: ", sleep_time)
+                sleep_time = self.interaction_ended(digital_endpoint, t0)
                 if sleep_time > 0:
                     sleep(sleep_time)
                 
-                if stop:
+                if stop or digital_endpoint.is_idle():
                     break
-            
+
+        self.stop_listening(digital_endpoint)
+
+    # Steps of listen_to_endpoint that do not talk to the radio, shared with Async_Requester
+
+    def start_listening(self, digital_endpoint: Digital_Endpoint):
+        mac = digital_endpoint.get_mac_address()
+        self.source_mac = mac
+        digital_endpoint.set_pending(None)  # Until the Source tells again in this session
+        if digital_endpoint.link is None:
+            digital_endpoint.restore_link(self.result_path + "/" + mac)
+
+        if self.subscribers:
+            self.status['SMAC'] = mac
+        save_to = self.result_path + "/" + mac
+        window_size = digital_endpoint.window_size or self.window_size
+        return mac, save_to, window_size
+
+    def listening_end(self, listening_time):
+        if listening_time is None:
+            listening_time = float('inf')
+        return time() + (listening_time * 1000)
+
+    def metadata_received(self, digital_endpoint: Digital_Endpoint, metadata, hop, save_to):
+        digital_endpoint.set_metadata(metadata, hop, self.mesh_mode, save_to)
+        if self.debug:
+            print("METADATA from {}: {}".format(digital_endpoint.get_mac_address(), metadata))
+
+    def window_chunks(self, digital_endpoint: Digital_Endpoint):
+        chunks = digital_endpoint.get_next_chunks(digital_endpoint.window)
+        return [c for c in chunks if c - chunks[0] < Packet.MAX_WINDOW_BITMAP * 8]
+
+    # Returns the file if it is complete
+    def window_received(self, digital_endpoint: Digital_Endpoint, chunks, received, hop, window_size):
+        digital_endpoint.update_window(len(chunks), len(received), window_size)
+        if not received:
+            digital_endpoint.set_data(None, hop, self.mesh_mode)
+            raise Exception("No chunk received")
+        file = None
+        for order, data in received:
+            file = digital_endpoint.set_data(data, hop, self.mesh_mode, order) or file
+        self.status['Chunk'] = digital_endpoint.get_current_file().missing_count()
+        return file
+
+    # Returns the file if it is complete
+    def chunk_received(self, digital_endpoint: Digital_Endpoint, next_chunk, data, hop):
+        self.status['Chunk'] = digital_endpoint.file_reception_info["total_chunks"] - next_chunk
+        return digital_endpoint.set_data(data, hop, self.mesh_mode)
+
+    def interaction_succeeded(self):
+        if self.sf_trial:
+            if self.debug:
+                print("SF Trial ended successfully")
+            self.sf_trial = False
+            self.backup_config()
+
+        self.link_result(False)
+        self.successful_interactions_count += 1
+        if self.successful_interactions_count >= self.successful_interactions_required:
+            self.last_sleep_time = self.NEXT_ACTION_TIME_SLEEP
+            self.decrease_sleep_time()
+            self.sleep_just_decreased = True
+            self.failure_count = 0
+
+    def interaction_failed(self, e, mac):
+        if self.debug:
+            print("LISTEN_TO_ENDPOINT ERROR: {} Node {}".format(e, mac))
+        if self.sf_trial:
+            self.sf_trial -= 1
+            if self.sf_trial <= 0:
+                if self.debug:
+                    print("Restoring RF config")
+                self.restore_rf_config()
+                self.sf_trial = False
+
+        self.link_result(True)
+        self.increase_sleep_time()
+        self.successful_interactions_count = 0
+        self.failure_count += 1
+        if self.sleep_just_decreased:
+            self.sleep_just_decreased = False
+            self.minimum_sleep_found = True
+            self.NEXT_ACTION_TIME_SLEEP = self.last_sleep_time
+            self.observed_min_sleep = self.last_sleep_time
+            if self.debug:
+                print("Minimum sleep time found: ", self.NEXT_ACTION_TIME_SLEEP)
+        
+        if self.failure_count >= self.max_failures:
+            self.observed_min_sleep = self.NEXT_ACTION_TIME_SLEEP
+            if self.debug:
+                print("Updated minimum sleep time to higher value: ", self.observed_min_sleep)
+            self.NEXT_ACTION_TIME_SLEEP = self.observed_min_sleep
+            self.failure_count = 0
+
+    # Returns the seconds to sleep before the next request
+    def interaction_ended(self, digital_endpoint: Digital_Endpoint, t0):
+        if self.subscribers:
+            self.status['Status'] = digital_endpoint.state
+            self.notify_subscribers()
+
+        gc.collect()
+        dt = (time() - t0) / 1000
+        if self.debug:
+            print("DT: ", dt, "Sleep time: ", self.NEXT_ACTION_TIME_SLEEP)
+        sleep_time = max(0, self.NEXT_ACTION_TIME_SLEEP)
+        if self.debug:
+            print("Sleep time: ", sleep_time)
+        return sleep_time
+
+    def stop_listening(self, digital_endpoint: Digital_Endpoint):
+        file = digital_endpoint.get_current_file()
+        if file and not file.is_complete():
+            file.save_state()   # Resumable if the gateway restarts before the next session
+        self.save_link(digital_endpoint)
+
+    # Takes up the link state of an endpoint (see Digital_Endpoint.link), so
+    # what was learned listening to another endpoint (e.g. on another SF)
+    # doesn't apply to it: the pacing between requests, and the response
+    # times if the connector has fewer samples of them (e.g. after a restart)
+    def load_link(self, digital_endpoint: Digital_Endpoint):
+        link = digital_endpoint.link
+        if link is None or link["rf_profile"] != list(digital_endpoint.get_rf_profile()):
+            rtt = link["rtt"] if link else None     # The response times don't depend on the RF config
+            link = digital_endpoint.new_link()
+            link["rtt"] = rtt
+        self.link = link
+        if link["pacing"] is None:
+            self.reset_sleep_time()
+        else:
+            for name in self.PACING:
+                setattr(self, name, link["pacing"][name])
+            if self.observed_min_sleep is None:
+                self.observed_min_sleep = float('inf')
+        if link["rtt"]:
+            state = self.connector.rtt.peer(digital_endpoint.get_mac_address())
+            if state["samples"] < link["rtt"]["samples"]:
+                state.update(link["rtt"])
+        if self.debug:
+            print("Link to {}: {}".format(digital_endpoint.get_mac_address(), link))
+
+    # Keeps the link state in the endpoint, and in its folder
+    def save_link(self, digital_endpoint: Digital_Endpoint):
+        link = digital_endpoint.link
+        if link is None or link is not self.link:
+            return
+        pacing = {}
+        for name in self.PACING:
+            pacing[name] = getattr(self, name)
+        if pacing["observed_min_sleep"] == float('inf'):
+            pacing["observed_min_sleep"] = None     # JSON has no infinity
+        link["pacing"] = pacing
+        state = self.connector.rtt.peer(digital_endpoint.get_mac_address())
+        if state["srtt"] is not None:
+            link["rtt"] = {"srtt": state["srtt"], "rttvar": state["rttvar"], "samples": state["samples"]}
+        digital_endpoint.save_link(self.result_path + "/" + digital_endpoint.get_mac_address())
+
+    # A request failed (lost) or got its response
+    def link_result(self, lost):
+        link = self.link
+        if link is None:
+            return
+        if link["loss"] is None:
+            link["loss"] = 1.0 if lost else 0.0
+        else:
+            link["loss"] += self.LOSS_ALPHA * ((1.0 if lost else 0.0) - link["loss"])
+        if not lost:
+            link["rssi"] = self.connector.get_rssi()
+            link["snr"] = self.connector.get_snr()
+
     def save_hops(self, packet):
         if packet is None:
             return False
@@ -450,16 +715,11 @@ class Requester(Node):
     def prepare_connector(self, digital_endpoint):
         if self.debug:
             print("Preparing connector for endpoint: ", digital_endpoint)
-        de_freq = digital_endpoint.freq
-        de_sf = digital_endpoint.sf
-        de_bw = digital_endpoint.bw
-        de_cr = digital_endpoint.cr
-        de_tx_power = digital_endpoint.tx_power
-
-        freq, sf, bw, cr, tx_power = self.connector.get_rf_config()
-        print("Current RF config: ", freq, sf, bw, cr, tx_power)
-        print("Endpoint RF config: ", de_freq, de_sf, de_bw, de_cr, de_tx_power)
-        if de_freq != freq or de_sf != sf or de_bw != bw or de_cr != cr or de_tx_power != tx_power:
+        rf_params = self.connector.get_rf_config()
+        print("Current RF config: ", *rf_params)
+        print("Endpoint RF config: ", *digital_endpoint.get_rf_profile())
+        if not self.rf_config_matches(digital_endpoint, rf_params):
+            de_freq, de_sf, de_bw, de_cr, de_tx_power = digital_endpoint.get_rf_profile()
             if self.debug:
                 print("Changing RF config to: ", de_freq, de_sf, de_bw, de_cr, de_tx_power)
             # try 3 times to change the RF config to fit the endpoint configuration
@@ -468,10 +728,10 @@ class Requester(Node):
                 if success:
                     sleep(1)
                     for i in range(3):
-                        rf_params = self.connector.get_rf_config()
+                        rf_params = self.connector.get_rf_config(refresh=True)
                         if rf_params:
                             # Check that the RF configuration has been changed successfully
-                            if rf_params[0] == de_freq and rf_params[1] == de_sf and rf_params[2] == de_bw and rf_params[3] == de_cr and rf_params[4] == de_tx_power:
+                            if self.rf_config_matches(digital_endpoint, rf_params):
                                 if self.debug:
                                     print("RF configuration changed successfully")
                                 return True
@@ -484,6 +744,9 @@ class Requester(Node):
         if self.debug:
             print("RF config already set to endpoint config")
         return True
+
+    def rf_config_matches(self, digital_endpoint, rf_params):
+        return tuple(rf_params) == digital_endpoint.get_rf_profile()
             
 
 
@@ -1,11 +1,15 @@
 import gc
-from AlLoRa.Nodes.Node import Node, Packet, urandom
+from AlLoRa.Nodes.Node import Node, Packet, Connector, urandom
 from AlLoRa.File import CTP_File
 from AlLoRa.utils.time_utils import get_time, current_time_ms as time, sleep, sleep_ms
 from AlLoRa.utils.debug_utils import print
 from AlLoRa.utils.os_utils import os
+from AlLoRa.utils.json_utils import json
+from AlLoRa.utils.rtt_utils import ANY_PEER
+from AlLoRa.utils.route_utils import DROP, FLOOD, ROUTE
 
 class Source(Node):
+    OVERHEARD_SIZE = 4      # Packets kept while not listening for requests, the oldest are dropped
 
     def __init__(self, connector, config_file = "LoRa.json"):
         super().__init__(connector, config_file)
@@ -18,6 +22,10 @@ class Source(Node):
                 print("Chunk size too big, setting to max: ", self.chunk_size)
 
         self.file = None
+        self.window_queue = []      # Chunks still to stream for the last windowed request
+        self.overheard = []         # (data, RSSI) of the packets heard during a forward backoff, oldest first
+        self.queued = None          # Files waiting after the one set, None if not told (see set_pending)
+        self.next_size = 0          # Bytes of the next of them
 
     def get_chunk_size(self):
         return self.chunk_size
@@ -25,14 +33,98 @@ class Source(Node):
     def got_file(self):     # Check if I have a file to send
         return self.file is not None
 
-    def set_file(self, file : CTP_File):
+    # Files waiting to be sent after the one set (or the next one to set) and
+    # the size of the next of them, announced in the OK replies so the
+    # Gateway doesn't wait for a Source with nothing to send
+    def set_pending(self, files, next_file_size=0):
+        self.queued = files
+        self.next_size = next_file_size
+
+    # (files, bytes of the next one) to announce, None if unknown
+    def get_pending(self):
+        sending = self.file is not None and not self.file.sent
+        if sending:
+            return (self.queued or 0) + 1, self.file.length
+        if self.queued is None:
+            return None
+        return self.queued, self.next_size
+
+    def announce_pending(self, response_packet: Packet):
+        if response_packet.get_change_rf():
+            return      # The payload has the RF config
+        pending = self.get_pending()
+        if pending:
+            response_packet.set_pending(*pending)
+
+    def set_file(self, file : CTP_File, backup=True):
         self.file = file
+        if self.compression:
+            self.file.enable_compression()
+        if backup:
+            self.backup_file()
 
     def restore_file(self, file: CTP_File):
-        self.set_file(file)
+        self.set_file(file, backup=False)
         self.file.first_sent = time()
         self.file.metadata_sent = True
 
+    # Keeps the file being sent in flash (file_backup in LoRa.json), so it can be served again after a reboot
+    def backup_file(self):
+        if not self.file_backup:
+            return
+        try:
+            if not self.file.file_path:     # File-backed files are already in flash
+                with open(self.file_backup + ".bin", "wb") as f:
+                    f.write(self.file.content)
+            self.backup_file_state()
+        except Exception as e:
+            print("Error backing up file: ", e)
+
+    def backup_file_state(self):
+        if not self.file_backup:
+            return
+        try:
+            state = {"name": self.file.get_name(),
+                     "file_path": self.file.file_path,
+                     "chunk_size": self.file.chunk_size,
+                     "compression": self.file.compressed,
+                     "fec_repair_chunks": self.file.fec_repair_chunks}
+            with open(self.file_backup + ".json", "w") as f:
+                f.write(json.dumps(state))
+        except Exception as e:
+            print("Error backing up file state: ", e)
+
+    # File left by backup_file, to be passed to restore_file after establish_connection
+    def get_backup(self):
+        if not self.file_backup:
+            return None
+        try:
+            with open(self.file_backup + ".json", "r") as f:
+                state = json.loads(f.read())
+            if state["file_path"]:
+                file = CTP_File(state["name"], chunk_size=state["chunk_size"], file_path=state["file_path"])
+            else:
+                with open(self.file_backup + ".bin", "rb") as f:
+                    content = f.read()
+                file = CTP_File(state["name"], content, state["chunk_size"])
+            file.compressed = state["compression"]
+            if state["fec_repair_chunks"]:
+                file.enable_fec(state["fec_repair_chunks"])
+            return file
+        except Exception as e:
+            if self.debug:
+                print("No file backup: ", e)
+            return None
+
+    def remove_backup(self):
+        if not self.file_backup:
+            return
+        for extension in (".json", ".bin"):
+            try:
+                os.remove(self.file_backup + extension)
+            except Exception:
+                pass
+
     def send_response(self, response_packet: Packet):
         if response_packet:
             if self.mesh_mode:
@@ -55,9 +147,14 @@ class Source(Node):
     #This function ensures that a received message matches the criteria of any expected message.
     def listen_requester(self):
         packet = Packet(mesh_mode=self.mesh_mode, short_mac=self.short_mac)
-        focus_time = self.connector.adaptive_timeout
+        focus_time = self.connector.response_timeout(ANY_PEER)
         t0 = time()
-        data = self.connector.recv(focus_time)
+        overheard = len(self.overheard) > 0
+        if overheard:
+            data, rssi = self.overheard.pop(0)
+        else:
+            data = self.connector.recv(focus_time)
+            rssi = self.connector.get_rssi()
         self.tr = time() # Get the time when the packet was received
         td = (self.tr - t0) / 1000  # Calculate the time difference in seconds
 
@@ -65,7 +162,7 @@ class Source(Node):
             if self.debug:
                 print("No data received within focus time")
             
-            self.connector.increase_adaptive_timeout()
+            self.connector.response_lost(ANY_PEER)
             return None
 
         try:
@@ -84,10 +181,14 @@ class Source(Node):
         if self.mesh_mode:
             try:
                 packet_id = packet.get_id()  # Check if already forwarded or sent by myself
-                if packet_id in self.LAST_SEEN_IDS or packet_id in self.LAST_IDS:
+                if self.id_seen(packet_id, packet.get_source()):
                     if self.debug:
-                        print("ALREADY_SEEN", self.LAST_SEEN_IDS)
+                        print("ALREADY_SEEN", packet_id)
                     return None
+                if self.routing and packet.get_debug_hops():
+                    path = packet.get_message_path() or []
+                    self.routes.learn_path(packet.get_source(), packet.get_destination(),
+                                           [hop[0] for hop in path], self.name, time())
             except Exception as e:
                 if self.debug:
                     print(e)
@@ -102,7 +203,8 @@ class Source(Node):
             self.status['PSizeR'] = len(data)
             self.status['TimePR'] = td * 1000  # Time in ms
 
-        self.connector.decrease_adaptive_timeout(td)
+        if not overheard:   # Heard during a forward backoff, td is not a wait
+            self.connector.response_received(ANY_PEER, td, len(data))
 
         return packet
 
@@ -125,11 +227,13 @@ class Source(Node):
                         if packet.get_change_rf():
                             new_sf = packet.get_config()
                             response_packet.set_change_rf(new_sf)
+                        self.announce_pending(response_packet)
                         if self.mesh_mode and packet.get_mesh() and packet.get_hop():
                             response_packet.enable_mesh()
                             if not packet.get_sleep():
                                 response_packet.disable_sleep()
                         if packet.get_debug_hops():
+                            response_packet.enable_debug_hops()
                             response_packet.add_previous_hops(packet.get_message_path())
                             response_packet.add_hop(self.name, self.connector.get_rssi(), 0)
 
@@ -162,11 +266,16 @@ class Source(Node):
                 if self.is_for_me(packet=packet):
                     response_packet, new_sf = self.response(packet)
                     self.send_response(response_packet)
+                    if self.window_queue:
+                        self.stream_window(packet)
                     if new_sf:
                         backup_cks = self.chunk_size
                         self.change_rf_config(new_sf)
                         if self.chunk_size != backup_cks:
-                            self.file.change_chunk_size(self.chunk_size)
+                            chunk_size = self.chunk_size
+                            if self.file.fec_repair_chunks:
+                                chunk_size = min(chunk_size, self.calculate_max_chunk_size(indexed=True))
+                            self.file.change_chunk_size(chunk_size)
                 else:
                     self.forward(packet=packet)
             elif self.sf_trial:
@@ -177,6 +286,8 @@ class Source(Node):
 
             if time() - t0 > timeout:
                 last_sent = self.file.last_chunk_sent 
+                self.remove_backup()
+                self.file.close()
                 del(self.file)
                 gc.collect()
                 self.file = None
@@ -187,16 +298,14 @@ class Source(Node):
                     return True
                 return False 
                     
+        self.remove_backup()
+        self.file.close()
         del(self.file)
         gc.collect()
         self.file = None
         return True
 
-    def response(self, packet):
-        command = packet.get_command()
-        if not Packet.check_command(command):
-            return None, None
-
+    def create_response(self, packet):
         response_packet = Packet(mesh_mode=self.mesh_mode, short_mac=self.short_mac)
         response_packet.set_source(self.MAC)
         response_packet.set_destination(packet.get_source())
@@ -206,6 +315,26 @@ class Source(Node):
                 response_packet.enable_mesh()
                 if not packet.get_sleep():
                     response_packet.disable_sleep()
+        return response_packet
+
+    # Sends the rest of the chunks of a windowed request, back to back
+    def stream_window(self, packet):
+        while self.window_queue:
+            requested_chunk = self.window_queue.pop(0)
+            if self.window_gap:
+                sleep(self.window_gap)
+            response_packet = self.create_response(packet)
+            response_packet.set_indexed_data(requested_chunk, self.file.get_chunk(requested_chunk))
+            self.send_response(response_packet)
+            if self.debug:
+                print("RC (window): {} / {}".format(requested_chunk, self.file.get_length()))
+
+    def response(self, packet):
+        command = packet.get_command()
+        if not Packet.check_command(command):
+            return None, None
+
+        response_packet = self.create_response(packet)
 
         new_sf = None
         if self.sf_trial:
@@ -222,8 +351,14 @@ class Source(Node):
             return response_packet, new_sf
 
         if command == Packet.CHUNK:
-            requested_chunk = int(packet.get_payload().decode())
-            response_packet.set_data(self.file.get_chunk(requested_chunk))
+            window = packet.get_window()
+            if window:
+                requested_chunk = window[0]
+                self.window_queue = [c for c in window[1:] if c < self.file.get_length()]
+                response_packet.set_indexed_data(requested_chunk, self.file.get_chunk(requested_chunk))
+            else:
+                requested_chunk = int(packet.get_payload().decode())
+                response_packet.set_data(self.file.get_chunk(requested_chunk))
             if self.subscribers:
                 self.status['Chunk'] = self.file.get_length() - requested_chunk
                 self.status['Status'] = 'CHUNK'
@@ -238,7 +373,15 @@ class Source(Node):
 
         if command == Packet.METADATA:    # handle for new file
             filename = self.file.get_name()
-            response_packet.set_metadata(self.file.get_length(), filename)
+            fec_repair_chunks = packet.get_requested_fec()
+            if fec_repair_chunks and not self.file.first_sent:
+                # The repair chunks are streamed in a window, also with a window_size of 1
+                max_chunk_size = self.calculate_max_chunk_size(indexed=True)
+                if self.file.chunk_size > max_chunk_size:
+                    self.file.change_chunk_size(max_chunk_size)
+                if self.file.enable_fec(fec_repair_chunks):
+                    self.backup_file_state()
+            response_packet.set_metadata(self.file.get_length(), filename, self.file.get_metadata_options())
 
             if self.file.metadata_sent:
                 self.file.retransmission += 1
@@ -262,6 +405,7 @@ class Source(Node):
                 response_packet.set_change_rf(new_sf)
             elif self.file.first_sent and not self.file.last_sent:	# If some chunks are already sent...
                 self.file.sent_ok()
+            self.announce_pending(response_packet)
             return response_packet, new_sf
 
         return response_packet, new_sf
@@ -269,27 +413,76 @@ class Source(Node):
     def forward(self, packet: Packet):
         try:
             if packet.get_mesh():
+                action = FLOOD
+                if self.routing and not packet.get_debug_hops():    # Route probes are flooded
+                    action = self.routes.forward(packet.get_destination(), time())
+                if action == DROP:
+                    self.check_id_list(packet.get_id(), packet.get_source())    # Its copies are dropped too
+                    if self.debug:
+                        print("NOT_ON_ROUTE", packet.get_destination())
+                    return
                 if self.debug:
                     print("FORWARDED", packet.get_content())
                 
+                rssi = self.connector.get_rssi()
                 random_sleep = 0
                 if packet.get_sleep():
-                    random_sleep = (urandom(1)[0] % 5 + 1) * 0.1
-                    
-                if packet.get_debug_hops():
-                    packet.add_hop(self.name, self.connector.get_rssi(), random_sleep)
+                    toa = self.connector.packet_toa(len(packet.get_content()))
+                    if action == ROUTE:     # The only node of its hop on the path, no copies to wait for
+                        random_sleep = toa * urandom(1)[0] / 256
+                    else:
+                        random_sleep = self.forwarding.backoff(rssi, toa, urandom(1)[0] / 256)
+
+                debug_hops = packet.get_debug_hops()
+                if debug_hops:
+                    path = packet.get_message_path()
+                    packet.add_hop(self.name, rssi, random_sleep)
                 packet.enable_hop()
-                if random_sleep:
-                    sleep(random_sleep)
+                packet.close_packet()   # The content of a loaded packet has the old flags and payload
+                if debug_hops and len(packet.get_content()) > Connector.MAX_LENGTH_MESSAGE:
+                    packet.add_previous_hops(path)  # No room for this hop, forwarded with the path so far
+                    packet.close_packet()
+                copies = self.overhear(packet, random_sleep) if random_sleep else 0
+                if not self.forwarding.forward(copies):
+                    self.check_id_list(packet.get_id(), packet.get_source())
+                    if self.debug:
+                        print("SUPPRESSED", packet.get_id())
+                    return
 
                 success = self.send_lora(packet)
                 if success:
-                    self.LAST_SEEN_IDS.append(packet.get_id())
-                    self.LAST_SEEN_IDS = self.LAST_SEEN_IDS[-self.MAX_IDS_CACHED:]
+                    self.check_id_list(packet.get_id(), packet.get_source())
                 else:
                     if self.debug:
-                        print("ALREADY_FORWARDED", self.LAST_SEEN_IDS)
+                        print("ALREADY_FORWARDED", packet.get_id())
         except Exception as e:
             # If packet was corrupted along the way, won't read the COMMAND part
             if self.debug:
                 print("ERROR FORWARDING", e)
+
+    # Listens for duration s and returns the copies of packet forwarded by other nodes heard meanwhile,
+    # up to the ones that cancel its forward. The other packets heard are kept for listen_requester.
+    def overhear(self, packet: Packet, duration):
+        copies = 0
+        deadline = time() + duration * 1000
+        while not self.forwarding.copies or copies < self.forwarding.copies:
+            remaining = (deadline - time()) / 1000
+            if remaining <= 0:
+                break
+            data = self.connector.recv(remaining)
+            if not data:
+                continue
+            heard = Packet(mesh_mode=self.mesh_mode, short_mac=self.short_mac)
+            try:
+                if heard.load(data) and heard.get_id() == packet.get_id() and heard.get_source() == packet.get_source():
+                    copies += 1
+                    continue
+            except Exception:
+                continue    # Corrupted
+            self.keep_overheard(data)
+        return copies
+
+    def keep_overheard(self, data):
+        if len(self.overheard) >= self.OVERHEARD_SIZE:
+            self.overheard.pop(0)
+        self.overheard.append((data, self.connector.get_rssi()))
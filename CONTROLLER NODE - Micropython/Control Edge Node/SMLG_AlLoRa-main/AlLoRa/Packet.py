@@ -1,6 +1,12 @@
 import struct
 import hashlib
 import binascii
+try:
+    from struct import Struct
+except ImportError:
+    Struct = None   # MicroPython: struct.pack and unpack_from on the format string
+from AlLoRa.utils.crc_utils import crc24, crc24_rom
+from AlLoRa.utils.bitmap_utils import Bitmap
 try:
     from ujson import loads, dumps
 except:
@@ -20,6 +26,13 @@ class Packet:
     HEADER_SIZE_MESH_LM  = 22
     HEADER_FORMAT_MESH_LM  = "!8s8sB2s3s" #Source, Destination, Flags, ID, Check Sum
 
+    # Header (format, size), indexed by 2 * mesh_mode + short_mac
+    HEADER_LAYOUTS = ((HEADER_FORMAT_P2P_LM, HEADER_SIZE_P2P_LM), (HEADER_FORMAT_P2P_SM, HEADER_SIZE_P2P_SM),
+                      (HEADER_FORMAT_MESH_LM, HEADER_SIZE_MESH_LM), (HEADER_FORMAT_MESH_SM, HEADER_SIZE_MESH_SM))
+    # Same order, precompiled where the struct module has Struct (CPython)
+    HEADER_STRUCTS = (Struct(HEADER_FORMAT_P2P_LM), Struct(HEADER_FORMAT_P2P_SM),
+                      Struct(HEADER_FORMAT_MESH_LM), Struct(HEADER_FORMAT_MESH_SM)) if Struct else (None, None, None, None)
+
     OK = "OK"
     METADATA = "METADATA"  #"request-data-info"
     CHUNK = "CHUNK"                 #"chunk-"
@@ -27,52 +40,80 @@ class Packet:
     COMMAND = {DATA: "00", OK: "01", CHUNK: "10", METADATA: "11"}
     COMMAND_BITS = {"00": DATA, "01": OK, "10": CHUNK, "11": METADATA}
 
+    # Flag byte bitmasks (bit 0 is the first command bit, bit 1 the second one)
+    FLAG_COMMAND = 0b00000011
+    FLAG_CRC = 1 << 2               # Checksum is a CRC-24 instead of the legacy SHA-256 digest
+    FLAG_MESH = 1 << 3
+    FLAG_SLEEP = 1 << 4
+    FLAG_HOP = 1 << 5
+    FLAG_DEBUG_HOPS = 1 << 6
+    FLAG_CHANGE_RF = 1 << 7
+    COMMAND_CODES = {DATA: 0b00, CHUNK: 0b01, OK: 0b10, METADATA: 0b11}
+    COMMAND_NAMES = (DATA, CHUNK, OK, METADATA)     # Indexed by flags & FLAG_COMMAND
+
+    # Windowed transfers: a CHUNK request whose payload starts with WINDOW_REQUEST
+    # carries the first requested chunk and a bitmap of the requested chunks,
+    # answered with DATA packets prefixed by their chunk index.
+    WINDOW_REQUEST = b"W"
+    CHUNK_INDEX_SIZE = 2
+    MAX_WINDOW_BITMAP = 32      # Bytes, up to 256 chunks per request
+
+    # Optional METADATA fields, with their one byte key in the short MAC encoding
+    METADATA_OPTIONS = {"FEC": b"F",            # Repair chunks appended to the file
+                        "LAST": b"L",           # Size of the last data chunk (FEC)
+                        "COMPRESSION": b"Z"}    # 1 -> the content is a zlib stream
+
+    # Checksum used for the packets built by this node. Received packets are
+    # verified with the checksum announced by their FLAG_CRC bit.
+    SHA256 = "sha256"
+    CRC24 = "crc24"
+    CRC24_ROM = "crc24_rom"
+    CHECKSUMS = (SHA256, CRC24, CRC24_ROM)
+    CHECKSUM = SHA256
+
+    __slots__ = ("mesh_mode", "short_mac", "HEADER_SIZE", "HEADER_FORMAT", "header_struct",
+                 "source", "destination", "checksum", "_payload", "check",
+                 "flags", "_command", "id", "content")
+
     @staticmethod
     def check_command(command: str) -> bool:
         if command in Packet.COMMAND:
             return True
         return False
 
+    @staticmethod
+    def set_checksum(checksum: str) -> bool:
+        if checksum in Packet.CHECKSUMS:
+            Packet.CHECKSUM = checksum
+            return True
+        return False
+
     def __init__(self, mesh_mode, short_mac=False):
         self.mesh_mode = mesh_mode
         self.short_mac = short_mac
 
-        if not self.mesh_mode:
-            if self.short_mac:
-                self.HEADER_SIZE = self.HEADER_SIZE_P2P_SM
-                self.HEADER_FORMAT = self.HEADER_FORMAT_P2P_SM
-            else:
-                self.HEADER_SIZE = self.HEADER_SIZE_P2P_LM
-                self.HEADER_FORMAT = self.HEADER_FORMAT_P2P_LM
-            # self.HEADER_SIZE = self.HEADER_SIZE_P2P
-            # self.HEADER_FORMAT = self.HEADER_FORMAT_P2P
-        else:
-            if self.short_mac:
-                self.HEADER_SIZE = self.HEADER_SIZE_MESH_SM
-                self.HEADER_FORMAT = self.HEADER_FORMAT_MESH_SM
-            else:
-                self.HEADER_SIZE = self.HEADER_SIZE_MESH_LM
-                self.HEADER_FORMAT = self.HEADER_FORMAT_MESH_LM
-            # self.HEADER_SIZE = self.HEADER_SIZE_MESH
-            # self.HEADER_FORMAT = self.HEADER_FORMAT_MESH
+        layout = (2 if mesh_mode else 0) + (1 if short_mac else 0)
+        self.HEADER_FORMAT, self.HEADER_SIZE = self.HEADER_LAYOUTS[layout]
+        self.header_struct = self.HEADER_STRUCTS[layout]
 
         self.source = ''                  # 8 Bytes mac address of the source
         self.destination = ''             # 8 Bytes mac address of the destination
 
         self.checksum = None              # Checksum
-        self.payload = b''                # Content of the message
+        self._payload = b''               # Content of the message (bytes or a memoryview of the received buffer)
 
         self.check = None                 # True if checksum is correct with content
 
         ## Flags:
-        self.command = None               # Type of command / or Data                           bit: 0, 1
+        self._command = None              # Type of command / or Data                           bit: 0, 1
         # Only for mesh mode
-        self.mesh = False                 # Mesh On or Off for this Node                        bit: 3
-        self.sleep = True                # True if should sleep before forwarding message       bit: 4
-        self.hop = False                  # If packet was forwarder -> 1, else -> 0             bit: 5
-        self.debug_hops = False           # Overrides payload to get path details (hops)        bit: 6
+        # mesh: Mesh On or Off for this Node                                                    bit: 3
+        # sleep: True if should sleep before forwarding message                                 bit: 4
+        # hop: If packet was forwarder -> 1, else -> 0                                          bit: 5
+        # debug_hops: Overrides payload to get path details (hops)                              bit: 6
         # Change settings
-        self.change_rf = False            # If True, check payload to change SF                 bit: 7
+        # change_rf: If True, check payload to change SF                                        bit: 7
+        self.flags = self.FLAG_SLEEP
 
         # For mesh
         self.id = None                    # Random number from 0 to 65.535
@@ -84,6 +125,79 @@ class Packet:
             self.mesh_mode, self.source, self.destination, self.checksum, self.payload, self.check, self.command,
             self.mesh, self.sleep, self.hop, self.debug_hops, self.change_rf, self.id)
 
+    # The payload of a loaded packet is kept as a memoryview of the received
+    # buffer, it is only copied into bytes the first time it is accessed.
+    @property
+    def payload(self):
+        payload = self._payload
+        if isinstance(payload, memoryview):
+            payload = bytes(payload)
+            self._payload = payload
+        return payload
+
+    @payload.setter
+    def payload(self, payload):
+        self._payload = payload
+
+    @property
+    def command(self):
+        if self._command is None:
+            return None
+        return self.COMMAND_NAMES[self._command]
+
+    @command.setter
+    def command(self, command):
+        self._command = self.COMMAND_CODES[command] if command is not None else None
+
+    def get_flag(self, mask):
+        return self.flags & mask != 0
+
+    def set_flag(self, mask, value):
+        if value:
+            self.flags |= mask
+        else:
+            self.flags &= ~mask
+
+    @property
+    def mesh(self):
+        return self.flags & self.FLAG_MESH != 0
+
+    @mesh.setter
+    def mesh(self, value):
+        self.set_flag(self.FLAG_MESH, value)
+
+    @property
+    def sleep(self):
+        return self.flags & self.FLAG_SLEEP != 0
+
+    @sleep.setter
+    def sleep(self, value):
+        self.set_flag(self.FLAG_SLEEP, value)
+
+    @property
+    def hop(self):
+        return self.flags & self.FLAG_HOP != 0
+
+    @hop.setter
+    def hop(self, value):
+        self.set_flag(self.FLAG_HOP, value)
+
+    @property
+    def debug_hops(self):
+        return self.flags & self.FLAG_DEBUG_HOPS != 0
+
+    @debug_hops.setter
+    def debug_hops(self, value):
+        self.set_flag(self.FLAG_DEBUG_HOPS, value)
+
+    @property
+    def change_rf(self):
+        return self.flags & self.FLAG_CHANGE_RF != 0
+
+    @change_rf.setter
+    def change_rf(self, value):
+        self.set_flag(self.FLAG_CHANGE_RF, value)
+
     def mac_compress(self, mac):
         int_mac = int(mac, 16)  # Convert the hexadecimal segment to an integer
         compressed_source = struct.pack('I', int_mac)  # Compress the value into 4 bytes unsigned int
@@ -91,8 +205,7 @@ class Packet:
 
     def mac_decompress(self, compressed_mac):
         decompressed_value = struct.unpack('I', compressed_mac)[0]  # Decompress the 4-byte value back to an unsigned int
-        decompressed_hex_value = hex(decompressed_value)  # Convert the integer back to a hexadecimal string
-        return str(decompressed_hex_value)[2:10]  # Ensure the string is 8 characters long
+        return "{:08x}".format(decompressed_value)  # 8 hex digits, keeping the leading zeros
     
     def set_source(self, source: str):
         if self.short_mac:
@@ -133,17 +246,54 @@ class Packet:
     def set_ok(self):
         self.command = "OK"
 
-    def ask_metadata(self):
-         self.command = "METADATA"
+    # Data a Source has waiting, in its OK replies: files (the one being sent
+    # included) and bytes of the next one
+    def set_pending(self, files, size):
+        self.command = "OK"
+        if self.short_mac:
+            self.payload = min(files, 255).to_bytes(1, 'little') + min(size, 0xFFFFFFFF).to_bytes(4, 'little')
+        else:
+            self.payload = dumps({"PENDING": files, "SIZE": size}).encode()
+
+    # (files, bytes) announced in an OK reply, None if the Source doesn't tell
+    def get_pending(self):
+        if self.command != "OK" or self.change_rf or len(self._payload) == 0:
+            return None
+        try:
+            payload = self.payload
+            if self.short_mac:
+                return payload[0], int.from_bytes(payload[1:5], 'little')
+            pending = loads(payload)
+            return pending["PENDING"], pending["SIZE"]
+        except Exception:
+            return None
+
+    def ask_metadata(self, fec_repair_chunks=0):
+        self.command = "METADATA"
+        if fec_repair_chunks:
+            self.payload = bytes([fec_repair_chunks])   # Repair chunks wanted for the file
+
+    def get_requested_fec(self):
+        if self.command == "METADATA" and len(self._payload) > 0:
+            return self._payload[0]
+        return 0
 
-    def set_metadata(self, length, name):
+    def set_metadata(self, length, name, options=None):
         self.command = "METADATA"
         if self.short_mac:
             length_bytes = length.to_bytes(2, 'little')
             name_bytes = name.encode()
             self.payload = length_bytes + name_bytes
+            if options:
+                # Optional fields after a NUL: one byte key, one byte value
+                extra = bytearray(b"\x00")
+                for key in options:
+                    extra += self.METADATA_OPTIONS[key] + bytes([options[key]])
+                self.payload += extra
         else:
             metadata = {"LENGTH" : length, "FILENAME": name}
+            if options:
+                metadata.update(options)
             self.payload = dumps(metadata).encode()
 
     def get_payload(self):
@@ -153,9 +303,17 @@ class Packet:
         if self.command == "METADATA":
             try:
                 if self.short_mac:
-                    length = int.from_bytes(self.payload[:2], 'little')
-                    name = self.payload[2:].decode()
-                    return {"LENGTH": length, "FILENAME": name}
+                    payload = self.payload
+                    length = int.from_bytes(payload[:2], 'little')
+                    end = payload.find(b"\x00", 2)
+                    if end < 0:
+                        return {"LENGTH": length, "FILENAME": payload[2:].decode()}
+                    metadata = {"LENGTH": length, "FILENAME": payload[2:end].decode()}
+                    for i in range(end + 1, len(payload) - 1, 2):
+                        for key in self.METADATA_OPTIONS:
+                            if self.METADATA_OPTIONS[key][0] == payload[i]:
+                                metadata[key] = payload[i + 1]
+                    return metadata
                 else:
                     return loads(self.payload)
             except:
@@ -175,6 +333,31 @@ class Packet:
         self.command = "DATA"
         self.payload = chunk
 
+    def ask_window(self, chunks):
+        base = chunks[0]
+        span = min(chunks[-1] - base + 1, self.MAX_WINDOW_BITMAP * 8)
+        bitmap = Bitmap(span)
+        for chunk in chunks:
+            if chunk - base < span:
+                bitmap.set(chunk - base)
+        self.command = "CHUNK"
+        self.payload = self.WINDOW_REQUEST + base.to_bytes(2, 'little') + bytes(bitmap.bits)
+
+    def get_window(self):
+        payload = self.payload
+        if self._command != self.COMMAND_CODES[self.CHUNK] or payload[:1] != self.WINDOW_REQUEST:
+            return None
+        base = int.from_bytes(payload[1:3], 'little')
+        return [base + offset for offset in Bitmap((len(payload) - 3) * 8, payload[3:]).set_bits()]
+
+    def set_indexed_data(self, order, chunk):
+        self.command = "DATA"
+        self.payload = order.to_bytes(self.CHUNK_INDEX_SIZE, 'little') + chunk
+
+    def get_indexed_data(self):
+        payload = self.payload
+        return int.from_bytes(payload[:self.CHUNK_INDEX_SIZE], 'little'), payload[self.CHUNK_INDEX_SIZE:]
+
     def get_mesh(self):
         return self.mesh
 
@@ -260,15 +443,18 @@ class Packet:
         return self.id
 
     def get_length(self):
-        if len(self.payload) > 0:
-            return self.HEADER_SIZE + len(self.payload)
+        if len(self._payload) > 0:
+            return self.HEADER_SIZE + len(self._payload)
         else:
             return self.HEADER_SIZE
 
     def get_checksum(self, data):
-        h = hashlib.sha256(data)
-        ha = binascii.hexlify(h.digest())
-        return (ha[-3:])
+        if self.flags & self.FLAG_CRC:
+            if self.CHECKSUM == self.CRC24_ROM:
+                return crc24_rom(data).to_bytes(3, 'big')
+            return crc24(data).to_bytes(3, 'big')
+        # Last 3 hex digits of the digest, from its last 2 bytes only
+        return binascii.hexlify(hashlib.sha256(data).digest()[-2:])[-3:]
 
     def build_header(self):
         if isinstance(self.source, str):
@@ -281,7 +467,12 @@ class Packet:
                 id_bytes = self.id.to_bytes(2, 'little')
             except:
                 print(self.source, self.destination, self.flags, self.id, self.checksum)
-            h = struct.pack(self.HEADER_FORMAT, self.source, self.destination, self.flags, id_bytes, self.checksum)
+            if self.header_struct is not None:
+                h = self.header_struct.pack(self.source, self.destination, self.flags, id_bytes, self.checksum)
+            else:
+                h = struct.pack(self.HEADER_FORMAT, self.source, self.destination, self.flags, id_bytes, self.checksum)
+        elif self.header_struct is not None:
+            h = self.header_struct.pack(self.source, self.destination, self.flags, self.checksum)
         else:
             h = struct.pack(self.HEADER_FORMAT, self.source, self.destination, self.flags, self.checksum)
         
@@ -289,33 +480,17 @@ class Packet:
 
 
     def close_packet(self):
-        if self.command in self.COMMAND:
-            command_bits = self.COMMAND[self.command]
-
-            flags = 0
-            if command_bits[0] == "1":
-                flags = flags | (1<<0)
-            if command_bits[1] == "1":
-                flags = flags | (1<<1)
-            if self.mesh:
-                flags = flags | (1<<3)
-            if self.sleep:
-                flags = flags | (1<<4)
-            if self.hop:
-                flags = flags | (1<<5)
-            if self.debug_hops:
-                flags = flags | (1<<6)
-            if self.change_rf:
-                flags = flags | (1<<7)
-
+        command = self._command
+        if command is not None:
+            flags = (self.flags & ~(self.FLAG_COMMAND | self.FLAG_CRC)) | command
+            if self.CHECKSUM != self.SHA256:
+                flags |= self.FLAG_CRC
             self.flags = flags
 
-            p = self.payload
-            self.checksum = self.get_checksum(p)
-
-            h = self.build_header()
+            payload = self._payload
+            self.checksum = self.get_checksum(payload)
 
-            self.content = h + self.payload
+            self.content = self.build_header() + payload
 
     def get_content(self):
         if self.content is not None:
@@ -325,33 +500,28 @@ class Packet:
             return self.content
 
     def parse_flags(self, flags: int):
-        c0 = "1" if (flags >> 0) & 1 == 1 else "0"
-        c1 = "1" if (flags >> 1) & 1 == 1 else "0"
-        self.command = self.COMMAND_BITS[c0+c1]
-
-        self.mesh  = (flags >> 3) & 1 == 1
-        self.sleep = (flags >> 4) & 1 == 1
-        self.hop = (flags >> 5) & 1 == 1
-        self.debug_hops = (flags >> 6) & 1 == 1
-        self.change_rf = (flags >> 7) & 1 == 1
+        self.flags = flags
+        self._command = flags & self.FLAG_COMMAND
 
     def load(self, packet):
-        header  = packet[:self.HEADER_SIZE]
-        content = packet[self.HEADER_SIZE:]
+        view = memoryview(packet)
+        if self.header_struct is not None:
+            fields = self.header_struct.unpack_from(view)
+        else:
+            fields = struct.unpack_from(self.HEADER_FORMAT, view)
 
         if self.mesh_mode:
-            self.source, self.destination, flags, id, self.checksum = struct.unpack(self.HEADER_FORMAT, header)
+            self.source, self.destination, flags, id, self.checksum = fields
             self.id = int.from_bytes(id, "little")
         else:
-            self.source, self.destination, flags, self.checksum = struct.unpack(self.HEADER_FORMAT, header)
-        
-        self.flags = flags
+            self.source, self.destination, flags, self.checksum = fields
 
-        self.parse_flags(flags)
+        self.flags = flags
+        self._command = flags & self.FLAG_COMMAND
 
-        self.payload = content
+        self._payload = view[self.HEADER_SIZE:]
 
-        self.check = self.checksum == self.get_checksum(self.payload)
+        self.check = self.checksum == self.get_checksum(self._payload)
 
         if self.check:
             self.content = packet
@@ -359,12 +529,12 @@ class Packet:
         return self.check
 
     def get_dict(self):
-        p = self.payload
-        self.checksum = self.get_checksum(p)
-        d = {"source" : self.source,
-            "destination" : self.destination,
+        self.checksum = self.get_checksum(self._payload)
+        d = {"source" : binascii.hexlify(self.source).decode(),
+            "destination" : binascii.hexlify(self.destination).decode(),
             "command" : self.command,
-            "checksum" : self.checksum.decode(),
+            "checksum" : binascii.hexlify(self.checksum).decode() if self.flags & self.FLAG_CRC else self.checksum.decode(),
+            "crc" : self.flags & self.FLAG_CRC != 0,
             "payload" : binascii.b2a_base64(self.payload).decode().strip() if self.payload else None,
             "mesh" : self.mesh,
             "hop" : self.hop,
@@ -376,10 +546,11 @@ class Packet:
         return d
 
     def load_dict(self, d):
-        self.source = d["source"]
-        self.destination = d["destination"]
+        self.source = binascii.unhexlify(d["source"])
+        self.destination = binascii.unhexlify(d["destination"])
         self.command = d["command"]
-        self.checksum = d["checksum"].encode()
+        self.flags = self.FLAG_CRC if d.get("crc", False) else 0
+        self.checksum = binascii.unhexlify(d["checksum"]) if self.flags & self.FLAG_CRC else d["checksum"].encode()
         self.payload = binascii.a2b_base64(d["payload"]) if d["payload"] else b''
         self.mesh = d["mesh"]
         self.hop = d["hop"]
@@ -442,8 +613,8 @@ if __name__ == "__main__":
     print("Packet: {}".format(packet))
     #print(p3.get_payload())
     metadata = p3.get_metadata()
-    length = metadata["L"]
-    filename = metadata["FN"]
+    length = metadata["LENGTH"]
+    filename = metadata["FILENAME"]
     print(length, filename)
 
     print(Packet.check_command("OK"))
@@ -0,0 +1,119 @@
+# LoRa time on air and duty-cycle accounting.
+#
+# toa_table() keeps the ToA of every payload length for each RF config used,
+# so a ToA is a list lookup instead of the formula with floats and ceil. The
+# tables are built the first time an RF config is used, a few at most.
+#
+# AirtimeLedger adds up the airtime sent in each EU868 sub-band over a sliding
+# window of one hour, in buckets so its memory does not grow with the traffic,
+# and tells how long to wait until a transmission fits in the duty cycle of
+# its sub-band.
+from math import ceil
+
+MAX_TABLES = 4      # RF configs with a ToA table; all are rebuilt when one more is needed
+
+# (lowest MHz, highest MHz, duty cycle) of the EU868 sub-bands (ETSI EN 300 220)
+EU868_BANDS = (
+    (863.0, 865.0, 0.001),
+    (865.0, 868.0, 0.01),
+    (868.0, 868.6, 0.01),
+    (868.7, 869.2, 0.001),
+    (869.4, 869.65, 0.1),
+    (869.7, 870.0, 0.01),
+)
+
+toa_tables = {}     # (sf, bw, cr) -> ToA (s) by payload length
+
+
+def time_on_air(sf, bw, cr, payload_size):
+    crc = 1  # CRC enabled
+    bw_hz = bw * 1000   # Convert bandwidth to Hz
+    t_symbol = (2 ** sf) / bw_hz    # Symbol duration
+    t_preamble = t_symbol * (8 + 4.25)  # Preamble duration
+    h = 0   # Implicit header disabled
+    de = 1 if (sf >= 11 and bw == 125) else 0   # Low data rate optimization enabled for SF11 and SF12 with 125kHz BW
+    cr_rate = cr / 4.0  # Coding rate
+    # Payload Symbol Calculation
+    payload_bits = 8 * payload_size - 4 * sf + 28 + 16 * (1 if crc else 0) - 20 * h
+    bits_per_symbol = 4 * (sf - 2 * de)
+    n_payload = 8 + max(0, int(ceil(payload_bits / bits_per_symbol) * (cr_rate + 4)))
+    return t_preamble + t_symbol * n_payload
+
+
+# ToA (s) of every payload length up to 255 bytes with an RF config
+def toa_table(sf, bw, cr):
+    key = (sf, bw, cr)
+    table = toa_tables.get(key)
+    if table is None:
+        if len(toa_tables) >= MAX_TABLES:
+            toa_tables.clear()
+        table = [time_on_air(sf, bw, cr, size) for size in range(256)]
+        toa_tables[key] = table
+    return table
+
+
+def toa(sf, bw, cr, payload_size):
+    if payload_size < 256:
+        return toa_table(sf, bw, cr)[payload_size]
+    return time_on_air(sf, bw, cr, payload_size)
+
+
+class AirtimeLedger:
+    WINDOW = 3600   # s
+    BUCKETS = 60
+
+    def __init__(self, bands=EU868_BANDS, window=WINDOW, buckets=BUCKETS):
+        self.bands = bands
+        self.window = window
+        self.bucket_ms = window * 1000 // buckets
+        # The current bucket plus a full window of older ones, so airtime is
+        # remembered for at least the window
+        self.size = buckets + 1
+        self.usage = {}     # band -> [number of the current bucket, airtime (s) per bucket]
+        # "<lowest>-<highest>" MHz -> {"used", "budget" (s in the window), "duty_cycle"}, as of the last transmission
+        self.status = {}
+
+    # Sub-band of a frequency (MHz or Hz), None if it has no duty cycle
+    def band(self, frequency):
+        mhz = frequency / 1000000 if frequency > 100000 else frequency
+        for band in self.bands:
+            if band[0] <= mhz < band[1]:
+                return band
+        return None
+
+    # [current bucket, airtime per bucket] of a band, with the buckets that left the window emptied
+    def buckets(self, band, now):
+        number = now // self.bucket_ms
+        usage = self.usage.get(band)
+        if usage is None:
+            usage = [number, [0.0] * self.size]
+            self.usage[band] = usage
+        for n in range(usage[0] + 1, min(number, usage[0] + self.size) + 1):
+            usage[1][n % self.size] = 0.0
+        usage[0] = max(usage[0], number)
+        return usage
+
+    def record(self, frequency, toa, now):
+        band = self.band(frequency)
+        if band is None:
+            return
+        number, airtime = self.buckets(band, now)
+        airtime[number % self.size] += toa
+        self.status["{}-{}".format(band[0], band[1])] = {"used": sum(airtime), "budget": band[2] * self.window,
+                                                          "duty_cycle": band[2]}
+
+    # Seconds until toa s more fit in the duty cycle of the sub-band of frequency, 0 if they fit now
+    def delay(self, frequency, toa, now):
+        band = self.band(frequency)
+        if band is None:
+            return 0
+        number, airtime = self.buckets(band, now)
+        excess = sum(airtime) + toa - band[2] * self.window
+        if excess <= 0:
+            return 0
+        # The oldest buckets leave the window first
+        for age in range(self.size - 1, -1, -1):
+            excess -= airtime[(number - age) % self.size]
+            if excess <= 0:
+                return ((number - age + self.size) * self.bucket_ms - now) / 1000
+        return self.window   # More than the whole budget
@@ -0,0 +1,65 @@
+# Compact bit array, bit i is bit (i & 7) of byte (i >> 3).
+# Used to track received chunks and to encode windowed chunk requests.
+
+_POPCOUNT = bytes(bin(i).count("1") for i in range(256))
+
+
+class Bitmap:
+
+    def __init__(self, size, bits=None):
+        self.size = size
+        if bits is None:
+            self.bits = bytearray((size + 7) >> 3)
+            self.count = 0
+        else:
+            self.bits = bytearray(bits)
+            self.count = sum(_POPCOUNT[byte] for byte in self.bits)
+
+    # Returns True if the bit was not set yet
+    def set(self, i):
+        mask = 1 << (i & 7)
+        if self.bits[i >> 3] & mask:
+            return False
+        self.bits[i >> 3] |= mask
+        self.count += 1
+        return True
+
+    def test(self, i):
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def missing(self):
+        return self.size - self.count
+
+    def is_full(self):
+        return self.count >= self.size
+
+    # First clear bit from start on, None if all of them are set
+    def next_clear(self, start=0):
+        bits = self.bits
+        i = start
+        while i < self.size:
+            byte = bits[i >> 3]
+            if byte == 0xFF:
+                i = (i | 7) + 1     # Skip the whole byte
+                continue
+            if not byte & (1 << (i & 7)):
+                return i
+            i += 1
+        return None
+
+    def clear_bits(self, start=0):
+        i = self.next_clear(start)
+        while i is not None:
+            yield i
+            i = self.next_clear(i + 1)
+
+    def set_bits(self):
+        bits = self.bits
+        for index in range(len(bits)):
+            byte = bits[index]
+            bit = 0
+            while byte:
+                if byte & 1:
+                    yield (index << 3) + bit
+                byte >>= 1
+                bit += 1
@@ -0,0 +1,38 @@
+# zlib streams, so files compressed by a MicroPython node can be
+# decompressed by CPython's zlib on the gateway and the other way around.
+from AlLoRa.utils.debug_utils import print
+
+try:
+    import zlib     # CPython, or MicroPython < 1.21 (decompress only)
+except ImportError:
+    zlib = None
+
+try:
+    import deflate  # MicroPython >= 1.21
+    import io
+except ImportError:
+    deflate = None
+
+WBITS = 15  # zlib header, 32 KB window
+
+
+# Returns the zlib stream, or None if this port cannot compress
+def compress(data):
+    try:
+        if zlib is not None and hasattr(zlib, "compress"):
+            return zlib.compress(data)
+        if deflate is not None:
+            stream = io.BytesIO()
+            with deflate.DeflateIO(stream, deflate.ZLIB) as d:
+                d.write(data)
+            return stream.getvalue()
+    except Exception as e:
+        print("Error compressing: ", e)
+    return None
+
+
+def decompress(data):
+    if zlib is not None and hasattr(zlib, "decompress"):
+        return zlib.decompress(data, WBITS)
+    with deflate.DeflateIO(io.BytesIO(data), deflate.ZLIB) as d:
+        return d.read()
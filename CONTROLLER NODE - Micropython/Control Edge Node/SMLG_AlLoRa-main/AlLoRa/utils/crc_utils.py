@@ -0,0 +1,114 @@
+# CRC-24 (OpenPGP polynomial, RFC 4880) used as Packet checksum.
+# Two table strategies produce the same value:
+#   crc24      -> 256 entry table built in RAM the first time it is used.
+#   crc24_rom  -> precomputed table kept as a bytes constant, so it stays in
+#                 flash when the module is frozen into the MicroPython firmware.
+from array import array
+
+CRC24_INIT = 0xB704CE
+CRC24_POLY = 0x864CFB
+
+CRC24_ROM_TABLE = (
+    b"\x00\x00\x00\x86\x4c\xfb\x8a\xd5\x0d\x0c\x99\xf6\x93\xe6\xe1\x15\xaa\x1a\x19\x33\xec\x9f\x7f\x17"
+    b"\xa1\x81\x39\x27\xcd\xc2\x2b\x54\x34\xad\x18\xcf\x32\x67\xd8\xb4\x2b\x23\xb8\xb2\xd5\x3e\xfe\x2e"
+    b"\xc5\x4e\x89\x43\x02\x72\x4f\x9b\x84\xc9\xd7\x7f\x56\xa8\x68\xd0\xe4\x93\xdc\x7d\x65\x5a\x31\x9e"
+    b"\x64\xcf\xb0\xe2\x83\x4b\xee\x1a\xbd\x68\x56\x46\xf7\x29\x51\x71\x65\xaa\x7d\xfc\x5c\xfb\xb0\xa7"
+    b"\x0c\xd1\xe9\x8a\x9d\x12\x86\x04\xe4\x00\x48\x1f\x9f\x37\x08\x19\x7b\xf3\x15\xe2\x05\x93\xae\xfe"
+    b"\xad\x50\xd0\x2b\x1c\x2b\x27\x85\xdd\xa1\xc9\x26\x3e\xb6\x31\xb8\xfa\xca\xb4\x63\x3c\x32\x2f\xc7"
+    b"\xc9\x9f\x60\x4f\xd3\x9b\x43\x4a\x6d\xc5\x06\x96\x5a\x79\x81\xdc\x35\x7a\xd0\xac\x8c\x56\xe0\x77"
+    b"\x68\x1e\x59\xee\x52\xa2\xe2\xcb\x54\x64\x87\xaf\xfb\xf8\xb8\x7d\xb4\x43\x71\x2d\xb5\xf7\x61\x4e"
+    b"\x19\xa3\xd2\x9f\xef\x29\x93\x76\xdf\x15\x3a\x24\x8a\x45\x33\x0c\x09\xc8\x00\x90\x3e\x86\xdc\xc5"
+    b"\xb8\x22\xeb\x3e\x6e\x10\x32\xf7\xe6\xb4\xbb\x1d\x2b\xc4\x0a\xad\x88\xf1\xa1\x11\x07\x27\x5d\xfc"
+    b"\xdc\xed\x5b\x5a\xa1\xa0\x56\x38\x56\xd0\x74\xad\x4f\x0b\xba\xc9\x47\x41\xc5\xde\xb7\x43\x92\x4c"
+    b"\x7d\x6c\x62\xfb\x20\x99\xf7\xb9\x6f\x71\xf5\x94\xee\x8a\x83\x68\xc6\x78\x64\x5f\x8e\xe2\x13\x75"
+    b"\x15\x72\x3b\x93\x3e\xc0\x9f\xa7\x36\x19\xeb\xcd\x86\x94\xda\x00\xd8\x21\x0c\x41\xd7\x8a\x0d\x2c"
+    b"\xb4\xf3\x02\x32\xbf\xf9\x3e\x26\x0f\xb8\x6a\xf4\x27\x15\xe3\xa1\x59\x18\xad\xc0\xee\x2b\x8c\x15"
+    b"\xd0\x3c\xb2\x56\x70\x49\x5a\xe9\xbf\xdc\xa5\x44\x43\xda\x53\xc5\x96\xa8\xc9\x0f\x5e\x4f\x43\xa5"
+    b"\x71\xbd\x8b\xf7\xf1\x70\xfb\x68\x86\x7d\x24\x7d\xe2\x5b\x6a\x64\x17\x91\x68\x8e\x67\xee\xc2\x9c"
+    b"\x33\x47\xa4\xb5\x0b\x5f\xb9\x92\xa9\x3f\xde\x52\xa0\xa1\x45\x26\xed\xbe\x2a\x74\x48\xac\x38\xb3"
+    b"\x92\xc6\x9d\x14\x8a\x66\x18\x13\x90\x9e\x5f\x6b\x01\x20\x7c\x87\x6c\x87\x8b\xf5\x71\x0d\xb9\x8a"
+    b"\xf6\x09\x2d\x70\x45\xd6\x7c\xdc\x20\xfa\x90\xdb\x65\xef\xcc\xe3\xa3\x37\xef\x3a\xc1\x69\x76\x3a"
+    b"\x57\x88\x14\xd1\xc4\xef\xdd\x5d\x19\x5b\x11\xe2\xc4\x6e\xf5\x42\x22\x0e\x4e\xbb\xf8\xc8\xf7\x03"
+    b"\x3f\x96\x4d\xb9\xda\xb6\xb5\x43\x40\x33\x0f\xbb\xac\x70\xac\x2a\x3c\x57\x26\xa5\xa1\xa0\xe9\x5a"
+    b"\x9e\x17\x74\x18\x5b\x8f\x14\xc2\x79\x92\x8e\x82\x0d\xf1\x95\x8b\xbd\x6e\x87\x24\x98\x01\x68\x63"
+    b"\xfa\xd8\xc4\x7c\x94\x3f\x70\x0d\xc9\xf6\x41\x32\x69\x3e\x25\xef\x72\xde\xe3\xeb\x28\x65\xa7\xd3"
+    b"\x5b\x59\xfd\xdd\x15\x06\xd1\x8c\xf0\x57\xc0\x0b\xc8\xbf\x1c\x4e\xf3\xe7\x42\x6a\x11\xc4\x26\xea"
+    b"\x2a\xe4\x76\xac\xa8\x8d\xa0\x31\x7b\x26\x7d\x80\xb9\x02\x97\x3f\x4e\x6c\x33\xd7\x9a\xb5\x9b\x61"
+    b"\x8b\x65\x4f\x0d\x29\xb4\x01\xb0\x42\x87\xfc\xb9\x18\x83\xae\x9e\xcf\x55\x92\x56\xa3\x14\x1a\x58"
+    b"\xef\xaa\xff\x69\xe6\x04\x65\x7f\xf2\xe3\x33\x09\x7c\x4c\x1e\xfa\x00\xe5\xf6\x99\x13\x70\xd5\xe8"
+    b"\x4e\x2b\xc6\xc8\x67\x3d\xc4\xfe\xcb\x42\xb2\x30\xdd\xcd\x27\x5b\x81\xdc\x57\x18\x2a\xd1\x54\xd1"
+    b"\x26\x35\x9f\xa0\x79\x64\xac\xe0\x92\x2a\xac\x69\xb5\xd3\x7e\x33\x9f\x85\x3f\x06\x73\xb9\x4a\x88"
+    b"\x87\xb4\xa6\x01\xf8\x5d\x0d\x61\xab\x8b\x2d\x50\x14\x52\x47\x92\x1e\xbc\x9e\x87\x4a\x18\xcb\xb1"
+    b"\xe3\x7b\x16\x65\x37\xed\x69\xae\x1b\xef\xe2\xe0\x70\x9d\xf7\xf6\xd1\x0c\xfa\x48\xfa\x7c\x04\x01"
+    b"\x42\xfa\x2f\xc4\xb6\xd4\xc8\x2f\x22\x4e\x63\xd9\xd1\x1c\xce\x57\x50\x35\x5b\xc9\xc3\xdd\x85\x38")
+
+_crc24_table = None
+
+def crc24_table():
+    global _crc24_table
+    if _crc24_table is None:
+        table = array('I', [0] * 256)
+        for i in range(256):
+            crc = i << 16
+            for _ in range(8):
+                crc <<= 1
+                if crc & 0x1000000:
+                    crc ^= CRC24_POLY
+            table[i] = crc & 0xFFFFFF
+        _crc24_table = table
+    return _crc24_table
+
+def _crc24_python(data, crc, table):
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ table[((crc >> 16) ^ byte) & 0xFF]
+    return crc
+
+def _crc24_rom_python(data, crc, table):
+    for byte in data:
+        i = (((crc >> 16) ^ byte) & 0xFF) * 3
+        crc = ((crc << 8) & 0xFFFFFF) ^ ((table[i] << 16) | (table[i + 1] << 8) | table[i + 2])
+    return crc
+
+try:
+    from AlLoRa.utils.crc_viper_utils import crc24_native as _crc24_native, crc24_rom_native as _crc24_rom_native
+except (ImportError, SyntaxError):
+    # CPython, or a MicroPython port without the native emitter
+    _crc24_native = None
+    _crc24_rom_native = None
+
+def crc24(data, crc=CRC24_INIT):
+    if _crc24_native is not None:
+        return _crc24_native(data, len(data), crc, crc24_table())
+    return _crc24_python(data, crc, crc24_table())
+
+def crc24_rom(data, crc=CRC24_INIT):
+    if _crc24_rom_native is not None:
+        return _crc24_rom_native(data, len(data), crc, CRC24_ROM_TABLE)
+    return _crc24_rom_python(data, crc, CRC24_ROM_TABLE)
+
+# CRC-16/CCITT-FALSE (polynomial 0x1021, init 0xFFFF), used by the binary
+# framing of the serial link (serial_frame_utils).
+CRC16_INIT = 0xFFFF
+CRC16_POLY = 0x1021
+
+_crc16_table = None
+
+def crc16_table():
+    global _crc16_table
+    if _crc16_table is None:
+        table = array('H', [0] * 256)
+        for i in range(256):
+            crc = i << 8
+            for _ in range(8):
+                crc <<= 1
+                if crc & 0x10000:
+                    crc ^= CRC16_POLY
+            table[i] = crc & 0xFFFF
+        _crc16_table = table
+    return _crc16_table
+
+def crc16(data, crc=CRC16_INIT):
+    table = crc16_table()
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ byte) & 0xFF]
+    return crc
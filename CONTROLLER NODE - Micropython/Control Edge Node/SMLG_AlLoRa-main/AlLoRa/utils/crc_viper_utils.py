@@ -0,0 +1,27 @@
+# Viper (native code) loops of the CRC-24 strategies of crc_utils. Kept in
+# their own module because a port without the native emitter rejects the
+# @micropython.viper functions when compiling the module: crc_utils imports
+# it inside a try and falls back to its Python loops. CPython fails on the
+# micropython import.
+import micropython
+
+@micropython.viper
+def crc24_native(data, length: int, crc: int, table) -> int:
+    buf = ptr8(data)
+    tab = ptr32(table)
+    i = 0
+    while i < length:
+        crc = ((crc << 8) & 0xFFFFFF) ^ tab[((crc >> 16) ^ buf[i]) & 0xFF]
+        i += 1
+    return crc
+
+@micropython.viper
+def crc24_rom_native(data, length: int, crc: int, table) -> int:
+    buf = ptr8(data)
+    tab = ptr8(table)
+    i = 0
+    while i < length:
+        j = (((crc >> 16) ^ buf[i]) & 0xFF) * 3
+        crc = ((crc << 8) & 0xFFFFFF) ^ ((tab[j] << 16) | (tab[j + 1] << 8) | tab[j + 2])
+        i += 1
+    return crc
@@ -0,0 +1,109 @@
+# Systematic Reed-Solomon erasure code over GF(2^8) for CTP_File transfers.
+# The data chunks are sent as they are, followed by repair chunks built with
+# a Cauchy matrix: any data_chunks of the data_chunks + repair_chunks chunks
+# are enough to rebuild the file. Data chunk i uses the field element i and
+# repair chunk r the element data_chunks + r, so both together must fit in
+# the 256 elements of the field.
+MAX_CHUNKS = 256
+
+_EXP = bytearray(512)
+_LOG = bytearray(256)
+
+def _build_tables():
+    x = 1
+    for i in range(255):
+        _EXP[i] = x
+        _LOG[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= 0x11D
+    for i in range(255, 512):
+        _EXP[i] = _EXP[i - 255]
+
+_build_tables()
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+def gf_inv(a):
+    return _EXP[255 - _LOG[a]]
+
+def fits(data_chunks, repair_chunks):
+    return data_chunks + repair_chunks <= MAX_CHUNKS
+
+def coefficient(repair, data_chunks, order):
+    return gf_inv((data_chunks + repair) ^ order)
+
+# out ^= factor * chunk, byte by byte
+def add_scaled(out, chunk, factor):
+    if factor == 0:
+        return
+    if factor == 1:
+        for j in range(len(chunk)):
+            out[j] ^= chunk[j]
+        return
+    log_factor = _LOG[factor]
+    exp = _EXP
+    log = _LOG
+    for j in range(len(chunk)):
+        byte = chunk[j]
+        if byte:
+            out[j] ^= exp[log[byte] + log_factor]
+
+# get_chunk(order) returns the data chunk, the last one may be shorter
+def encode_repair(repair, data_chunks, chunk_size, get_chunk):
+    out = bytearray(chunk_size)
+    for order in range(data_chunks):
+        add_scaled(out, get_chunk(order), coefficient(repair, data_chunks, order))
+    return bytes(out)
+
+def _invert(matrix):
+    size = len(matrix)
+    rows = [bytearray(row) + bytearray(size) for row in matrix]
+    for i in range(size):
+        rows[i][size + i] = 1
+    for col in range(size):
+        pivot = col
+        while rows[pivot][col] == 0:
+            pivot += 1
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        inv = gf_inv(rows[col][col])
+        rows[col] = bytearray(gf_mul(v, inv) for v in rows[col])
+        for r in range(size):
+            if r != col and rows[r][col]:
+                add_scaled(rows[r], rows[col], rows[r][col])
+    return [row[size:] for row in rows]
+
+# Rebuilds the missing data chunks.
+# - received: dict order -> data chunk for the data chunks that arrived.
+# - repairs: dict repair index -> repair chunk, at least as many as missing chunks.
+# Returns a dict order -> rebuilt chunk (padded to chunk_size).
+def recover(data_chunks, chunk_size, received, repairs, get_chunk=None):
+    missing = [order for order in range(data_chunks) if order not in received]
+    if not missing:
+        return {}
+    if len(repairs) < len(missing):
+        return None
+    if get_chunk is None:
+        get_chunk = received.get
+    used = sorted(repairs)[:len(missing)]
+
+    syndromes = []
+    for repair in used:
+        syndrome = bytearray(repairs[repair])
+        for order in received:
+            add_scaled(syndrome, get_chunk(order), coefficient(repair, data_chunks, order))
+        syndromes.append(syndrome)
+
+    matrix = [[coefficient(repair, data_chunks, order) for order in missing] for repair in used]
+    inverse = _invert(matrix)
+
+    rebuilt = {}
+    for i in range(len(missing)):
+        out = bytearray(chunk_size)
+        for j in range(len(used)):
+            add_scaled(out, syndromes[j], inverse[i][j])
+        rebuilt[missing[i]] = bytes(out)
+    return rebuilt
@@ -0,0 +1,48 @@
+# When a mesh node forwards a packet, to limit the copies of it on the air
+# where many nodes hear it (counter-based rebroadcast suppression).
+#
+# Before forwarding, a node waits a backoff while listening, and does not
+# forward if it hears the same packet (source, ID) forwarded by copies other
+# nodes meanwhile: its neighbours were most likely reached already. The
+# backoff is in times on air of the packet, so it holds for any RF config:
+#
+#     backoff = toa * backoff_toas * (closeness + jitter)
+#
+# closeness goes from 0 at rssi_far to 1 at rssi_near, so the nodes that heard
+# the packet weakest (the furthest from the sender, the ones that reach the
+# most new nodes) forward first and the closest ones are the most likely to be
+# suppressed. jitter, from 0 to 1, splits the nodes at the same distance. With
+# backoff_toas ToAs per unit, two forwards rarely overlap on the air.
+
+RSSI_FAR = -120     # dBm
+RSSI_NEAR = -50
+
+
+class ForwardPolicy:
+
+    def __init__(self, copies=2, backoff_toas=4, rssi_far=RSSI_FAR, rssi_near=RSSI_NEAR):
+        self.copies = copies            # Copies heard that cancel the forward, 0 never cancels
+        self.backoff_toas = backoff_toas
+        self.rssi_far = rssi_far
+        self.rssi_near = rssi_near
+        self.status = {"forwarded": 0, "suppressed": 0, "copies": 0}
+
+    # From 0 (rssi_far or weaker) to 1 (rssi_near or stronger)
+    def closeness(self, rssi):
+        if rssi is None:
+            return 0.5
+        closeness = (rssi - self.rssi_far) / (self.rssi_near - self.rssi_far)
+        return min(max(closeness, 0), 1)
+
+    # Backoff (s) before forwarding a packet of toa s heard at rssi; jitter from 0 to 1
+    def backoff(self, rssi, toa, jitter):
+        return toa * self.backoff_toas * (self.closeness(rssi) + jitter)
+
+    # Whether to forward after hearing copies of the packet during the backoff
+    def forward(self, copies):
+        self.status["copies"] += copies
+        if self.copies and copies >= self.copies:
+            self.status["suppressed"] += 1
+            return False
+        self.status["forwarded"] += 1
+        return True
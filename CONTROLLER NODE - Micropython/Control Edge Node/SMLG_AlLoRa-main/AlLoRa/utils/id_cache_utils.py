@@ -0,0 +1,67 @@
+# Cache of the mesh packet IDs seen recently, to drop the copies of a packet
+# that come back through other nodes and to avoid reusing an ID of my own.
+#
+# The IDs are kept by source (key (source, id)), as two nodes can pick the
+# same random 16-bit ID. A dict gives the lookups, and a preallocated ring of
+# capacity slots the insertion order: a new ID takes the slot of the oldest,
+# which is evicted, so memory stays fixed whatever the traffic. IDs older
+# than max_age are expired, as a copy can't be that late and the source may
+# use the ID again.
+
+
+class IDCache:
+    CAPACITY = 64
+
+    def __init__(self, capacity=CAPACITY, max_age=60000):
+        self.capacity = capacity
+        self.max_age = max_age      # ms
+        self.ring = [None] * capacity   # Keys in insertion order
+        self.next = 0                   # Slot for the next key
+        self.seen = {}                  # key -> (time seen (ms), slot)
+        self.status = {"size": 0, "capacity": capacity, "hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def __len__(self):
+        return len(self.seen)
+
+    # Whether the ID was seen in the last max_age ms
+    def contains(self, source, id, now):
+        entry = self.seen.get((source, id))
+        if entry is not None and now - entry[0] > self.max_age:
+            self.remove((source, id))
+            self.status["expired"] += 1
+            entry = None
+        if entry is None:
+            self.status["misses"] += 1
+            return False
+        self.status["hits"] += 1
+        return True
+
+    # Adds the ID, returns False if it was already there
+    def add(self, source, id, now):
+        if self.contains(source, id, now):
+            return False
+        key = (source, id)
+        old = self.ring[self.next]
+        if old is not None:
+            entry = self.seen.get(old)
+            if entry is not None and entry[1] == self.next:
+                del self.seen[old]
+                if now - entry[0] > self.max_age:
+                    self.status["expired"] += 1
+                else:
+                    self.status["evictions"] += 1
+        self.ring[self.next] = key
+        self.seen[key] = (now, self.next)
+        self.next = (self.next + 1) % self.capacity
+        self.status["size"] = len(self.seen)
+        return True
+
+    def remove(self, key):
+        if self.seen.pop(key, None) is not None:
+            self.status["size"] = len(self.seen)
+
+    def clear(self):
+        self.ring = [None] * self.capacity
+        self.next = 0
+        self.seen = {}
+        self.status["size"] = 0
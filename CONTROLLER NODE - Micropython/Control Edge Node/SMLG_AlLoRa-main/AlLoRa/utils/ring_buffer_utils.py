@@ -0,0 +1,86 @@
+# Byte FIFO over a preallocated bytearray, for the serial readers: the bytes
+# read are written at the tail and the messages are taken from the head, with
+# no copy of the rest of the buffer and no allocation while it fits (it grows
+# when it does not). Messages end with a delimiter (one or more bytes).
+
+
+class RingBuffer:
+
+    def __init__(self, size=4096):
+        self.buffer = bytearray(size)
+        self.size = size
+        self.head = 0       # Index of the first unread byte
+        self.length = 0     # Unread bytes
+        self.scanned = 0    # Unread bytes already searched for a message end
+
+    def __len__(self):
+        return self.length
+
+    def clear(self):
+        self.head = 0
+        self.length = 0
+        self.scanned = 0
+
+    def write(self, data):
+        if self.length + len(data) > self.size:
+            self.resize(self.length + len(data))
+        tail = (self.head + self.length) % self.size
+        first = min(len(data), self.size - tail)
+        self.buffer[tail:tail + first] = data[:first]
+        self.buffer[:len(data) - first] = data[first:]
+        self.length += len(data)
+
+    def resize(self, needed):
+        size = self.size
+        while size < needed:
+            size *= 2
+        data = self.peek(self.length)
+        self.buffer = bytearray(size)
+        self.buffer[:len(data)] = data
+        self.size = size
+        self.head = 0
+
+    # Unread bytes from offset start to end (from the head), without taking them
+    def peek(self, end, start=0):
+        first = self.head + start
+        last = self.head + end
+        if last <= self.size:
+            return bytes(self.buffer[first:last])
+        if first >= self.size:
+            return bytes(self.buffer[first - self.size:last - self.size])
+        return bytes(self.buffer[first:]) + bytes(self.buffer[:last - self.size])
+
+    def read(self, n):
+        data = self.peek(n)
+        self.head = (self.head + n) % self.size
+        self.length -= n
+        self.scanned = 0
+        return data
+
+    # Offset from the head of the first byte equal to value at or after offset start, -1 if none
+    def find_byte(self, value, start=0):
+        end = self.head + self.length
+        position = self.head + start
+        if position < self.size:
+            found = self.buffer.find(value, position, min(end, self.size))
+            if found >= 0:
+                return found - self.head
+            position = self.size
+        if end > self.size:
+            found = self.buffer.find(value, position - self.size, end - self.size)
+            if found >= 0:
+                return found + self.size - self.head
+        return -1
+
+    # Takes the next message ended by delimiter and returns it without the
+    # delimiter, None if there is no complete message yet
+    def next_message(self, delimiter):
+        while True:
+            index = self.find_byte(delimiter[-1], self.scanned)
+            if index < 0:
+                self.scanned = self.length
+                return None
+            end = index + 1
+            if end >= len(delimiter) and self.peek(end, end - len(delimiter)) == delimiter:
+                return self.read(end)[:-len(delimiter)]
+            self.scanned = end
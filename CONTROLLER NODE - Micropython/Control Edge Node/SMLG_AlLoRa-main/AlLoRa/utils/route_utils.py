@@ -0,0 +1,64 @@
+# Routes learned by a mesh node, to forward only the packets it is on the
+# way for instead of every packet with the mesh bit.
+#
+# The header tells whether a packet was forwarded (hop bit) but not by whom,
+# so the way to a MAC is learned from the paths of the debug_hops packets:
+# each node that forwards one adds its (name, RSSI, backoff) to the payload.
+# A Requester that routes sends a debug_hops OK to its mesh Sources every
+# timeout / 2 ms, and after a few requests without an answer
+# (Requester.probe_due). Probes are always flooded, and the Source answers
+# with the path the request took. A node that hears the answer knows whether
+# its name is on that path, that is, whether it carried the request that got
+# through. For timeout ms, the packets between the two MACs are then:
+#
+#   ROUTE   forwarded, after a short backoff: the node is the only one of
+#           its hop that forwards them,
+#   DROP    dropped: the nodes on the path will take them,
+#
+# and the packets to MACs without a path are flooded (FLOOD), as before.
+# Paths use the node names, which must be unique in the mesh.
+
+DROP = 0
+FLOOD = 1
+ROUTE = 2
+
+
+class RouteTable:
+    MAX_ROUTES = 32
+
+    def __init__(self, timeout=120000, max_routes=MAX_ROUTES):
+        self.timeout = timeout      # ms
+        self.max_routes = max_routes
+        self.routes = {}    # MAC -> [on the last path learned to it, when (ms)]
+        self.probes = {}    # (asker MAC, asked MAC) -> last debug_hops request heard (ms)
+        self.status = {"routes": 0, "routed": 0, "flooded": 0, "dropped": 0}
+
+    # A debug_hops packet from source to destination was heard, with the names of the nodes
+    # that forwarded it. If it answers a request heard from destination, the path of that
+    # request is in it: this node is on the way between them if its name is.
+    def learn_path(self, source, destination, names, name, now):
+        asked = self.probes.get((destination, source))
+        if asked is None or now - asked > self.timeout:
+            if len(self.probes) >= self.max_routes:
+                del self.probes[min(self.probes, key=self.probes.get)]
+            self.probes[(source, destination)] = now
+            return
+        del self.probes[(destination, source)]
+        on = name in names
+        for mac in (source, destination):
+            if mac not in self.routes and len(self.routes) >= self.max_routes:
+                del self.routes[min(self.routes, key=lambda mac: self.routes[mac][1])]
+            self.routes[mac] = [on, now]
+        self.status["routes"] = len(self.routes)
+
+    # What to do with a packet to destination: ROUTE, FLOOD or DROP
+    def forward(self, destination, now):
+        route = self.routes.get(destination)
+        if route is None or now - route[1] > self.timeout:
+            self.status["flooded"] += 1
+            return FLOOD
+        if route[0]:
+            self.status["routed"] += 1
+            return ROUTE
+        self.status["dropped"] += 1
+        return DROP
@@ -0,0 +1,72 @@
+# Response timeouts per peer in the style of Jacobson/Karels (RFC 6298).
+#
+# The samples are the time waited for a response minus the time on air of
+# that response, i.e. what the peer and the mesh add to the airtime
+# (processing, hops, sleeps). Responses of any size give comparable samples,
+# and the estimates hold when the RF config changes. The timeout of a request
+# adds back the ToA of the largest response:
+#
+#     SRTT   <- (1 - ALPHA) * SRTT + ALPHA * sample
+#     RTTVAR <- (1 - BETA) * RTTVAR + BETA * |SRTT - sample|
+#     timeout = (toa + SRTT + max(GRANULARITY, K * RTTVAR)) * backoff
+#
+# A lost response doubles the backoff. Karn's rule: the response to the request
+# sent after a loss (a retransmission) gives no sample, as it can't be told
+# from a late response to the lost one, and the backoff stays until a request
+# that was not retransmitted gets its response.
+
+ANY_PEER = "*"      # Key of the requests from any peer (a Source listening)
+
+
+class RTTEstimator:
+    ALPHA = 0.125
+    BETA = 0.25
+    K = 4
+    GRANULARITY = 0.05  # s
+    MAX_BACKOFF = 64
+
+    def __init__(self):
+        # MAC -> {"srtt", "rttvar", "timeout" (s), "backoff", "samples", "retransmission"}
+        self.peers = {}
+
+    def peer(self, mac):
+        state = self.peers.get(mac)
+        if state is None:
+            state = {"srtt": None, "rttvar": None, "timeout": None, "backoff": 1, "samples": 0,
+                     "retransmission": False}
+            self.peers[mac] = state
+        return state
+
+    # Adds a sample (s) unless the request was a retransmission, returns whether it was taken
+    def sample(self, mac, rtt):
+        state = self.peer(mac)
+        if state["retransmission"]:
+            state["retransmission"] = False
+            return False
+        rtt = max(rtt, 0)
+        if state["srtt"] is None:
+            state["srtt"] = rtt
+            state["rttvar"] = rtt / 2
+        else:
+            state["rttvar"] = (1 - self.BETA) * state["rttvar"] + self.BETA * abs(state["srtt"] - rtt)
+            state["srtt"] = (1 - self.ALPHA) * state["srtt"] + self.ALPHA * rtt
+        state["backoff"] = 1
+        state["samples"] += 1
+        return True
+
+    # The response didn't arrive: backs off, and the next request is a retransmission
+    def lost(self, mac):
+        state = self.peer(mac)
+        state["backoff"] = min(state["backoff"] * 2, self.MAX_BACKOFF)
+        state["retransmission"] = True
+
+    # Timeout (s) for a response of up to toa s on air, within [lower, upper]; initial before the first sample
+    def timeout(self, mac, toa, lower, upper, initial):
+        state = self.peer(mac)
+        if state["srtt"] is None:
+            timeout = initial
+        else:
+            timeout = toa + state["srtt"] + max(self.GRANULARITY, self.K * state["rttvar"])
+        timeout = min(max(timeout * state["backoff"], lower), upper)
+        state["timeout"] = timeout
+        return timeout
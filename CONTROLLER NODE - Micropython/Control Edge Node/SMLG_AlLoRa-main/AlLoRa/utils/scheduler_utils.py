@@ -0,0 +1,77 @@
+# Earliest-deadline-first scheduler for the Gateway polling loop.
+# Entries are keyed by MAC and belong to a group (their RF profile). They wait
+# in a heap ordered by due time, and once due they move to the heap of their
+# group, ordered by deadline. Due entries of the group asked for go first, so
+# the radio is only reconfigured when that group has nothing due; otherwise
+# the group with the most urgent entry is picked. Rescheduling a key leaves its
+# old heap items behind, they are dropped when they reach the top (lazy deletion).
+import heapq
+
+
+class Scheduler:
+
+    def __init__(self):
+        self.pending = []   # (due, deadline, key, group), not due yet
+        self.ready = {}     # group -> [(deadline, due, key)], due
+        self.entries = {}   # key -> (due, deadline) of its current schedule
+
+    def __len__(self):
+        return len(self.entries)
+
+    def schedule(self, key, due, deadline=None, group=None):
+        if deadline is None:
+            deadline = due
+        self.entries[key] = (due, deadline)
+        heapq.heappush(self.pending, (due, deadline, key, group))
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+
+    def is_current(self, key, due, deadline):
+        return self.entries.get(key) == (due, deadline)
+
+    # Drops the outdated items on top of a (deadline, due, key) heap, returns its head or None
+    def ready_head(self, group):
+        heap = self.ready[group]
+        while heap and not self.is_current(heap[0][2], heap[0][1], heap[0][0]):
+            heapq.heappop(heap)
+        if heap:
+            return heap[0]
+        del self.ready[group]
+        return None
+
+    # Earliest due time still waiting, None if there is nothing scheduled
+    def next_due(self):
+        due = None
+        for group in list(self.ready):
+            head = self.ready_head(group)
+            if head and (due is None or head[1] < due):
+                due = head[1]
+        if due is not None:
+            return due
+        while self.pending and not self.is_current(self.pending[0][2], self.pending[0][0], self.pending[0][1]):
+            heapq.heappop(self.pending)
+        return self.pending[0][0] if self.pending else None
+
+    # Returns (key, due, deadline) of the due entry with the earliest deadline,
+    # from group if it has any due, None if none is due. allow(group) can rule
+    # groups out (e.g. a channel another radio is using).
+    def pop_due(self, now, group=None, allow=None):
+        while self.pending and self.pending[0][0] <= now:
+            due, deadline, key, entry_group = heapq.heappop(self.pending)
+            if self.is_current(key, due, deadline):
+                heapq.heappush(self.ready.setdefault(entry_group, []), (deadline, due, key))
+        if group not in self.ready or (allow and not allow(group)) or self.ready_head(group) is None:
+            group = None
+            best = None
+            for candidate in list(self.ready):
+                if allow and not allow(candidate):
+                    continue
+                head = self.ready_head(candidate)
+                if head and (best is None or head < best):
+                    group, best = candidate, head
+            if best is None:
+                return None
+        deadline, due, key = heapq.heappop(self.ready[group])
+        del self.entries[key]
+        return key, due, deadline
@@ -0,0 +1,121 @@
+# Binary framing of the serial link between a Serial_connector (gateway) and
+# a Serial_Interface (LoRa adapter). Frame (version FRAMING_VERSION):
+#
+#     COBS(opcode | seq | payload | CRC-16 big endian) | 0x00
+#
+# COBS removes every 0x00 byte from the frame, so 0x00 only marks its end and
+# payloads can hold any byte. The CRC-16 covers opcode, seq and payload. seq
+# is set by the connector on each command and repeated by the interface on
+# every answer to it, so the answers go to the command they belong to and
+# several commands can be in flight: the radio does one command at a time
+# (RADIO_COMMANDS), while GET_RFC, STATUS and HELLO are answered meanwhile.
+# The text protocol (verbs ending in <<END>>\n) is used until both sides
+# agree on binary framing with the text command BIN:<version>|BAUD:<baud>.
+import struct
+
+from AlLoRa.utils.crc_utils import crc16
+
+FRAMING_VERSION = 1
+DELIMITER = b"\x00"
+FRAMING_TIMEOUT = 3     # s without a valid frame after the switch before the interface goes back to text
+
+# Commands (connector -> interface)
+HELLO = 0x01        # Checks the link after switching to binary framing, answered with OK
+SEND_WAIT = 0x02    # Packet; answered with ACK, then PACKET, NO_DATA or ERROR
+SEND = 0x03         # Packet; answered with OK
+LISTEN = 0x04       # Focus time (ms, >I); answered with OK, then PACKET or NO_DATA
+SET_RFC = 0x05      # RF config (RF_CONFIG_FORMAT); answered with OK or ERROR
+GET_RFC = 0x06      # Answered with RF_CONFIG
+STATUS = 0x07       # Answered with STATUS_INFO
+
+# Answers (interface -> connector)
+ACK = 0x10          # Adaptive timeout of the interface (ms, >I), 0 if the packet did not load
+PACKET = 0x11       # Packet content received by the interface
+OK = 0x12
+ERROR = 0x13        # Text, ERROR_TYPE:<type>|MESSAGE:<message>|FOCUS_TIME:<focus time>
+RF_CONFIG = 0x14    # RF config (RF_CONFIG_FORMAT)
+NO_DATA = 0x15      # Nothing received in time
+STATUS_INFO = 0x16  # Status of the interface (STATUS_FORMAT)
+
+# Commands that use the radio. The interface runs one at a time and answers
+# ERROR (BUSY) to another one meanwhile.
+RADIO_COMMANDS = (SEND_WAIT, SEND, LISTEN, SET_RFC)
+
+# Verbs of the text protocol for the same commands
+TEXT_VERBS = {SEND_WAIT: b"S&W:", SEND: b"Send:", LISTEN: b"Listen:", SET_RFC: b"C_RFC:", GET_RFC: b"GET_RFC:",
+              STATUS: b"STATUS:"}
+
+# frequency, sf, bw, cr, tx_power; 0 leaves a parameter as it is. Frequency and
+# bandwidth can have decimals (e.g. 868.1 MHz, 62.5 kHz).
+RF_CONFIG_FORMAT = ">dBfBb"
+
+# Radio busy (1/0), RSSI and SNR of the last packet received, adaptive timeout (s)
+STATUS_FORMAT = ">Bfff"
+
+
+def cobs_encode(data):
+    out = bytearray(len(data) + len(data) // 254 + 2)
+    code_index = 0
+    out_index = 1
+    code = 1
+    for byte in data:
+        if byte:
+            out[out_index] = byte
+            out_index += 1
+            code += 1
+        if not byte or code == 0xFF:
+            out[code_index] = code
+            code_index = out_index
+            out_index += 1
+            code = 1
+    out[code_index] = code
+    return bytes(out[:out_index])
+
+
+# Returns None if data is not valid COBS
+def cobs_decode(data):
+    out = bytearray()
+    index = 0
+    length = len(data)
+    while index < length:
+        code = data[index]
+        end = index + code
+        if code == 0 or end > length:
+            return None
+        out += data[index + 1:end]
+        index = end
+        if code < 0xFF and index < length:
+            out.append(0)
+    return bytes(out)
+
+
+def encode_frame(opcode, seq, payload=b""):
+    body = bytes((opcode, seq & 0xFF)) + payload
+    return cobs_encode(body + struct.pack(">H", crc16(body))) + DELIMITER
+
+
+# Frame without its delimiter -> (opcode, seq, payload), None if it is corrupted
+def decode_frame(data):
+    body = cobs_decode(data)
+    if body is None or len(body) < 4:
+        return None
+    if crc16(body[:-2]) != struct.unpack(">H", body[-2:])[0]:
+        return None
+    return body[0], body[1], body[2:-2]
+
+
+def pack_rf_config(frequency, sf, bw, cr, tx_power):
+    return struct.pack(RF_CONFIG_FORMAT, frequency or 0, sf or 0, bw or 0, cr or 0, tx_power or 0)
+
+
+def unpack_rf_config(payload):
+    return [int(value) if value == int(value) else value for value in struct.unpack(RF_CONFIG_FORMAT, payload)]
+
+
+def pack_status(busy, rssi, snr, adaptive_timeout):
+    return struct.pack(STATUS_FORMAT, 1 if busy else 0, rssi or 0, snr or 0, adaptive_timeout or 0)
+
+
+def unpack_status(payload):
+    busy, rssi, snr, adaptive_timeout = struct.unpack(STATUS_FORMAT, payload)
+    return {"busy": bool(busy), "rssi": rssi, "snr": snr, "adaptive_timeout": adaptive_timeout}
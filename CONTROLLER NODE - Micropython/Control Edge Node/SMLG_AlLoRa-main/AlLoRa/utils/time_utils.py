@@ -1,22 +1,58 @@
 try:
     # For regular Python
     import time
+    import threading
     from time import strftime
 
+    class RealClock:
+        def time_ms(self):
+            return int(time.time() * 1000)  # Time in milliseconds
+
+        def sleep(self, seconds):
+            time.sleep(seconds)
+
+        def new_condition(self):
+            return threading.Condition()
+
+        # Called with the condition held, as Condition.wait_for
+        def wait_for(self, condition, predicate, timeout):
+            return condition.wait_for(predicate, timeout)
+
+        def start_thread(self, target, daemon=True):
+            thread = threading.Thread(target=target)
+            thread.daemon = daemon
+            thread.start()
+            return thread
+
+    # Every time related call of AlLoRa goes through this clock, it can be
+    # replaced by a VirtualClock (AlLoRa.utils.virtual_clock) in simulations.
+    _clock = RealClock()
+
+    def set_clock(clock):
+        global _clock
+        _clock = clock
+
+    def get_clock():
+        return _clock
+
     def get_current_timestamp():
-        return time.strftime("[%Y-%m-%d %H:%M:%S]")
+        return time.strftime("[%Y-%m-%d %H:%M:%S]", time.localtime(_clock.time_ms() / 1000))
 
     def get_time():
         return get_current_timestamp()
 
     def current_time_ms():
-        return int(time.time() * 1000)  # Time in milliseconds
+        return _clock.time_ms()
 
     def sleep(seconds):
-        time.sleep(seconds)
+        _clock.sleep(seconds)
 
     def sleep_ms(milliseconds):
-        time.sleep(milliseconds / 1000.0)
+        _clock.sleep(milliseconds / 1000.0)
+
+    # Threads of the nodes, started through the clock so a VirtualClock drives them too
+    def start_thread(target):
+        return _clock.start_thread(target)
 
     def save_time():
         pass
@@ -25,6 +61,7 @@ except ImportError:
     # For MicroPython
     import utime as time
     import machine
+    import _thread
     from ujson import loads, dumps
 
     def update_time():
@@ -71,6 +108,9 @@ except ImportError:
     def sleep_ms(milliseconds):
         time.sleep_ms(milliseconds)
 
+    def start_thread(target):
+        return _thread.start_new_thread(target, ())
+
     def save_time():
         try:
             rtc = machine.RTC()
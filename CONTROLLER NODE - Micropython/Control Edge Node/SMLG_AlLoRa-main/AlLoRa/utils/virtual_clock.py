@@ -0,0 +1,82 @@
+# Discrete-event clock for simulations on CPython (see time_utils.set_clock).
+#
+# Time only moves when every thread driven by the clock is blocked in
+# sleep() or wait_for(): it then jumps to the earliest deadline. Hours of
+# polling over a Simulated_connector run in the time the CPU needs, and the
+# times do not depend on the load of the machine. Threads join the clock the first time
+# they sleep or wait on it; start them with start_thread() so time does not
+# move before they do.
+import math
+import threading
+import time
+
+
+class VirtualClock:
+    POLL = 0.05     # Real seconds between checks for threads that ended
+
+    def __init__(self, start_ms=None):
+        self.now = int(start_ms if start_ms is not None else time.time() * 1000)
+        self.condition = threading.Condition()
+        self.threads = set()    # Threads driven by this clock
+        self.waiting = {}       # Thread -> (deadline in ms, predicate) of the threads blocked on the clock
+        self.starting = 0       # Threads started with start_thread that did not join yet
+
+    def time_ms(self):
+        return self.now
+
+    def new_condition(self):
+        return self.condition   # One lock, so time cannot move while a thread is between checks
+
+    def sleep(self, seconds):
+        with self.condition:
+            self.wait(lambda: False, seconds)
+
+    def wait_for(self, condition, predicate, timeout):
+        return self.wait(predicate, timeout)
+
+    def wait(self, predicate, timeout):
+        me = threading.current_thread()
+        self.threads.add(me)
+        # Whole milliseconds, so a thread never wakes before what it waited for ends
+        deadline = self.now + math.ceil(timeout * 1000) if timeout is not None else float('inf')
+        result = predicate()
+        while not result and self.now < deadline:
+            self.waiting[me] = (deadline, predicate)
+            if not self.advance():
+                self.condition.wait(self.POLL)
+            result = predicate()
+        self.waiting.pop(me, None)
+        return result
+
+    def advance(self):
+        if self.starting:
+            return False
+        self.threads = set(thread for thread in self.threads if thread.is_alive())
+        next_deadline = float('inf')
+        for thread in self.threads:
+            if thread not in self.waiting:
+                return False    # Still running
+            deadline, predicate = self.waiting[thread]
+            if predicate():
+                return False    # Woken, about to run
+            next_deadline = min(next_deadline, deadline)
+        if next_deadline <= self.now or next_deadline == float('inf'):
+            return False
+        self.now = next_deadline
+        self.condition.notify_all()
+        return True
+
+    def start_thread(self, target, daemon=True):
+        with self.condition:
+            self.starting += 1
+
+        def run():
+            with self.condition:
+                self.threads.add(threading.current_thread())
+                self.starting -= 1
+            target()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = daemon
+        thread.start()
+        return thread
@@ -0,0 +1,44 @@
+# Per-packet CPU time of each Packet checksum strategy at 235-byte chunks:
+# the checksum alone, and a full encode (close_packet) + decode (load).
+#
+# CPython (from the repository root):
+#     PYTHONPATH=. python3 benchmarks/checksum.py
+# MicroPython: copy the AlLoRa folder and this script to the board and run it.
+from AlLoRa.Packet import Packet
+from AlLoRa.utils.time_utils import current_time_ms as time
+
+ITERATIONS = 2000
+CHUNK = bytes(range(235))
+
+
+def us_per_call(function, iterations=ITERATIONS, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time()
+        for _ in range(iterations):
+            function()
+        elapsed = (time() - t0) * 1000 / iterations
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run():
+    print("{:<10} {:>14} {:>20}".format("checksum", "checksum us", "encode+decode us"))
+    for checksum in Packet.CHECKSUMS:
+        Packet.set_checksum(checksum)
+        packet = Packet(False, True)
+        packet.set_source("9a76ba3f")
+        packet.set_destination("93a5bb9c")
+        packet.set_data(CHUNK)
+        packet.close_packet()
+
+        def round_trip():
+            packet.close_packet()
+            Packet(False, True).load(packet.content)
+
+        print("{:<10} {:>14.1f} {:>20.1f}".format(checksum, us_per_call(lambda: packet.get_checksum(CHUNK)), us_per_call(round_trip)))
+    Packet.set_checksum(Packet.SHA256)
+
+
+run()
@@ -0,0 +1,83 @@
+# Loss-rate simulation of a file transfer with plain ARQ (fec_repair_chunks = 0)
+# and with Reed-Solomon repair chunks, in stop-and-wait (window 1) and
+# windowed mode.
+#
+# Every request and every chunk is lost with probability loss. A lost
+# request costs a timeout; otherwise the round costs the request plus the
+# airtime of the chunks of the window, and the lost chunks are asked again
+# in a later round (ARQ) or replaced by any repair chunk (FEC, streamed in
+# the round of the last data chunks, whatever the window). The real
+# CTP_File objects are used on both sides, so the file rebuilt by the
+# Requester is checked against the original.
+#
+# CPython (from the repository root):
+#     PYTHONPATH=. python3 benchmarks/fec_vs_arq.py
+# MicroPython: copy the AlLoRa folder and this script to the board and run it.
+import random
+try:
+    from tempfile import mkdtemp
+except ImportError:     # MicroPython, written to the board filesystem
+    mkdtemp = lambda: "benchmark_results"
+
+from AlLoRa.File import CTP_File
+
+FILE_SIZE = 5000
+CHUNK_SIZE = 235
+REQUEST_TIMES = (0.5, 6.0)  # Seconds of a request and the turnaround: direct link, and relayed through a mesh
+CHUNK_AIRTIME = 1.4     # Seconds of airtime of a 235-byte chunk, SF10 125 kHz
+RUNS = 200
+WINDOWS = (1, 8)
+LOSSES = (0.0, 0.05, 0.1, 0.2, 0.3)
+REPAIRS = (0, 2, 4, 8)
+
+
+def transfer(path, content, request_time, window, repair_chunks, loss):
+    timeout = request_time + 2 * CHUNK_AIRTIME     # Seconds lost per unanswered request
+    source = CTP_File("bench.bin", content, CHUNK_SIZE)
+    if repair_chunks:
+        source.enable_fec(repair_chunks)
+    options = source.get_metadata_options() or {}
+    requester = CTP_File("bench.bin", length=source.get_length(), path=path,
+                         fec_repair_chunks=options.get("FEC", 0), last_chunk_size=options.get("LAST"))
+    seconds = 0
+    while not requester.is_complete():
+        chunks = requester.get_next_chunks(window)
+        if not chunks:     # Nothing left to ask and still incomplete, it would never end
+            raise Exception("No chunks to ask for an incomplete file")
+        if random.random() < loss:
+            seconds += timeout
+            continue
+        seconds += request_time
+        for order in chunks:
+            seconds += CHUNK_AIRTIME
+            if random.random() >= loss:
+                requester.add_chunk(order, source.get_chunk(order))
+        if random.random() < loss:      # The last chunk of the window got lost, wait for it
+            seconds += CHUNK_AIRTIME
+    requester.finalize(path)
+    with open(path + "/bench.bin", "rb") as f:
+        if f.read() != content:
+            raise Exception("Rebuilt file differs")
+    return seconds
+
+
+def run():
+    random.seed(1)
+    path = mkdtemp()
+    content = bytes(random.getrandbits(8) for _ in range(FILE_SIZE))
+    print("Mean transfer time (s) of {} bytes in {}-byte chunks".format(FILE_SIZE, CHUNK_SIZE))
+    for request_time in REQUEST_TIMES:
+        for window in WINDOWS:
+            print("request {}s, window {}".format(request_time, window))
+            print("{:>6}".format("loss") + "".join("{:>10}".format("K={}".format(k)) for k in REPAIRS))
+            for loss in LOSSES:
+                row = "{:>6.2f}".format(loss)
+                for repair_chunks in REPAIRS:
+                    total = 0
+                    for _ in range(RUNS):
+                        total += transfer(path, content, request_time, window, repair_chunks, loss)
+                    row += "{:>10.1f}".format(total / RUNS)
+                print(row)
+
+
+run()
@@ -0,0 +1,130 @@
+# Mesh transfers with flooding ("routing": false) and with the paths learned
+# from route probes ("routing": true), over the simulated LoRa channel
+# (Simulated_connector) on a VirtualClock. CPython only.
+#
+# A Requester gets a file from a Source several hops away, every other node
+# only forwards. Two topologies:
+#   chain   G - A - B - C - S, each node only hears its neighbours (4 hops)
+#   grid20  20 nodes on a 4 x 5 grid, G and S at opposite corners (4+ hops)
+# For each one: whether the file arrived intact, the transfer time, the
+# packets sent on the air (requests, responses and forwards), the forwards,
+# and the forwards dropped because their node was not on the path.
+#
+#     PYTHONPATH=. python3 benchmarks/mesh_routing.py
+import json
+import math
+import random
+import tempfile
+
+from AlLoRa.Connectors.Simulated_connector import Air, Simulated_connector
+from AlLoRa.Nodes.Source import Source
+from AlLoRa.Nodes.Requester import Requester
+from AlLoRa.Digital_Endpoint import Digital_Endpoint
+from AlLoRa.File import CTP_File
+from AlLoRa.utils.time_utils import current_time_ms as time, set_clock
+from AlLoRa.utils.virtual_clock import VirtualClock
+
+FILE_SIZE = 1000
+SF = 7
+LOSS = 0.02         # Of every link in range
+RANGE = 1.5         # Grid spacings a node is heard at
+LISTENING_TIME = 900
+RUNS = 5            # Seeds per topology and mode
+
+
+def chain():
+    return {"G": (0, 0), "A": (1, 0), "B": (2, 0), "C": (3, 0), "S": (4, 0)}
+
+
+def grid20():
+    positions = {}
+    for i in range(20):
+        positions["N{}".format(i)] = (i % 5, i // 5)
+    positions["G"] = positions.pop("N0")
+    positions["S"] = positions.pop("N19")
+    return positions
+
+
+def mac_of(name):
+    return "{:08x}".format(0x10000000 + sum(ord(c) << (8 * i) for i, c in enumerate(name)))
+
+
+def write_config(directory, name, routing):
+    config = {"name": name, "chunk_size": 200, "window_size": 4, "mesh_mode": True, "short_mac": True,
+              "routing": routing, "result_path": directory + "/Results",
+              "connector": {"freq": 868, "sf": SF}}
+    path = "{}/{}.json".format(directory, name)
+    with open(path, "w") as f:
+        f.write(json.dumps(config))
+    return path
+
+
+def transfer(positions, routing, seed):
+    directory = tempfile.mkdtemp()
+    clock = VirtualClock()
+    set_clock(clock)
+    air = Air(seed=seed)
+    names = list(positions)
+    for a in names:
+        for b in names:
+            if a < b:
+                distance = math.sqrt((positions[a][0] - positions[b][0]) ** 2 + (positions[a][1] - positions[b][1]) ** 2)
+                if distance > RANGE:
+                    air.set_link(mac_of(a), mac_of(b), loss=1.0)
+                else:
+                    air.set_link(mac_of(a), mac_of(b), loss=LOSS, rssi=int(-60 - 60 * distance / RANGE))
+
+    random.seed(seed)
+    content = bytes(random.getrandbits(8) for _ in range(FILE_SIZE))
+    source = Source(Simulated_connector(air, mac_of("S")), write_config(directory, "S", routing))
+    relays = [Source(Simulated_connector(air, mac_of(name)), write_config(directory, name, routing))
+              for name in names if name not in ("G", "S")]
+    requester = Requester(Simulated_connector(air, mac_of("G")), write_config(directory, "G", routing))
+    stop = []
+
+    def serve():
+        source.establish_connection()
+        source.set_file(CTP_File("mesh.bin", content, source.get_chunk_size()))
+        source.send_file(timeout=LISTENING_TIME * 1000)
+        while not stop:     # Keeps forwarding for the others
+            source.establish_connection(try_for=1)
+
+    def relay(node):
+        while not stop:
+            node.establish_connection(try_for=1)
+
+    clock.start_thread(serve)
+    for node in relays:
+        clock.start_thread(lambda node=node: relay(node))
+
+    endpoint = Digital_Endpoint({"name": "S", "mac_address": mac_of("S"), "sf": SF})
+    endpoint.enable_mesh()
+    t0 = time()
+    requester.listen_to_endpoint(endpoint, LISTENING_TIME, save_file=True, one_file=True)
+    seconds = (time() - t0) / 1000
+    stop.append(True)
+    clock.sleep(30)     # Lets the node threads see stop before the next run
+    try:
+        with open(directory + "/Results/" + mac_of("S") + "/mesh.bin", "rb") as f:
+            delivered = f.read() == content
+    except OSError:
+        delivered = False
+    forwarded = sum(node.forwarding.status["forwarded"] for node in relays + [source])
+    dropped = sum(node.routes.status["dropped"] for node in relays + [source])
+    return delivered, seconds, air.stats["sent"], forwarded, dropped
+
+
+def run():
+    print("{} bytes over a mesh, mean of {} runs".format(FILE_SIZE, RUNS))
+    print("{:>7} {:>8} {:>10} {:>8} {:>8} {:>10} {:>8}".format(
+        "mesh", "routing", "delivered", "time s", "packets", "forwarded", "dropped"))
+    for topology in (chain, grid20):
+        for routing in (False, True):
+            results = [transfer(topology(), routing, seed) for seed in range(1, RUNS + 1)]
+            mean = lambda i: sum(result[i] for result in results) / RUNS
+            print("{:>7} {:>8} {:>7}/{:<2} {:>8.1f} {:>8.0f} {:>10.0f} {:>8.0f}".format(
+                topology.__name__, "on" if routing else "off", sum(1 for result in results if result[0]), RUNS,
+                mean(1), mean(2), mean(3), mean(4)))
+
+
+run()
@@ -0,0 +1,143 @@
+# Microbenchmark of the Packet codec: encode (close_packet) and decode (load)
+# operations per second, compared with the previous implementation, which
+# rebuilt the flags bit by bit, hexlified the whole SHA-256 digest and copied
+# the received buffer into header and payload slices.
+#
+# With the default SHA-256 checksum, hashing is most of the encode time, so
+# encoding is on par with the previous codec (within the run to run noise on
+# CPython) and decoding gains from not copying the payload.
+#
+# CPython (from the repository root):
+#     PYTHONPATH=. python3 benchmarks/packet_codec.py
+# MicroPython: copy the AlLoRa folder and this script to the board and run it.
+import struct
+import hashlib
+import binascii
+
+from AlLoRa.Packet import Packet
+from AlLoRa.utils.time_utils import current_time_ms as time
+
+ITERATIONS = 20000
+RUNS = 7            # Reported: the median of the runs
+CHUNK = bytes(range(235))
+
+
+class LegacyPacket:
+    # Encode/decode path of Packet before the precompiled codec
+    COMMAND = {"DATA": "00", "OK": "01", "CHUNK": "10", "METADATA": "11"}
+    COMMAND_BITS = {"00": "DATA", "01": "OK", "10": "CHUNK", "11": "METADATA"}
+
+    def __init__(self, mesh_mode, short_mac):
+        self.mesh_mode = mesh_mode
+        if mesh_mode:
+            self.HEADER_FORMAT = Packet.HEADER_FORMAT_MESH_SM if short_mac else Packet.HEADER_FORMAT_MESH_LM
+            self.HEADER_SIZE = Packet.HEADER_SIZE_MESH_SM if short_mac else Packet.HEADER_SIZE_MESH_LM
+        else:
+            self.HEADER_FORMAT = Packet.HEADER_FORMAT_P2P_SM if short_mac else Packet.HEADER_FORMAT_P2P_LM
+            self.HEADER_SIZE = Packet.HEADER_SIZE_P2P_SM if short_mac else Packet.HEADER_SIZE_P2P_LM
+        self.source = b"\x9a\x76\xba\x3f" if short_mac else b"9a76ba3f"
+        self.destination = b"\x93\xa5\xbb\x9c" if short_mac else b"93a5bb9c"
+        self.command = "DATA"
+        self.mesh = mesh_mode
+        self.sleep = True
+        self.hop = False
+        self.debug_hops = False
+        self.change_rf = False
+        self.id = 555
+        self.payload = b""
+
+    def get_checksum(self, data):
+        return binascii.hexlify(hashlib.sha256(data).digest())[-3:]
+
+    def close_packet(self):
+        command_bits = self.COMMAND[self.command]
+        flags = 0
+        if command_bits[0] == "1":
+            flags = flags | (1 << 0)
+        if command_bits[1] == "1":
+            flags = flags | (1 << 1)
+        if self.mesh:
+            flags = flags | (1 << 3)
+        if self.sleep:
+            flags = flags | (1 << 4)
+        if self.hop:
+            flags = flags | (1 << 5)
+        if self.debug_hops:
+            flags = flags | (1 << 6)
+        if self.change_rf:
+            flags = flags | (1 << 7)
+        self.flags = flags
+        self.checksum = self.get_checksum(self.payload)
+        if isinstance(self.source, str):
+            self.source = self.source.encode('utf-8')
+        if isinstance(self.destination, str):
+            self.destination = self.destination.encode('utf-8')
+        if self.mesh_mode:
+            h = struct.pack(self.HEADER_FORMAT, self.source, self.destination, self.flags, self.id.to_bytes(2, 'little'), self.checksum)
+        else:
+            h = struct.pack(self.HEADER_FORMAT, self.source, self.destination, self.flags, self.checksum)
+        self.content = h + self.payload
+
+    def load(self, packet):
+        header = packet[:self.HEADER_SIZE]
+        content = packet[self.HEADER_SIZE:]
+        if self.mesh_mode:
+            self.source, self.destination, flags, id, self.checksum = struct.unpack(self.HEADER_FORMAT, header)
+            self.id = int.from_bytes(id, "little")
+        else:
+            self.source, self.destination, flags, self.checksum = struct.unpack(self.HEADER_FORMAT, header)
+        c0 = "1" if (flags >> 0) & 1 == 1 else "0"
+        c1 = "1" if (flags >> 1) & 1 == 1 else "0"
+        self.command = self.COMMAND_BITS[c0 + c1]
+        self.mesh = (flags >> 3) & 1 == 1
+        self.sleep = (flags >> 4) & 1 == 1
+        self.hop = (flags >> 5) & 1 == 1
+        self.debug_hops = (flags >> 6) & 1 == 1
+        self.change_rf = (flags >> 7) & 1 == 1
+        self.payload = content
+        self.check = self.checksum == self.get_checksum(self.payload)
+        return self.check
+
+
+def new_packet(mesh_mode, short_mac):
+    p = Packet(mesh_mode, short_mac)
+    p.set_source("9a76ba3f")
+    p.set_destination("93a5bb9c")
+    if mesh_mode:
+        p.enable_mesh()
+        p.set_id(555)
+    return p
+
+
+def ops_per_second(function, iterations=ITERATIONS, runs=RUNS):
+    rates = []
+    for _ in range(runs):
+        t0 = time()
+        for _ in range(iterations):
+            function()
+        elapsed = max(time() - t0, 1) / 1000
+        rates.append(iterations / elapsed)
+    rates.sort()
+    return rates[runs // 2]
+
+
+def run():
+    print("{:<10} {:>14} {:>14} {:>14} {:>14}".format("layout", "legacy enc/s", "codec enc/s", "legacy dec/s", "codec dec/s"))
+    for mesh_mode in (False, True):
+        for short_mac in (True, False):
+            legacy = LegacyPacket(mesh_mode, short_mac)
+            legacy.payload = CHUNK
+            packet = new_packet(mesh_mode, short_mac)
+            packet.set_data(CHUNK)
+            raw = packet.get_content()
+
+            legacy_encode = ops_per_second(legacy.close_packet)
+            codec_encode = ops_per_second(packet.close_packet)
+            legacy_decode = ops_per_second(lambda: LegacyPacket(mesh_mode, short_mac).load(raw))
+            codec_decode = ops_per_second(lambda: Packet(mesh_mode, short_mac).load(raw))
+
+            layout = "{}/{}".format("MESH" if mesh_mode else "P2P", "SM" if short_mac else "LM")
+            print("{:<10} {:>14.0f} {:>14.0f} {:>14.0f} {:>14.0f}".format(layout, legacy_encode, codec_encode, legacy_decode, codec_decode))
+
+
+run()
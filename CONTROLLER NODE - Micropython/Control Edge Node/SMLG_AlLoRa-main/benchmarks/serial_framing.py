@@ -0,0 +1,62 @@
+# Cost of the two framings of the gateway <-> adapter serial link for one
+# S&W exchange (command, ACK and the packet received) at several packet sizes:
+# bytes on the link, time on the link at 9600 and 921600 baud (10 bits per
+# byte), and CPU time to encode + decode the frames.
+#
+# CPython (from the repository root):
+#     PYTHONPATH=. python3 benchmarks/serial_framing.py
+# MicroPython: copy the AlLoRa folder and this script to the board and run it.
+import struct
+
+from AlLoRa.utils.serial_frame_utils import encode_frame, decode_frame, SEND_WAIT, ACK, PACKET
+from AlLoRa.utils.time_utils import current_time_ms as time
+
+ITERATIONS = 500
+SIZES = (20, 120, 235)
+END_PHRASE = b"<<END>>\n"
+
+
+def text_exchange(packet):
+    return [b"S&W:" + packet + END_PHRASE, b"ACK:1.684544" + END_PHRASE, packet + END_PHRASE]
+
+
+def binary_exchange(packet):
+    return [encode_frame(SEND_WAIT, 1, packet), encode_frame(ACK, 1, struct.pack(">I", 1684)),
+            encode_frame(PACKET, 1, packet)]
+
+
+def text_round_trip(packet):
+    for message in text_exchange(packet):
+        message.endswith(END_PHRASE)
+
+
+def binary_round_trip(packet):
+    for message in binary_exchange(packet):
+        decode_frame(message[:-1])
+
+
+def us_per_call(function, iterations=ITERATIONS, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time()
+        for _ in range(iterations):
+            function()
+        elapsed = (time() - t0) * 1000 / iterations
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run():
+    print("{:>6} {:>8} {:>8} {:>12} {:>14} {:>10}".format("packet", "framing", "bytes", "ms at 9600", "ms at 921600", "CPU us"))
+    for size in SIZES:
+        packet = bytes(range(size))
+        for name, exchange, round_trip in (("text", text_exchange, text_round_trip),
+                                           ("binary", binary_exchange, binary_round_trip)):
+            length = sum(len(message) for message in exchange(packet))
+            print("{:>6} {:>8} {:>8} {:>12.1f} {:>14.2f} {:>10.1f}".format(
+                size, name, length, length * 10000 / 9600, length * 10000 / 921600,
+                us_per_call(lambda: round_trip(packet))))
+
+
+run()
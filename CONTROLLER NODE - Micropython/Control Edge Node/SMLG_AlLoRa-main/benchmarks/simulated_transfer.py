@@ -0,0 +1,79 @@
+# Transfer time and goodput of a file between a Source and a Requester running
+# in this process over the simulated LoRa channel (Simulated_connector), at
+# several spreading factors, loss rates and window sizes. CPython only.
+# With VIRTUAL_CLOCK the run takes seconds and the times are simulated ones;
+# without it the transfers run in real time.
+#
+#     PYTHONPATH=. python3 benchmarks/simulated_transfer.py
+import json
+import random
+import tempfile
+import threading
+
+from AlLoRa.Connectors.Simulated_connector import Air, Simulated_connector
+from AlLoRa.Nodes.Source import Source
+from AlLoRa.Nodes.Requester import Requester
+from AlLoRa.Digital_Endpoint import Digital_Endpoint
+from AlLoRa.File import CTP_File
+from AlLoRa.utils.time_utils import current_time_ms as time, set_clock, RealClock
+from AlLoRa.utils.virtual_clock import VirtualClock
+
+FILE_SIZE = 10000
+SFS = (7, 9)
+LOSSES = (0.0, 0.1)
+WINDOWS = (1, 8)
+SOURCE_MAC = "5a5a5a5a"
+REQUESTER_MAC = "e0e0e0e0"
+VIRTUAL_CLOCK = True
+
+
+def write_config(directory, name, sf, window_size):
+    config = {"name": name, "chunk_size": 235, "mesh_mode": False, "short_mac": True,
+              "window_size": window_size, "result_path": directory + "/Results",
+              "connector": {"freq": 868, "sf": sf, "min_timeout": 0.5, "max_timeout": 6}}
+    path = "{}/{}.json".format(directory, name)
+    with open(path, "w") as f:
+        f.write(json.dumps(config))
+    return path
+
+
+def transfer(sf, loss, window_size):
+    directory = tempfile.mkdtemp()     # Nothing learnt about the link is kept between transfers
+    clock = VirtualClock() if VIRTUAL_CLOCK else RealClock()
+    set_clock(clock)
+    air = Air(seed=1, loss=loss)
+    source = Source(Simulated_connector(air, SOURCE_MAC), write_config(directory, "S", sf, window_size))
+    requester = Requester(Simulated_connector(air, REQUESTER_MAC), write_config(directory, "R", sf, window_size))
+    content = bytes(random.getrandbits(8) for _ in range(FILE_SIZE))
+    source.set_file(CTP_File("sim.bin", content, source.get_chunk_size()))
+    serve = lambda: (source.establish_connection(), source.send_file(timeout=600000))
+    if VIRTUAL_CLOCK:
+        clock.start_thread(serve)
+    else:
+        thread = threading.Thread(target=serve)
+        thread.daemon = True
+        thread.start()
+
+    endpoint = Digital_Endpoint({"name": "S", "mac_address": SOURCE_MAC, "sf": sf})
+    t0 = time()
+    requester.listen_to_endpoint(endpoint, 600, save_file=True, one_file=True)
+    seconds = (time() - t0) / 1000
+    with open(directory + "/Results/" + SOURCE_MAC + "/sim.bin", "rb") as f:
+        if f.read() != content:
+            raise Exception("Received file differs")
+    return seconds, air.stats
+
+
+def run():
+    random.seed(1)
+    print("{} bytes, Source <-> Requester over the simulated channel".format(FILE_SIZE))
+    print("{:>4} {:>6} {:>7} {:>10} {:>10} {:>10} {:>8}".format("SF", "loss", "window", "time s", "goodput", "airtime s", "packets"))
+    for sf in SFS:
+        for loss in LOSSES:
+            for window_size in WINDOWS:
+                seconds, stats = transfer(sf, loss, window_size)
+                print("{:>4} {:>6.2f} {:>7} {:>10.1f} {:>8.0f}B/s {:>10.1f} {:>8}".format(
+                    sf, loss, window_size, seconds, FILE_SIZE / seconds, stats["airtime"], stats["sent"]))
+
+
+run()
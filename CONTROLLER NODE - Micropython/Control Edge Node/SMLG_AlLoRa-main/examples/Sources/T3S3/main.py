@@ -26,11 +26,12 @@ try:
     backup = lora_node.establish_connection()
     print("Connection OK")
 
-    # This is how to handle a backup file if needed (not implemented in this example...)
+    # The Requester was in the middle of a file: serve it again if it was kept ("file_backup" in LoRa.json)
     if backup:
         print("Asking backup")
-        #file = Datasource.get_backup()
-        #lora_node.restore_file(file)
+        file = lora_node.get_backup()
+        if file:
+            lora_node.restore_file(file)
 
     # with an established connection, we start sending data periodically
     while True:
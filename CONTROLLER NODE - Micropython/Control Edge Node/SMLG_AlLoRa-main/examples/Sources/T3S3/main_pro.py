@@ -14,15 +14,20 @@ from AlLoRa.File import CTP_File
 
 gc.enable()
 
-# Function to access SD data and send it through AlLoRa
-def get_oldest_SD_file(sd, chunk_size):
+# Files of the SD waiting to be sent
+def get_SD_files(sd):
     files = sd.get_files()
     if not files:
-        return None
+        return []
     ## Remove files inside the temp folder
     files = [file for file in files if not file.startswith("temp")]
     ## Remove from list all files that start with a "."
     files = [file for file in files if not file.startswith(".")]
+    return files
+
+# Function to access SD data and send it through AlLoRa
+def get_oldest_SD_file(sd, chunk_size):
+    files = get_SD_files(sd)
     if not files:
         return None
     ## Sort files by name
@@ -34,7 +39,7 @@ def get_oldest_SD_file(sd, chunk_size):
         file = sd.get_file(oldest_file_name)
         filename = file.filename.split("/")[-1]
         print("Getting file: ", filename, " from SD", file)
-        ctp_file = CTP_File(name=filename, content=file, chunk_size=chunk_size)
+        ctp_file = CTP_File(name=filename, file_path=file.filename, chunk_size=chunk_size)
         return ctp_file
     except Exception as e:
         print("Error getting file: ", e)
@@ -94,6 +99,8 @@ def run():
     sending_timeout = 2 * 60 * 1000 # 2 minutes in milliseconds
     t0 = utime.ticks_ms()
     try:
+        # Announced in the OK replies, so the Gateway doesn't wait when the SD is empty
+        lora_node.set_pending(len(get_SD_files(sd_manager)))
         lora_node.establish_connection()
         print("Connection OK")
         while sd_manager.get_files():
@@ -102,6 +109,7 @@ def run():
                 if file is not None:
                     print("Sending LoRa file: ", file.get_name())
                     lora_node.set_file(file)
+                    lora_node.set_pending(len(get_SD_files(sd_manager)) - 1)    # The ones after it
                     t_0_send = utime.ticks_ms()
                     sucess = lora_node.send_file(timeout=sending_timeout)
                     if sucess: